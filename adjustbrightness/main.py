@@ -3,26 +3,63 @@ A CLI to take in a file/files and adjust the brightness conditionally.
 """
 
 import argparse
+import shutil
+from errno import EXDEV
+from glob import escape as glob_escape
 from sys import path
 from sys import exit as sysexit
-from os import makedirs, remove
-from os.path import splitext, join, basename, abspath, dirname
-from PIL import Image, ImageEnhance
+from os import makedirs, remove, rename
+from os.path import (
+    splitext,
+    join,
+    basename,
+    abspath,
+    dirname,
+    exists,
+    getsize,
+    samefile,
+)
+from typing import TYPE_CHECKING
 from colorama import Fore
 
+if TYPE_CHECKING:
+    from PIL import Image
+
 path.append(abspath(join(dirname(__file__), "..")))
 
 # pylint: disable=wrong-import-position
 
-from shared.brightness import getbrightness
+from shared.brightness import getbrightness, brightness_lut
 
-from shared import folders
+from shared import folders, memory, metrics
+from shared.metrics import METRICS
 
 # pylint: enable=wrong-import-position
 
 
-def adjustbrightness(img: Image.Image, mod: float) -> Image.Image:
-    """Adjusts the brightness of the given image by the modifier."""
+def adjustbrightness(
+    img: "Image.Image", mod: float, strip_rows: int = None
+) -> "Image.Image":
+    """
+    Adjusts the brightness of the given image by the modifier.
+
+    Uses a lookup table where possible, which is pixel-identical to ImageEnhance.Brightness.
+    If strip_rows is given, the table is applied to the image itself, strip_rows rows at a
+    time, instead of making an adjusted copy. (see shared.memory)
+    """
+    lut = brightness_lut(mod, img.mode)
+    if lut is not None and strip_rows is not None:
+        img.load()
+        for box in memory.strips(img, strip_rows):
+            img.paste(img.crop(box).point(lut), box)
+        return img
+
+    if lut is not None:
+        return img.point(lut)
+
+    # pylint: disable=import-outside-toplevel
+    from PIL import ImageEnhance
+
     enhancer = ImageEnhance.Brightness(img)
     img = enhancer.enhance(mod)
     return img
@@ -36,47 +73,105 @@ def meetcondition(value: float, condition: float, is_max: bool = False) -> bool:
     return meet
 
 
+def passthrough(file: str, output: str, move: bool = False):
+    """
+    Puts an unchanged file at output without re-encoding it.
+
+    Moves are atomic renames where possible (same filesystem), copies are byte copies.
+    Nothing is done if output is the file itself. (Adjusting in place)
+    """
+    if exists(output) and samefile(file, output):
+        return
+
+    if not move:
+        shutil.copy2(file, output)
+        return
+
+    try:
+        rename(file, output)
+    except OSError as e:
+        if e.errno != EXDEV:
+            raise
+        shutil.move(file, output)
+
+
+def _output_path(file: str, output: str, create_no_dirs: bool) -> str:
+    """
+    Returns the path the file is saved to, creating the output dir if needed. Exits if it
+    doesn't exist and create_no_dirs is set.
+    """
+    outpathtype = folders.check_path_type(output)
+
+    if (
+        outpathtype in [folders.PathType.NEW_FILE, folders.PathType.NEW_DIR]
+        and create_no_dirs
+    ):
+        print(
+            Fore.RED
+            + "Error: "
+            + Fore.RESET
+            + f"Directory {output} doesn't exist and -n / --create-no-dirs is set."
+        )
+        sysexit(1)
+
+    if outpathtype == folders.PathType.NEW_DIR:
+        makedirs(output)
+
+    if outpathtype in [folders.PathType.DIRECTORY, folders.PathType.NEW_DIR]:
+        return join(output, basename(file))
+    return output
+
+
 def _mainlogic(file: str, condition: float, mod: float, output: str, **kwargs):
     """
     Internal logic of the main function. Responsible for checking brightness and applying modifier.
     """
     is_max = kwargs.get("is_max", False)
     move = kwargs.get("move", False)
-    create_no_dirs = kwargs.get("create_no_dirs", False)
-
-    # Check if the file ends with .jpg or .png
-    if splitext(file)[1] in [".jpg", ".png"]:
-        img = Image.open(file)
-        brightness = getbrightness(img)
-        if meetcondition(brightness, condition, is_max):
-            img = adjustbrightness(img, mod)
+    save_options = kwargs.get("save_options", {})
+    max_memory = kwargs.get("max_memory", None)
+
+    if folders.is_image(file):
+        # pylint: disable=import-outside-toplevel
+        # Pillow is only imported once an image has to be decoded, not for --help.
+        from PIL import Image
+
+        with METRICS.timer("decode"):
+            img = Image.open(file)
+            rows = memory.strip_rows(img, max_memory)
+            brightness = getbrightness(img, rows)
+        METRICS.count("images_processed")
+
+        modified = meetcondition(brightness, condition, is_max)
+        if modified:
+            with METRICS.timer("adjust"):
+                img = adjustbrightness(img, mod, rows)
         else:
             mod = 1
 
-        outpathtype = folders.check_path_type(output)
-
-        if (
-            outpathtype in [folders.PathType.NEW_FILE, folders.PathType.NEW_DIR]
-            and create_no_dirs
-        ):
-            print(
-                Fore.RED
-                + "Error: "
-                + Fore.RESET
-                + f"Directory {output} doesn't exist and -n / --create-no-dirs is set."
-            )
-            sysexit(1)
-
-        if outpathtype == folders.PathType.NEW_DIR:
-            makedirs(output)
-
-        if outpathtype in [folders.PathType.DIRECTORY, folders.PathType.NEW_DIR]:
-            output = join(output, basename(file))
-
-        img.save(output)
+        output = _output_path(file, output, kwargs.get("create_no_dirs", False))
+        in_place = exists(output) and samefile(file, output)
+
+        if not modified and splitext(output)[1].lower() == splitext(file)[1].lower():
+            # Re-encoding an unchanged image would only cost time and quality.
+            img.close()
+            with METRICS.timer("passthrough"):
+                passthrough(file, output, move)
+            METRICS.count("images_passed_through")
+            if in_place:
+                print(f"Kept {file} unchanged.")
+            else:
+                print(f"{'Moved' if move else 'Copied'} {file} to {output} unchanged.")
+            return
+
+        with METRICS.timer("encode"):
+            img.save(output, **save_options)
+        if METRICS.enabled:
+            METRICS.count("bytes_written", getsize(output))
         print(f"Saved {output} having modified {file} by {mod}.")
 
-        if move:
+        # The adjusted image replaced the file itself, so there's nothing left to delete.
+        if move and not in_place:
             remove(file)
             print(f"Deleted {file}")
 
@@ -84,25 +179,38 @@ def _mainlogic(file: str, condition: float, mod: float, output: str, **kwargs):
 def main(files: str, output: str, condition: float, mod: float, **kwargs):
     """
     Main function for executing the appropriate functions given the parameters.
+
+    save_options are passed on to Image.save for modified images. (e.g. quality)
+    max_memory (bytes) makes the brightness and the adjustment work on strips of the image,
+    see shared.memory.
     """
     recursive = kwargs.get("recursive", False)
     is_max = kwargs.get("is_max", False)
     move = kwargs.get("move", False)
     create_no_dirs = kwargs.get("create_no_dirs", False)
+    save_options = kwargs.get("save_options", {})
+    max_memory = kwargs.get("max_memory", None)
 
     inpathtype = folders.check_path_type(files)
 
     if inpathtype == folders.PathType.DIRECTORY and recursive:
-        fileslist = folders.list_all_contents(files)
-        for file in fileslist:
+        # Images are adjusted while scanning, which must not pick up the written ones.
+        exclude = (kwargs.get("exclude", None) or []) + [glob_escape(abspath(output))]
+        for entry in folders.scan(
+            files,
+            exclude=exclude,
+            follow_symlinks=kwargs.get("follow_symlinks", False),
+        ):
             _mainlogic(
-                file,
+                entry.path,
                 condition,
                 mod,
                 output,
                 move=move,
                 is_max=is_max,
                 create_no_dirs=create_no_dirs,
+                save_options=save_options,
+                max_memory=max_memory,
             )
     elif inpathtype == folders.PathType.FILE:
         _mainlogic(
@@ -113,6 +221,8 @@ def main(files: str, output: str, condition: float, mod: float, **kwargs):
             move=move,
             is_max=is_max,
             create_no_dirs=create_no_dirs,
+            save_options=save_options,
+            max_memory=max_memory,
         )
     elif inpathtype == folders.PathType.DIRECTORY and not recursive:
         print(
@@ -127,8 +237,10 @@ def main(files: str, output: str, condition: float, mod: float, **kwargs):
         print(Fore.RED + "Error: " + Fore.RESET + f"An Error has ocurred. {files}")
 
 
-if __name__ == "__main__":
-
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
     # region argparse
 
     parser = argparse.ArgumentParser(
@@ -181,6 +293,20 @@ if __name__ == "__main__":
         help="Changes the condition from being the minimum to be being the maximum value.",
     )
 
+    parser.add_argument(
+        "--exclude",
+        metavar="",
+        action="append",
+        help="Skips files / directories whose name or absolute path matches the glob pattern. \
+              Can be given multiple times.",
+    )
+
+    parser.add_argument(
+        "--follow-symlinks",
+        action="store_true",
+        help="Also scans symlinked directories (each directory only once).",
+    )
+
     parser.add_argument(
         "--move", action="store_true", help="Moves the files instead of copying them."
     )
@@ -191,17 +317,79 @@ if __name__ == "__main__":
         action="store_true",
         help="Disallows the creation of any directories.",
     )
-    args = parser.parse_args()
 
-    # endregion
+    parser.add_argument(
+        "-q",
+        "--quality",
+        metavar="",
+        type=int,
+        help="JPEG quality (1-95) of modified images. Default: 75",
+    )
+
+    parser.add_argument(
+        "--subsampling",
+        choices=["4:4:4", "4:2:2", "4:2:0"],
+        help="JPEG chroma subsampling of modified images. Default: 4:2:0",
+    )
 
-    main(
-        args.path,
-        args.destination,
-        args.condition,
-        args.mod,
-        recursive=args.r,
-        is_max=args.max,
-        move=args.move,
-        create_no_dirs=args.create_no_dirs,
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Optimizes the encoding of modified images. (Smaller files, slower)",
     )
+
+    parser.add_argument(
+        "--progressive",
+        action="store_true",
+        help="Saves modified JPEGs as progressive.",
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        metavar="",
+        type=memory.parse_size,
+        help="Memory budget per image (e.g. 512M). Converts and adjusts images in strips of \
+              rows on top of the decoded image, which Pillow always decodes whole.",
+    )
+
+    metrics.add_arguments(parser)
+
+    # endregion
+
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    args = build_parser().parse_args(argv)
+
+    options = {
+        "quality": args.quality,
+        "subsampling": args.subsampling,
+        "optimize": args.optimize or None,
+        "progressive": args.progressive or None,
+    }
+
+    with metrics.instrumented(args.metrics, args.profile):
+        main(
+            args.path,
+            args.destination,
+            args.condition,
+            args.mod,
+            recursive=args.r,
+            exclude=args.exclude,
+            follow_symlinks=args.follow_symlinks,
+            is_max=args.max,
+            move=args.move,
+            create_no_dirs=args.create_no_dirs,
+            max_memory=args.max_memory,
+            save_options={
+                key: value for key, value in options.items() if value is not None
+            },
+        )
+
+
+if __name__ == "__main__":
+    cli()
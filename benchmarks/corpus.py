@@ -0,0 +1,84 @@
+"""
+Module generating the deterministic synthetic corpora the benchmarks run on.
+
+The same seed, count, size and format always give the same files, so results of different
+runs (and machines) are comparable. Generated corpora are kept in the cache directory and
+reused.
+"""
+
+import json
+from os import makedirs, replace
+from os.path import join, isdir
+
+import numpy as np
+from PIL import Image
+
+from shared.cache import cache_dir
+
+SIZES = {
+    "cover": (640, 640),
+    "4k": (3840, 2160),
+}
+
+FORMATS = ("jpg", "png")
+
+
+def corpus_dir(count: int, size: str, fmt: str, seed: int) -> str:
+    """
+    Returns the directory of the corpus. ($XDG_CACHE_HOME/walltune/bench/...)
+    """
+    return join(cache_dir(), "bench", f"{fmt}-{size}-{count}-{seed}")
+
+
+def make_image(index: int, size: tuple, seed: int) -> Image.Image:
+    """
+    Creates a smooth, colorful image, looking more like a cover than plain noise does.
+    """
+    rng = np.random.default_rng((seed, index))
+    coarse = rng.integers(0, 256, (9, 16, 3), dtype=np.uint8)
+    img = Image.fromarray(coarse, "RGB").resize(size, Image.Resampling.BILINEAR)
+
+    # Add some grain, so the encoders have detail to work on.
+    grain = rng.integers(-12, 13, (64, 64, 3), dtype=np.int16)
+    pixels = np.asarray(img, dtype=np.int16)
+    tiles = np.tile(grain, (size[1] // 64 + 1, size[0] // 64 + 1, 1))
+    pixels = pixels + tiles[: size[1], : size[0]]
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def generate_corpus(
+    count: int, size: str = "cover", fmt: str = "jpg", seed: int = 0
+) -> str:
+    """
+    Generates the corpus if it doesn't exist yet and returns its directory.
+
+    The files are spread over subdirectories of 1000 files, like a grouped library.
+    """
+    directory = corpus_dir(count, size, fmt, seed)
+    if isdir(directory):
+        return directory
+
+    tmp_dir = directory + ".tmp"
+    for index in range(count):
+        sub_dir = join(tmp_dir, f"{index // 1000:03}")
+        makedirs(sub_dir, exist_ok=True)
+        make_image(index, SIZES[size], seed).save(
+            join(sub_dir, f"{index:06}.{fmt}"),
+            **({"quality": 90} if fmt == "jpg" else {}),
+        )
+
+    # Only complete corpora get their final name.
+    replace(tmp_dir, directory)
+    return directory
+
+
+def generate_palette(json_path: str, colors: int, root: str, seed: int = 0):
+    """
+    Writes a grouping json of colors random colors, whose paths are folders under root.
+    """
+    rng = np.random.default_rng((seed, colors))
+    values = rng.integers(0, 256, (colors, 3)).tolist()
+    options = {join(root, f"group{idx:03}"): value for idx, value in enumerate(values)}
+
+    with open(json_path, "w", encoding="utf-8") as file:
+        json.dump(options, file)
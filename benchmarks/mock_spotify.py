@@ -0,0 +1,83 @@
+"""
+Module standing in for Spotify in the benchmarks: a local HTTP server serving the covers and
+a client answering the API calls with tracks pointing at it.
+"""
+
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from os.path import relpath
+from threading import Thread
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+
+@contextmanager
+def serve_directory(directory: str):
+    """
+    Serves the directory on a free local port while in the context. Yields the base url.
+    """
+    handler = partial(_QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_tracks(files: list, directory: str, base_url: str) -> list:
+    """
+    Creates a liked songs item for every file, with the file as its cover.
+    """
+    return [
+        {
+            "added_at": f"2024-01-01T00:00:{idx % 60:02}Z",
+            "track": {
+                "id": f"track{idx}",
+                "uri": f"spotify:track:track{idx}",
+                "name": f"Track {idx}",
+                "type": "track",
+                "artists": [{"name": "Artist"}],
+                "album": {
+                    "name": f"Album {idx}",
+                    "images": [{"url": f"{base_url}/{relpath(file, directory)}"}],
+                },
+            },
+        }
+        for idx, file in enumerate(files)
+    ]
+
+
+class FakeSpotify:
+    """
+    Answers the calls of spotify_api.main with the given liked songs.
+    """
+
+    def __init__(self, tracks: list):
+        self.tracks = tracks
+        self.calls = 0
+
+    def __call__(self, **_):
+        # Used in place of spotify_api.main.get_client.
+        return self
+
+    def current_user_saved_tracks(self, limit: int = 20, offset: int = 0) -> dict:
+        """
+        Returns a page of the liked songs.
+        """
+        self.calls += 1
+        items = self.tracks[offset : offset + limit]
+        return {
+            "items": items,
+            "total": len(self.tracks),
+            "next": None if offset + limit >= len(self.tracks) else "next",
+        }
@@ -0,0 +1,336 @@
+"""
+A CLI benchmarking the hot paths and CLIs of WallTune on synthetic corpora.
+
+Every suite runs in fresh subprocesses, one timing the per-image latency of its hot path and
+one the CLI's main(), whose peak RSS is reported as well. Results can be saved as a baseline
+and compared against one, flagging every metric that got worse by more than the threshold.
+"""
+
+import argparse
+import json
+import resource
+import shutil
+import subprocess
+import tempfile
+from contextlib import redirect_stdout
+from os import devnull
+from os.path import join, abspath, dirname
+from sys import path, executable
+from sys import exit as sysexit
+from time import perf_counter
+
+import numpy as np
+from colorama import Fore
+
+path.append(abspath(join(dirname(__file__), "..")))
+
+# pylint: disable=wrong-import-position
+
+from benchmarks.corpus import SIZES, FORMATS, generate_corpus
+from benchmarks.suites import SUITES
+
+# pylint: enable=wrong-import-position
+
+# Whether a higher value of the metric is better.
+METRICS = {
+    "throughput": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def _peak_rss() -> int:
+    """
+    Returns the peak RSS of this process in kilobytes.
+    """
+    # ru_maxrss survives exec on Linux, so it'd report the parent's peak if that was higher.
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _worker(suite: str, part: str, options: dict) -> dict:
+    """
+    Runs one part of the suite in this process.
+    """
+    corpus = generate_corpus(
+        options["count"], options["size"], options["format"], options["seed"]
+    )
+    workdir = tempfile.mkdtemp(prefix="walltune-bench-")
+    items, run_main = SUITES[suite]
+
+    try:
+        # The CLIs print a line per image, which would only measure the terminal.
+        with open(devnull, "w", encoding="utf-8") as null, redirect_stdout(null):
+            if part == "items":
+                latencies = np.array(items(corpus, workdir, options)) * 1000
+                return {
+                    "p50_ms": float(np.percentile(latencies, 50)),
+                    "p99_ms": float(np.percentile(latencies, 99)),
+                }
+
+            start = perf_counter()
+            count = run_main(corpus, workdir, options)
+            seconds = perf_counter() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "items": count,
+        "seconds": seconds,
+        "throughput": count / seconds,
+        "peak_rss_mb": _peak_rss() / 1024,
+    }
+
+
+def run_suite(suite: str, options: dict) -> dict:
+    """
+    Runs both parts of the suite in their own subprocesses and merges their results.
+    """
+    result = {}
+    for part in ("items", "main"):
+        process = subprocess.run(
+            [executable, abspath(__file__), "--worker", part, suite]
+            + ["--options", json.dumps(options)],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"{suite} ({part}) failed:\n{process.stderr}")
+        result.update(json.loads(process.stdout.splitlines()[-1]))
+    return result
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Returns a (suite, metric, baseline value, value) tuple for every metric that got worse by
+    more than threshold (relative).
+    """
+    regressions = []
+    for suite, result in results.items():
+        old = baseline.get("results", {}).get(suite)
+        if old is None:
+            continue
+
+        for metric, higher_is_better in METRICS.items():
+            if metric not in old or old[metric] == 0:
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((suite, metric, old[metric], result[metric]))
+    return regressions
+
+
+def main(suites: list, **kwargs) -> int:
+    """
+    Main function running the suites, printing their results and comparing them against the
+    baseline. Returns the amount of regressions.
+    """
+    options = {
+        "count": kwargs.get("count", 1000),
+        "size": kwargs.get("size", "cover"),
+        "format": kwargs.get("fmt", "jpg"),
+        "seed": kwargs.get("seed", 0),
+        "palette": kwargs.get("palette", 64),
+        "concurrency": kwargs.get("concurrency", 8),
+        "repeat": kwargs.get("repeat", 20),
+    }
+    baseline_path = kwargs.get("baseline", None)
+    save_path = kwargs.get("save", None)
+    threshold = kwargs.get("threshold", 0.1)
+
+    # Generated once up front, so it isn't part of any measurement.
+    generate_corpus(
+        options["count"], options["size"], options["format"], options["seed"]
+    )
+
+    results = {}
+    for suite in suites:
+        results[suite] = run_suite(suite, options)
+        result = results[suite]
+        print(
+            f"{suite:<11} {result['throughput']:>10.1f} items/s"
+            f"  p50 {result['p50_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms"
+            f"  peak RSS {result['peak_rss_mb']:>7.1f} MB"
+        )
+
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as file:
+            json.dump({"options": options, "results": results}, file, indent=1)
+        print(f"Saved baseline {save_path}")
+
+    if not baseline_path:
+        return 0
+
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+
+    if baseline.get("options") != options:
+        print(
+            Fore.YELLOW
+            + "Warning: "
+            + Fore.RESET
+            + "The baseline was recorded with different options."
+        )
+
+    regressions = compare(results, baseline, threshold)
+    for suite, metric, old, new in regressions:
+        print(
+            Fore.RED
+            + "Regression: "
+            + Fore.RESET
+            + f"{suite} {metric} {old:.2f} -> {new:.2f}"
+        )
+    return len(regressions)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
+    # region argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmarks WallTune on a synthetic corpus.",
+        usage="[suites] [options]",
+    )
+
+    parser.add_argument(
+        "suites",
+        metavar="suites",
+        nargs="*",
+        help=f"The suites to run: {', '.join(SUITES)}. Default: all",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--count",
+        metavar="",
+        type=int,
+        default=1000,
+        help="Amount of images in the corpus. Default: 1000",
+    )
+
+    parser.add_argument(
+        "--size",
+        choices=list(SIZES),
+        default="cover",
+        help="Size of the images. Default: cover",
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="jpg",
+        help="Format of the images. Default: jpg",
+    )
+
+    parser.add_argument(
+        "--palette",
+        metavar="",
+        type=int,
+        default=64,
+        help="Amount of colors in the grouping json. Default: 64",
+    )
+
+    parser.add_argument(
+        "--seed",
+        metavar="",
+        type=int,
+        default=0,
+        help="Seed of the corpus and palette. Default: 0",
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        metavar="",
+        type=int,
+        default=8,
+        help="Amount of parallel downloads. Default: 8",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        metavar="",
+        type=int,
+        default=20,
+        help="How often the folders suite lists the corpus / the startup suite starts \
+              walltune. Default: 20",
+    )
+
+    parser.add_argument(
+        "--save",
+        metavar="",
+        type=str,
+        help="Saves the results as a baseline (json) to the given path.",
+    )
+
+    parser.add_argument(
+        "--baseline",
+        metavar="",
+        type=str,
+        help="Compares the results against the baseline, exiting with 1 on regressions.",
+    )
+
+    parser.add_argument(
+        "--threshold",
+        metavar="",
+        type=float,
+        default=0.1,
+        help="Relative change of a metric counting as regression. Default: 0.1",
+    )
+
+    parser.add_argument("--worker", choices=("items", "main"), help=argparse.SUPPRESS)
+
+    parser.add_argument("--options", help=argparse.SUPPRESS)
+
+    # endregion
+
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    args = build_parser().parse_args(argv)
+
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        print(
+            Fore.RED + "Error: " + Fore.RESET + f"Unknown suites {', '.join(unknown)}."
+        )
+        sysexit(2)
+
+    if args.worker:
+        print(
+            json.dumps(_worker(args.suites[0], args.worker, json.loads(args.options)))
+        )
+        return
+
+    regressions = main(
+        args.suites or list(SUITES),
+        count=args.count,
+        size=args.size,
+        fmt=args.format,
+        seed=args.seed,
+        palette=args.palette,
+        concurrency=args.concurrency,
+        repeat=args.repeat,
+        baseline=args.baseline,
+        save=args.save,
+        threshold=args.threshold,
+    )
+    if regressions:
+        sysexit(1)
+
+
+if __name__ == "__main__":
+    cli()
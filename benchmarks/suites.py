@@ -0,0 +1,232 @@
+"""
+The benchmarked subsystems. Every suite measures the per-image latency of its hot path and the
+run time of the respective CLI's main().
+
+Both parts get the corpus, a scratch directory and the options, and return the amount of
+processed items (main) or the latencies in seconds (items).
+"""
+
+import subprocess
+from os.path import join, abspath, dirname
+from sys import executable
+from time import perf_counter
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+from shared import folders
+from shared.brightness import getbrightness
+from shared.download import download, make_session
+
+from benchmarks.corpus import generate_palette
+from benchmarks.mock_spotify import FakeSpotify, make_tracks, serve_directory
+
+WALLTUNE = join(dirname(dirname(abspath(__file__))), "walltune.py")
+
+
+def _timed(func, items) -> list:
+    latencies = []
+    for item in items:
+        start = perf_counter()
+        func(item)
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def _files(corpus: str) -> list:
+    return sorted(folders.list_all_contents(corpus))
+
+
+# region average
+
+
+def average_items(corpus: str, _, __) -> list:
+    """
+    Latency of averaging a single image.
+    """
+    # pylint: disable=import-outside-toplevel
+    from imageaverage.main import get_average_color
+
+    return _timed(get_average_color, _files(corpus))
+
+
+def average_main(corpus: str, _, __) -> int:
+    """
+    Averages the corpus with imageaverage's main().
+    """
+    # pylint: disable=import-outside-toplevel
+    from imageaverage.main import main
+
+    return len(main(corpus, 1, True, True))
+
+
+# endregion
+
+# region brightness
+
+
+def brightness_items(corpus: str, _, __) -> list:
+    """
+    Latency of measuring and adjusting the brightness of a single image.
+    """
+    # pylint: disable=import-outside-toplevel
+    from adjustbrightness.main import adjustbrightness
+
+    def adjust(file):
+        with Image.open(file) as img:
+            getbrightness(img)
+            adjustbrightness(img, 0.5).load()
+
+    return _timed(adjust, _files(corpus))
+
+
+def brightness_main(corpus: str, workdir: str, _) -> int:
+    """
+    Adjusts the whole corpus with adjustbrightness' main().
+    """
+    # pylint: disable=import-outside-toplevel
+    from adjustbrightness.main import main
+
+    # Every image is brighter than 0, so all of them get adjusted and re-encoded.
+    main(corpus, join(workdir, "out"), 0, 0.5, recursive=True)
+    return len(_files(corpus))
+
+
+# endregion
+
+# region group
+
+
+def group_items(corpus: str, workdir: str, options: dict) -> list:
+    """
+    Latency of classifying a single random color against the palette.
+    """
+    # pylint: disable=import-outside-toplevel
+    from grouping.main import load_palette, classify
+
+    json_path = join(workdir, "options.json")
+    generate_palette(json_path, options["palette"], join(workdir, "groups"))
+    palette = load_palette(json_path)
+
+    rng = np.random.default_rng(options["seed"])
+    colors = [tuple(color) for color in rng.integers(0, 256, (len(_files(corpus)), 3))]
+
+    return _timed(lambda color: classify([color], palette, 1000, None), colors)
+
+
+def group_main(corpus: str, workdir: str, options: dict) -> int:
+    """
+    Groups the corpus with grouping's main().
+    """
+    # pylint: disable=import-outside-toplevel
+    from grouping.main import main
+
+    json_path = join(workdir, "options.json")
+    generate_palette(json_path, options["palette"], join(workdir, "groups"))
+
+    main(corpus, json_path)
+    return len(_files(corpus))
+
+
+# endregion
+
+# region folders
+
+
+def folders_items(corpus: str, _, options: dict) -> list:
+    """
+    Latency of listing the corpus, a single listing being the item.
+    """
+    return _timed(lambda _: folders.list_all_contents(corpus), range(options["repeat"]))
+
+
+def folders_main(corpus: str, _, __) -> int:
+    """
+    Lists the corpus once.
+    """
+    return len(folders.list_all_contents(corpus))
+
+
+# endregion
+
+# region download
+
+
+def download_items(corpus: str, workdir: str, options: dict) -> list:
+    """
+    Latency of downloading a single cover from a local HTTP server.
+    """
+    files = _files(corpus)
+    session = make_session(options["concurrency"])
+
+    with serve_directory(corpus) as base_url:
+        tracks = make_tracks(files, corpus, base_url)
+        urls = [track["track"]["album"]["images"][0]["url"] for track in tracks]
+        return _timed(lambda url: download(session, url, join(workdir, "cover")), urls)
+
+
+def download_main(corpus: str, workdir: str, options: dict) -> int:
+    """
+    Fetches the corpus with spotify_api's main() against a fake Spotify API.
+    """
+    # pylint: disable=import-outside-toplevel
+    import spotify_api.main
+
+    files = _files(corpus)
+
+    with serve_directory(corpus) as base_url:
+        client = FakeSpotify(make_tracks(files, corpus, base_url))
+        with mock.patch.object(spotify_api.main, "get_client", client):
+            spotify_api.main.main(
+                join(workdir, "covers"),
+                len(files),
+                0,
+                False,
+                "",
+                concurrency=options["concurrency"],
+            )
+
+    return len(files)
+
+
+# endregion
+
+# region startup
+
+
+def _walltune(args: list):
+    subprocess.run([executable, WALLTUNE] + args, check=True, capture_output=True)
+
+
+def startup_items(corpus: str, workdir: str, options: dict) -> list:
+    """
+    Latency of a fresh process printing a cached color, the process being the item.
+    """
+    args = [_files(corpus)[0], "--hex", "--cache-file", join(workdir, "colors.sqlite")]
+    _walltune(["average"] + args)
+    return _timed(lambda _: _walltune(["average"] + args), range(options["repeat"]))
+
+
+def startup_main(_, __, ___) -> int:
+    """
+    Starts every command of walltune.py with --help once.
+    """
+    # pylint: disable=import-outside-toplevel
+    from walltune import COMMANDS
+
+    for command in COMMANDS:
+        _walltune([command, "--help"])
+    return len(COMMANDS)
+
+
+# endregion
+
+SUITES = {
+    "average": (average_items, average_main),
+    "brightness": (brightness_items, brightness_main),
+    "group": (group_items, group_main),
+    "folders": (folders_items, folders_main),
+    "download": (download_items, download_main),
+    "startup": (startup_items, startup_main),
+}
@@ -0,0 +1,124 @@
+"""
+A tiny client for the WallTune daemon. Takes the same arguments as the CLIs it forwards to:
+
+    client.py average <path> [imageaverage options]
+    client.py current <path> [spotify_api/current options]
+
+If no daemon is running the command is executed in-process instead.
+"""
+
+import argparse
+from socket import socket, AF_UNIX, SOCK_STREAM
+from sys import path, stdout, stderr
+from sys import exit as sysexit
+from os import getcwd
+from os.path import join, abspath, dirname
+
+path.append(abspath(join(dirname(__file__), "..")))
+
+# pylint: disable=wrong-import-position
+
+from daemon import protocol
+
+# Both only import their heavy dependencies once they run.
+from imageaverage.main import cli as average_cli
+from spotify_api.current import cli as current_cli
+
+# pylint: enable=wrong-import-position
+
+
+def request(command: str, argv: list, socket_path: str) -> dict:
+    """
+    Sends a request to the daemon and returns its response.
+
+    Raises OSError if the daemon can't be reached.
+    """
+    with socket(AF_UNIX, SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(
+            protocol.encode({"command": command, "argv": argv, "cwd": getcwd()})
+        )
+        with sock.makefile("rb") as file:
+            return protocol.decode(file.readline())
+
+
+def _run_locally(command: str, argv: list):
+    """
+    Fallback for when no daemon is running.
+    """
+    if command == "average":
+        average_cli(argv)
+    else:
+        current_cli(argv)
+
+
+def main(command: str, argv: list, socket_path: str, no_fallback: bool = False):
+    """
+    Main function forwarding the command to the daemon and printing its output.
+    """
+    try:
+        response = request(command, argv, socket_path)
+    except OSError:
+        if no_fallback:
+            print(
+                f"Error: Couldn't connect to the daemon at {socket_path}.", file=stderr
+            )
+            sysexit(1)
+        _run_locally(command, argv)
+        return
+
+    stdout.write(response["stdout"])
+    stderr.write(response["stderr"])
+    sysexit(response["status"])
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
+    # region argparse
+
+    parser = argparse.ArgumentParser(
+        description="Forwards a command to the WallTune daemon.",
+        usage="[options] {average,current} <arguments of the command>",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--socket",
+        metavar="",
+        type=str,
+        default=protocol.default_socket(),
+        help="Path of the daemon's Unix socket. Default: $XDG_RUNTIME_DIR/walltune.sock",
+    )
+
+    parser.add_argument(
+        "--no-fallback",
+        action="store_true",
+        help="Fails instead of running the command in-process if no daemon is running.",
+    )
+
+    parser.add_argument("command", choices=protocol.COMMANDS, help="The CLI to run.")
+
+    parser.add_argument(
+        "argv",
+        nargs=argparse.REMAINDER,
+        help="Arguments passed on to the CLI.",
+    )
+
+    # endregion
+
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    args = build_parser().parse_args(argv)
+
+    main(args.command, args.argv, args.socket, args.no_fallback)
+
+
+if __name__ == "__main__":
+    cli()
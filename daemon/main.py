@@ -0,0 +1,249 @@
+"""
+A long-running daemon answering WallTune queries over a Unix socket.
+
+Keeps the interpreter, NumPy / Pillow, the color cache and the Spotify client warm, so every
+wallpaper rotation only costs a round trip over the socket. See client.py for the counterpart.
+"""
+
+import argparse
+import socketserver
+import traceback
+from io import StringIO
+from contextlib import redirect_stdout, redirect_stderr
+from os import chdir, getcwd, remove, chmod
+from os.path import exists, join, abspath, dirname
+from socket import socket, AF_UNIX, SOCK_STREAM
+from sys import path
+from sys import exit as sysexit
+from threading import Lock
+
+from colorama import Fore
+
+path.append(abspath(join(dirname(__file__), "..")))
+
+# pylint: disable=wrong-import-position
+
+from daemon import protocol
+
+from shared.cache import ColorCache, DEFAULT_MAX_ENTRIES
+from shared.metrics import instrumented
+
+# Spotify's dependencies are only imported on first use, so the daemon works without any
+# Spotify credentials.
+from imageaverage.main import cli as average_cli
+from spotify_api.current import (
+    build_parser as current_parser,
+    main as current_main,
+)
+
+# pylint: enable=wrong-import-position
+
+
+def _run_average(argv: list, server: "Daemon"):
+    # Without a cache the daemon was started with --no-cache, which the CLI must not override
+    # by opening its own.
+    average_cli(argv, cache=server.cache, no_cache=server.cache is None)
+
+
+def _run_current(argv: list, _):
+    args = current_parser().parse_args(argv)
+    if args.watch:
+        # Would block every other request.
+        print(
+            Fore.RED + "Error: " + Fore.RESET + "--watch isn't supported by the daemon."
+        )
+        sysexit(2)
+
+    with instrumented(args.metrics, args.profile):
+        current_main(args.path, args.create_no_dirs)
+
+
+RUNNERS = {
+    "average": _run_average,
+    "current": _run_current,
+}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Answers a single request per connection.
+    """
+
+    def handle(self):
+        try:
+            request = protocol.decode(self.rfile.readline())
+        except ValueError:
+            return
+
+        self.wfile.write(protocol.encode(self.server.execute(request)))
+
+
+class Daemon(socketserver.ThreadingUnixStreamServer):
+    """
+    Unix socket server running the CLIs in-process.
+
+    Requests are executed one at a time, as the CLIs print their output and share the cache.
+    This also lets every request run in the working directory of its client.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, cache: ColorCache = None):
+        self.cache = cache
+        self._lock = Lock()
+        super().__init__(socket_path, _Handler)
+        chmod(socket_path, 0o600)
+
+    def execute(self, request: dict) -> dict:
+        """
+        Executes the request and returns the response containing the captured output.
+        """
+        runner = RUNNERS.get(request.get("command"))
+        if runner is None:
+            return {
+                "status": 2,
+                "stdout": "",
+                "stderr": f"Unknown command {request.get('command')}\n",
+            }
+
+        stdout = StringIO()
+        stderr = StringIO()
+        status = 0
+
+        with self._lock, redirect_stdout(stdout), redirect_stderr(stderr):
+            cwd = getcwd()
+            try:
+                if request.get("cwd"):
+                    chdir(request["cwd"])
+                runner(request.get("argv", []), self)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except Exception:  # pylint: disable=broad-exception-caught
+                traceback.print_exc()
+                status = 1
+            finally:
+                chdir(cwd)
+
+            if self.cache is not None:
+                self.cache.commit()
+
+        return {
+            "status": status,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+        }
+
+
+def _socket_in_use(socket_path: str) -> bool:
+    """
+    Checks whether another daemon is listening on the socket.
+    """
+    with socket(AF_UNIX, SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def main(socket_path: str, **kwargs):
+    """
+    Main function starting the daemon and serving until interrupted.
+    """
+    no_cache = kwargs.get("no_cache", False)
+    cache_file = kwargs.get("cache_file", None)
+    cache_size = kwargs.get("cache_size", DEFAULT_MAX_ENTRIES)
+
+    if exists(socket_path):
+        if _socket_in_use(socket_path):
+            print(
+                Fore.RED
+                + "Error: "
+                + Fore.RESET
+                + f"A daemon is already listening on {socket_path}."
+            )
+            sysexit(1)
+        remove(socket_path)
+
+    cache = None if no_cache else ColorCache(cache_file, cache_size)
+
+    # Import the heavy modules up front, so the first request is as fast as the others.
+    # pylint: disable=import-outside-toplevel,unused-import
+    from PIL import Image
+    import numpy
+
+    try:
+        with Daemon(socket_path, cache) as server:
+            print(f"Listening on {socket_path}")
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if exists(socket_path):
+            remove(socket_path)
+        if cache is not None:
+            cache.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
+    # region argparse
+
+    parser = argparse.ArgumentParser(
+        description="Runs the WallTune daemon answering queries of daemon/client.py.",
+        usage="[options]",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--socket",
+        metavar="",
+        type=str,
+        default=protocol.default_socket(),
+        help="Path of the Unix socket. Default: $XDG_RUNTIME_DIR/walltune.sock",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Doesn't use the on-disk color cache.",
+    )
+
+    parser.add_argument(
+        "--cache-file",
+        metavar="",
+        type=str,
+        help="Path to the color cache. Default: $XDG_CACHE_HOME/walltune/colors.sqlite",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        metavar="",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help=f"Max amount of cached colors. Default: {DEFAULT_MAX_ENTRIES}",
+    )
+
+    # endregion
+
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    args = build_parser().parse_args(argv)
+
+    main(
+        args.socket,
+        no_cache=args.no_cache,
+        cache_file=args.cache_file,
+        cache_size=args.cache_size,
+    )
+
+
+if __name__ == "__main__":
+    cli()
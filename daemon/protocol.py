@@ -0,0 +1,46 @@
+"""
+The wire protocol shared by the WallTune daemon and its client.
+
+Every request and response is a single JSON object on its own line:
+    request:  {"command": "average" | "current", "argv": [<CLI arguments>], "cwd": <str>}
+    response: {"status": <exit code>, "stdout": <str>, "stderr": <str>}
+
+Relative paths in argv are resolved against cwd, the working directory of the client. Without
+it they're resolved against the daemon's. Any client able to write a line to a Unix socket
+works, e.g. with socat and jq:
+
+    jq -cn --arg cwd "$PWD" '{command: "average", argv: $ARGS.positional, cwd: $cwd}' \
+        --args -- <path> --hex \
+        | socat - UNIX-CONNECT:"$XDG_RUNTIME_DIR/walltune.sock" | jq -j .stdout
+"""
+
+import json
+from os import environ, getuid
+from os.path import join
+from tempfile import gettempdir
+
+COMMANDS = ("average", "current")
+
+
+def default_socket() -> str:
+    """
+    Returns the default socket path. ($XDG_RUNTIME_DIR/walltune.sock)
+    """
+    runtime_dir = environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return join(runtime_dir, "walltune.sock")
+    return join(gettempdir(), f"walltune-{getuid()}.sock")
+
+
+def encode(message: dict) -> bytes:
+    """
+    Encodes a message as a single line.
+    """
+    return json.dumps(message).encode("utf-8") + b"\n"
+
+
+def decode(line: bytes) -> dict:
+    """
+    Decodes a message from a single line.
+    """
+    return json.loads(line.decode("utf-8"))
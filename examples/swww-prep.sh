@@ -46,11 +46,13 @@ function make_call {
 
     if (( current_time - LAST_API_CALL >= time_seconds )); then
         echo "Getting Tracks"
-        python ""$scripts"/spotify_api/main.py" "$directory" -a 10
+        python ""$scripts"/spotify_api/main.py" "$directory" -a 10 --sync
         echo "Adjusting brightness"
         python "$scripts/adjustbrightness/main.py" "$directory" "$save_dir" -m 0.6 -c 150 -r --move
         echo "Grouping Images"
         python "$scripts/grouping/main.py" "$save_dir" "$grouping_options" -r --move
+        # or do all three in a single process, decoding each image once:
+        # python "$scripts/pipeline/main.py" "$grouping_options" -a 10 -m 0.6 -c 150
         write_time_to_cache
     fi
 }
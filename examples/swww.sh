@@ -13,6 +13,8 @@ scripts="/path/to/git/repo/"
 current_dir="/path/to/save/currently/playing/images/"
 # time before background is changed
 sleep_time_default=60
+# socket of the daemon (see daemon/protocol.py)
+socket="${XDG_RUNTIME_DIR:-/tmp}/walltune.sock"
 
 # --Code--
 
@@ -34,9 +36,21 @@ all_files=$(find "$directory" -type f -print)
 # Store the file paths in an array
 IFS=$'\n' read -rd '' -a files <<<"$all_files"
 
+# Sends a command to the daemon without starting Python for the client (~100 ms each).
+# Needs socat and jq, else the Python client is used.
+walltune() {
+
+    if command -v socat > /dev/null && command -v jq > /dev/null && [ -S "$socket" ]; then
+        jq -cn --arg cwd "$PWD" '{command: $ARGS.positional[0], argv: $ARGS.positional[1:], cwd: $cwd}' \
+            --args -- "$@" | socat - UNIX-CONNECT:"$socket" | jq -j .stdout
+    else
+        python "$scripts/daemon/client.py" -s "$socket" "$@"
+    fi
+}
+
 get_file() {
 
-    current_img=$(python "$scripts/spotify_api/current.py" "$current_dir" | awk 'NR==2')
+    current_img=$(walltune current "$current_dir" | awk 'NR==2')
 
     if [ -n "$current_img" ]; then
         echo "$current_img"
@@ -54,7 +68,7 @@ get_file() {
 get_hex() {
 
     img="$1" # path to img
-    out=$(python "$scripts"/imageaverage/main.py "$img" -m 0.5 --hex)
+    out=$(walltune average "$img" -m 0.5 --hex)
 
     echo "$out"
 }
@@ -74,6 +88,9 @@ swww-daemon & disown
 
 source "$scripts"/.venv/bin/activate
 
+# keeps python, the color cache and the Spotify client warm between rotations
+python "$scripts"/daemon/main.py -s "$socket" & disown
+
 # cd /home/david/Scripts/WallTune-Usage/imageaverage/
 
 while true; do
@@ -8,80 +8,237 @@ TO-DO:
 
 import argparse
 import json
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple, NamedTuple, List
 from sys import path
 from sys import exit as sysexit
-from os.path import join, basename, abspath, dirname
+from os.path import join, abspath, dirname, isfile
 from os import makedirs
-import shutil
 from colorama import Fore
-from pyciede2000 import ciede2000
 
 path.append(abspath(join(dirname(__file__), "..")))
 
 # pylint: disable=wrong-import-position
 
 from imageaverage.main import main as average
+from grouping import plan
 
-from shared import folders
+from shared import folders, metrics
+from shared.metrics import METRICS
+from shared.colorconversion import rgb_to_hex
+from shared.manifest import load_manifest, save_manifest, make_record, lookup_color
+
+if TYPE_CHECKING:
+    from numpy import ndarray
+    from shared import deltae
 
 # pylint: enable=wrong-import-position
 
+# Suffix of the journal of moves next to the json. (see grouping.plan)
+JOURNAL_SUFFIX = ".journal"
+
+
+class Palette(NamedTuple):
+    """
+    The options of the json: the paths, the Lab values of their colors and their index.
+    With legacy set the "Lab" values are the legacy ones. (see to_lab)
+    """
+
+    keys: List[str]
+    lab: "ndarray"
+    index: "deltae.PaletteIndex"
+    legacy: bool = False
+
+
+def to_lab(colors, legacy: bool = False) -> "ndarray":
+    """
+    Converts the rgb values to CIELAB for the Delta-E.
+
+    Before, the rgb values scaled to 0-1 were passed to CIEDE2000 as if they were Lab, which
+    gives much smaller Delta-Es (thresholds of about 0-2 instead of 0-100) and different groups.
+    legacy keeps doing that, so old thresholds and groupings can be reproduced.
+    """
+    # pylint: disable=import-outside-toplevel
+    # NumPy is only imported once colors are compared, not for --help.
+    import numpy as np
+    from shared.deltae import rgb_to_lab
+
+    if legacy:
+        return np.asarray(colors, dtype=np.float64) / 255
+    return rgb_to_lab(colors)
+
 
-def calculate_delta_e(rgb1: Tuple[int, int, int], rgb2: Tuple[int, int, int]) -> float:
+def load_palette(json_path: str, legacy: bool = False) -> Palette:
     """
-    First converts the rgb values to sRGB and then uses pyciede2000 to get Delta-E.
+    Loads the json of paths : color value, converting the colors to Lab and indexing them once.
     """
-    # Convert RGB to sRGB
-    srgb1 = [val / 255 for val in rgb1]
-    srgb2 = [val / 255 for val in rgb2]
+    # pylint: disable=import-outside-toplevel
+    from shared.deltae import PaletteIndex
+
+    with open(json_path, "r", encoding="utf-8") as file:
+        options_dict = json.load(file)
+
+    keys = list(options_dict.keys())
+    lab = to_lab([options_dict[key] for key in keys], legacy)
+    return Palette(keys, lab, PaletteIndex(lab), legacy)
+
+
+def calculate_delta_e(
+    rgb1: Tuple[int, int, int], rgb2: Tuple[int, int, int], legacy: bool = False
+) -> float:
+    """
+    First converts the rgb values to Lab and then uses pyciede2000 to get Delta-E.
+    """
+    # pylint: disable=import-outside-toplevel
+    # Only this single pair comparison needs it, classify uses shared.deltae.
+    from pyciede2000 import ciede2000
+
+    lab1, lab2 = to_lab([rgb1, rgb2], legacy)
 
     # Calculate delta E using CIEDE2000
-    delta_e = ciede2000(tuple(srgb1), tuple(srgb2))["delta_E_00"]
+    delta_e = ciede2000(tuple(lab1), tuple(lab2))["delta_E_00"]
 
     return delta_e
 
 
-def _mainlogic(
-    file: str,
-    options_dict: dict,
-    threshold: float,
-    fallback_path: str,
-    **kwargs,
-):
-    create_no_dirs = kwargs.get("create_no_dirs", False)
+def classify(
+    colors: list, palette: Palette, threshold: float, fallback_path: str
+) -> list:
+    """
+    Returns the save path of every color: the palette path with the lowest Delta-E or the
+    fallback if that is over the threshold. All colors are looked up in the palette index in
+    one go, so large palettes only cost the Delta-E of a few close colors per image.
+    """
+    if len(colors) == 0:
+        return []
+
+    with METRICS.timer("delta_e"):
+        lowest, deltas = palette.index.nearest(to_lab(colors, palette.legacy))
+
+    return [
+        fallback_path if delta > threshold else palette.keys[key]
+        for key, delta in zip(lowest, deltas)
+    ]
+
+
+def discover_palette(colors: list, amount: int, root: str = ".", seed: int = 0) -> dict:
+    """
+    Clusters the colors into amount groups in Lab space and returns them as json of
+    paths : color value. The folders are named after the hex values of the groups, under root.
+    """
+    # pylint: disable=import-outside-toplevel
+    from shared.deltae import rgb_to_lab, lab_to_rgb
+    from shared.kmeans import kmeans
+
+    centers = lab_to_rgb(kmeans(rgb_to_lab(colors), amount, seed))
+
+    options = {}
+    # Sorted by lightness, so the json reads dark to bright.
+    for center in sorted(centers.tolist(), key=lambda rgb: rgb_to_lab(rgb)[0]):
+        # Clusters rounding to the same color are merged.
+        options.setdefault(join(root, rgb_to_hex(center)[1:]), center)
+    return options
+
+
+def get_color(
+    file: str, manifest: dict = None, stat_result=None
+) -> Tuple[int, int, int]:
+    """
+    Gets the average color of the file, from the manifest if it has an up-to-date record.
+    Decoded colors are added to the manifest. A known stat_result saves calling os.stat.
+    """
+    if manifest is not None:
+        color = lookup_color(manifest, file, stat_result)
+        if color is not None:
+            METRICS.count("manifest_hits")
+            return color
+
+    color = average(file, 1, False)[0]
+    if manifest is not None:
+        manifest[abspath(file)] = make_record(file, color, stat_result)
+    return color
+
+
+def _place(placements: list, manifest: dict = None, **kwargs):
+    """
+    Places the files of the plan (see grouping.plan), or only prints it with dry_run, and
+    updates the manifest with their new paths.
+    """
     move = kwargs.get("move", False)
-    average_c = average(file, 1, False)[0]
-    deltas = {
-        key: calculate_delta_e(options_dict[key], average_c)
-        for key in options_dict.keys()
-    }
+    copy_mode = kwargs.get("copy_mode", "reflink")
 
-    lowest_delta_key = min(deltas, key=deltas.get)
-    if deltas[lowest_delta_key] > threshold:
-        save_path = fallback_path
-    else:
-        save_path = lowest_delta_key
+    if kwargs.get("dry_run", False):
+        plan.print_plan(placements, "move" if move else copy_mode)
+        return
 
-    if not create_no_dirs:
-        makedirs(save_path, exist_ok=True)
+    plan.create_directories(placements, kwargs.get("create_no_dirs", False))
 
-    if (
-        create_no_dirs
-        and folders.check_path_type(save_path) == folders.PathType.NEW_DIR
+    for placement in plan.execute(
+        placements, move, copy_mode, journal_path=kwargs.get("journal_path", None)
     ):
+        if manifest is not None:
+            if move:
+                manifest.pop(abspath(placement.src), None)
+            manifest[abspath(placement.dst)] = make_record(placement.dst, placement.rgb)
+
+
+def _collect_colors(files: str, manifest: dict, recursive: bool, **kwargs):
+    """
+    Returns the paths of the files (a file or dir) and their colors, both None (after printing
+    the error) if there are none.
+    """
+    inpathtype = folders.check_path_type(files)
+    if inpathtype == folders.PathType.DIRECTORY and recursive:
+        entries = folders.scan(
+            files,
+            exclude=kwargs.get("exclude", None),
+            follow_symlinks=kwargs.get("follow_symlinks", False),
+        )
+        filelist = []
+        colors = []
+        for entry in entries:
+            filelist.append(entry.path)
+            colors.append(
+                get_color(
+                    entry.path,
+                    manifest,
+                    entry.stat() if manifest is not None else None,
+                )
+            )
+        return filelist, colors
+
+    if inpathtype == folders.PathType.DIRECTORY:
         print(
             Fore.RED
             + "Error: "
             + Fore.RESET
-            + f"Directory {save_path} doesn't exist and -n / --create-no-dirs is set."
+            + "To iterate over a directory set the -r flag."
         )
-        sysexit(1)
-
-    if move:
-        shutil.move(file, join(save_path, basename(file)))
+    elif inpathtype == folders.PathType.FILE:
+        return [files], [get_color(files, manifest)]
+    elif inpathtype in [folders.PathType.NEW_DIR, folders.PathType.NEW_FILE]:
+        print(Fore.RED + "Error: " + Fore.RESET + "Input cannot be empty.")
     else:
-        shutil.copy(file, join(save_path, basename(file)))
+        print(Fore.RED + "Error: " + Fore.RESET + f"An Error has ocurred. {files}")
+    return None, None
+
+
+def _write_palette(json_path: str, colors: list, amount: int, root: str, seed: int):
+    """
+    Clusters the colors into amount groups (see discover_palette) and writes them to the json.
+    """
+    with METRICS.timer("cluster"):
+        options = discover_palette(colors, amount, root, seed)
+    with open(json_path, "w", encoding="utf-8") as file:
+        # Laid out like a hand-written json, one group per line.
+        file.write(
+            "{\n"
+            + ",\n".join(
+                f"    {json.dumps(key)} : {json.dumps(value, separators=(',', ':'))}"
+                for key, value in options.items()
+            )
+            + "\n}\n"
+        )
+    print(f"Saved {len(options)} groups to {json_path}")
 
 
 def main(
@@ -93,16 +250,32 @@ def main(
 ):
     """
     Main function for executing the appropriate functions given the parameters.
+
+    Pass manifest=<path> to take the colors from a color manifest (see imageaverage) instead
+    of decoding the images. It's updated with any new colors and the new paths of the files.
+
+    Pass auto=<amount> to cluster the colors of the images into amount groups (folders under
+    auto_root, seeded by seed) instead of reading the json, which is written instead.
+
+    The files are placed in bulk once all are classified (see grouping.plan): copies as
+    copy_mode (reflink, hardlink or copy), moves as renames journaled to journal (default:
+    <json path>.journal). A move interrupted before is resumed from its journal instead.
+    dry_run only prints the plan. (--auto still writes the json)
+
+    Pass legacy_delta_e=True for the Delta-E of older versions. (see to_lab)
     """
-    move = kwargs.get("move", False)
-    recursive = kwargs.get("recursive", True)
     create_all_dirs = kwargs.get("create_all_dirs", False)
-    create_no_dirs = kwargs.get("create_no_dirs", False)
-
-    with open(json_path, "r", encoding="utf-8") as file:
-        options_dict = json.load(file)
+    manifest_path = kwargs.get("manifest", None)
+    auto = kwargs.get("auto", None)
+    place_options = {
+        "move": kwargs.get("move", False),
+        "copy_mode": kwargs.get("copy_mode", "reflink"),
+        "create_no_dirs": kwargs.get("create_no_dirs", False),
+        "dry_run": kwargs.get("dry_run", False),
+        "journal_path": kwargs.get("journal", None) or json_path + JOURNAL_SUFFIX,
+    }
 
-    if create_all_dirs and create_no_dirs:
+    if create_all_dirs and place_options["create_no_dirs"]:
         print(
             Fore.RED
             + "Error: "
@@ -111,49 +284,74 @@ def main(
         )
         sysexit(1)
 
-    if create_all_dirs:
-        for out_path in options_dict.keys():
+    manifest = None if manifest_path is None else load_manifest(manifest_path)
+
+    if place_options["move"] and isfile(place_options["journal_path"]):
+        print(f"Resuming the interrupted grouping of {place_options['journal_path']}.")
+        try:
+            _place(
+                plan.load_journal(place_options["journal_path"]),
+                manifest,
+                **place_options,
+            )
+        finally:
+            if manifest is not None and not place_options["dry_run"]:
+                save_manifest(manifest_path, manifest)
+        return
+
+    palette = (
+        None if auto else load_palette(json_path, kwargs.get("legacy_delta_e", False))
+    )
+
+    filelist, colors = _collect_colors(
+        files,
+        manifest,
+        kwargs.get("recursive", True),
+        exclude=kwargs.get("exclude", None),
+        follow_symlinks=kwargs.get("follow_symlinks", False),
+    )
+    if filelist is None:
+        return
+
+    if auto:
+        if len(colors) < auto:
+            print(
+                Fore.RED
+                + "Error: "
+                + Fore.RESET
+                + f"Can't find {auto} groups in {len(colors)} images."
+            )
+            sysexit(1)
+
+        _write_palette(
+            json_path,
+            colors,
+            auto,
+            kwargs.get("auto_root", "."),
+            kwargs.get("seed", 0),
+        )
+        palette = load_palette(json_path, kwargs.get("legacy_delta_e", False))
+
+    if create_all_dirs and not place_options["dry_run"]:
+        for out_path in palette.keys:
             makedirs(out_path, exist_ok=True)
 
         if fallback_path:
             makedirs(fallback_path, exist_ok=True)
 
-    inpathtype = folders.check_path_type(files)
-    if inpathtype == folders.PathType.DIRECTORY and recursive:
-        filelist = folders.list_all_contents(files)
-        for file in filelist:
-            _mainlogic(
-                file,
-                options_dict,
-                threshold,
-                fallback_path,
-                move=move,
-                create_no_dirs=create_no_dirs,
-            )
-    elif inpathtype == folders.PathType.DIRECTORY:
-        print(
-            Fore.RED
-            + "Error: "
-            + Fore.RESET
-            + "To iterate over a directory set the -r flag."
-        )
-    elif inpathtype == folders.PathType.FILE:
-        _mainlogic(
-            files,
-            options_dict,
-            threshold,
-            fallback_path,
-            move=move,
-            create_no_dirs=create_no_dirs,
-        )
-    elif inpathtype in [folders.PathType.NEW_DIR, folders.PathType.NEW_FILE]:
-        print(Fore.RED + "Error: " + Fore.RESET + "Input cannot be empty.")
-    else:
-        print(Fore.RED + "Error: " + Fore.RESET + f"An Error has ocurred. {files}")
+    save_paths = classify(colors, palette, threshold, fallback_path)
 
+    try:
+        _place(plan.make_plan(filelist, colors, save_paths), manifest, **place_options)
+    finally:
+        if manifest is not None and not place_options["dry_run"]:
+            save_manifest(manifest_path, manifest)
 
-if __name__ == "__main__":
 
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
     # region argparse
 
     parser = argparse.ArgumentParser(
@@ -166,7 +364,32 @@ if __name__ == "__main__":
     parser.add_argument(
         "json_path",
         metavar="json path",
-        help="Path to the json containing the paths : color value",
+        help="Path to the json containing the paths : color value. (Written with --auto)",
+    )
+
+    parser.add_argument(
+        "--auto",
+        metavar="",
+        type=int,
+        help="Finds the given amount of color groups in the images itself, writing them to \
+              the json instead of reading it.",
+    )
+
+    parser.add_argument(
+        "--auto-root",
+        metavar="",
+        type=str,
+        default=".",
+        help="Directory the folders of the --auto groups are created in. Default: .",
+    )
+
+    parser.add_argument(
+        "--seed",
+        metavar="",
+        type=int,
+        default=0,
+        help="Seed of --auto. The same images and seed always give the same groups. \
+              Default: 0",
     )
 
     parser.add_argument(
@@ -186,6 +409,13 @@ if __name__ == "__main__":
         help="Where to store files that are over the Delta-E threshold ",
     )
 
+    parser.add_argument(
+        "--legacy-delta-e",
+        action="store_true",
+        help="Computes the Delta-E like older versions did, from rgb values scaled to 0-1 \
+              instead of CIELAB, to reproduce old groupings and -t values (about 0-2).",
+    )
+
     parser.add_argument(
         "-r",
         action="store_true",
@@ -193,10 +423,55 @@ if __name__ == "__main__":
             and their contents recursively.",
     )
 
+    parser.add_argument(
+        "--exclude",
+        metavar="",
+        action="append",
+        help="Skips files / directories whose name or absolute path matches the glob pattern. \
+              Can be given multiple times.",
+    )
+
+    parser.add_argument(
+        "--follow-symlinks",
+        action="store_true",
+        help="Also scans symlinked directories (each directory only once).",
+    )
+
     parser.add_argument(
         "--move",
         action="store_true",
-        help="Moves the files instead of copying them.",
+        help="Moves the files instead of copying them. (Atomic renames, journaled so an \
+              interrupted run is resumed by running it again)",
+    )
+
+    parser.add_argument(
+        "--copy-mode",
+        choices=folders.COPY_MODES,
+        default="reflink",
+        help="How files are copied: reflink (shares the data where the filesystem supports \
+              it, else copy_file_range, else a copy), hardlink (falls back to reflink) or \
+              copy. Default: reflink",
+    )
+
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only prints where every file would go.",
+    )
+
+    parser.add_argument(
+        "--journal",
+        metavar="",
+        type=str,
+        help="Journal of --move. Default: <json path>.journal",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        metavar="",
+        type=str,
+        help="Color manifest (see imageaverage --manifest) to take the colors from. \
+              Images not in it are decoded and added.",
     )
 
     parser.add_argument(
@@ -214,17 +489,41 @@ if __name__ == "__main__":
         help="The opposite of -d. Disallows the creation of any directories.",
     )
 
-    args = parser.parse_args()
+    metrics.add_arguments(parser)
 
     # endregion
 
-    main(
-        args.path,
-        args.json_path,
-        args.fallback,
-        args.threshold,
-        recursive=args.r,
-        move=args.move,
-        create_all_dirs=args.create_all_dirs,
-        create_no_dirs=args.create_no_dirs,
-    )
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    args = build_parser().parse_args(argv)
+
+    with metrics.instrumented(args.metrics, args.profile):
+        main(
+            args.path,
+            args.json_path,
+            args.fallback,
+            args.threshold,
+            recursive=args.r,
+            move=args.move,
+            create_all_dirs=args.create_all_dirs,
+            create_no_dirs=args.create_no_dirs,
+            manifest=args.manifest,
+            auto=args.auto,
+            exclude=args.exclude,
+            follow_symlinks=args.follow_symlinks,
+            auto_root=args.auto_root,
+            seed=args.seed,
+            copy_mode=args.copy_mode,
+            dry_run=args.dry_run,
+            legacy_delta_e=args.legacy_delta_e,
+            journal=args.journal,
+        )
+
+
+if __name__ == "__main__":
+    cli()
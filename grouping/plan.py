@@ -0,0 +1,172 @@
+"""
+Module for placing grouped images: planning where every file goes, then executing the plan in
+bulk, creating every directory once.
+
+Moves are atomic renames, recorded in a journal (NDJSON) so an interrupted run can be resumed:
+the plan first, one {"src", "dst", "rgb"} line per file, then a {"done": <index>} line per
+finished move. The journal is removed once the plan is done.
+"""
+
+import json
+from os import fsync, makedirs, remove, replace
+from os.path import abspath, basename, dirname, isdir, isfile, join, lexists
+from sys import exit as sysexit
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from colorama import Fore
+
+from shared import folders
+from shared.metrics import METRICS
+
+
+class Placement(NamedTuple):
+    """
+    A file of the plan, where it goes and its color.
+    """
+
+    src: str
+    dst: str
+    rgb: Tuple[int, int, int]
+
+
+def make_plan(filelist: list, colors: list, save_paths: list) -> List[Placement]:
+    """
+    Returns the placements of the classified files. Files without a save path (over the
+    threshold without a fallback) and files already at their destination are left out.
+    """
+    plan = []
+    for file, color, save_path in zip(filelist, colors, save_paths):
+        if save_path is None:
+            continue
+        dst = join(save_path, basename(file))
+        if abspath(dst) != abspath(file):
+            plan.append(Placement(file, dst, tuple(color)))
+    return plan
+
+
+def print_plan(plan: List[Placement], action: str):
+    """
+    Prints what executing the plan would do. (--dry-run)
+    """
+    for placement in plan:
+        print(f"{action} {placement.src} -> {placement.dst}")
+
+    directories = {dirname(abspath(placement.dst)) for placement in plan}
+    new = sum(not isdir(directory) for directory in directories)
+    print(
+        f"Would {action} {len(plan)} files into {len(directories)} directories "
+        + f"({new} new)."
+    )
+
+
+def create_directories(plan: List[Placement], create_no_dirs: bool = False):
+    """
+    Creates the directories of the plan, each once, before any file is placed. With
+    create_no_dirs missing directories are an error instead.
+    """
+    for directory in sorted({dirname(abspath(placement.dst)) for placement in plan}):
+        if isdir(directory):
+            continue
+        if create_no_dirs:
+            print(
+                Fore.RED
+                + "Error: "
+                + Fore.RESET
+                + f"Directory {directory} doesn't exist and -n / --create-no-dirs is set."
+            )
+            sysexit(1)
+        makedirs(directory, exist_ok=True)
+
+
+def write_journal(journal_path: str, plan: List[Placement]):
+    """
+    Starts the journal with the plan, synced to disk before any file is moved. Replaces the
+    old journal only once it's completely written.
+    """
+    tmp_path = journal_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        for placement in plan:
+            file.write(json.dumps(placement._asdict()) + "\n")
+        file.flush()
+        fsync(file.fileno())
+    replace(tmp_path, journal_path)
+
+
+def load_journal(journal_path: str) -> List[Placement]:
+    """
+    Returns the placements of the journal that aren't done yet.
+    """
+    plan = []
+    done = set()
+    with open(journal_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may have been cut off by the interruption.
+                continue
+            if "done" in record:
+                done.add(record["done"])
+            else:
+                plan.append(
+                    Placement(record["src"], record["dst"], tuple(record["rgb"]))
+                )
+
+    return [placement for idx, placement in enumerate(plan) if idx not in done]
+
+
+def execute(
+    plan: List[Placement], move: bool = False, copy_mode: str = "reflink", **kwargs
+) -> Iterator[Placement]:
+    """
+    Places the files of the plan, yielding every placement once it's done.
+
+    Copies use folders.place_file with copy_mode. Moves use folders.move_file and are
+    journaled to journal_path if given. Moves whose source is gone but whose destination
+    exists count as done, as the run may have been interrupted right after them. Files that
+    are gone entirely are skipped with a warning.
+    """
+    journal_path: Optional[str] = kwargs.get("journal_path", None)
+
+    journal = None
+    if move and journal_path is not None:
+        write_journal(journal_path, plan)
+        # pylint: disable=consider-using-with
+        journal = open(journal_path, "a", encoding="utf-8")
+
+    try:
+        for idx, placement in enumerate(plan):
+            if move and not lexists(placement.src) and isfile(placement.dst):
+                method = "resumed"
+            elif not lexists(placement.src):
+                print(
+                    Fore.YELLOW
+                    + "Warning: "
+                    + Fore.RESET
+                    + f"{placement.src} doesn't exist anymore, skipping it."
+                )
+                method = None
+            else:
+                with METRICS.timer("move" if move else "copy"):
+                    if move:
+                        method = folders.move_file(
+                            placement.src, placement.dst, copy_mode
+                        )
+                    else:
+                        method = folders.place_file(
+                            placement.src, placement.dst, copy_mode
+                        )
+            if journal is not None:
+                journal.write(json.dumps({"done": idx}) + "\n")
+                journal.flush()
+
+            if method is not None:
+                METRICS.count("images_grouped")
+                METRICS.count(f"placed_by_{method}")
+                yield placement
+    finally:
+        if journal is not None:
+            journal.close()
+
+    if journal is not None:
+        remove(journal_path)
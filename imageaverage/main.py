@@ -3,15 +3,24 @@ Takes in a file / directory and get the average color of each file.
 """
 
 import argparse
-from typing import Tuple
+import csv
+import json
+import sys
+from math import ceil, sqrt
+from time import perf_counter
+from io import StringIO
+from typing import TYPE_CHECKING, Tuple
+from os import devnull, dup2, O_WRONLY
+from os import open as open_fd
+from os.path import isdir, join, abspath, dirname, getsize
 from sys import path
 from sys import exit as sysexit
-from os.path import isdir, splitext, join, abspath, dirname
 
-from PIL import Image
-import numpy as np
 from colorama import Fore
 
+if TYPE_CHECKING:
+    from PIL import Image
+
 path.append(abspath(join(dirname(__file__), "..")))
 
 # pylint: disable=wrong-import-position
@@ -20,25 +29,279 @@ from shared.colorconversion import (
     rgb_to_hex,
 )
 
-from shared import folders
+from shared import folders, memory, metrics
+from shared.metrics import METRICS
+from shared.cache import ColorCache, DEFAULT_MAX_ENTRIES
+from shared.stats import image_stats
+from shared.manifest import load_manifest, save_manifest, make_record
 
 # pylint: enable=wrong-import-position
 
+# Columns of the csv / tsv output.
+RECORD_FIELDS = ("path", "red", "green", "blue", "hex", "L", "a", "b")
+
+# Pixel budget used by --fast. Decodes 640x640 covers at 1/2 and 4K wallpapers at 1/8 scale.
+FAST_MAX_PIXELS = 65_536
+
+# Max per-channel (0-255) difference of a reduced decode to the exact average.
+# Averaging blocks preserves the mean as long as every block is weighted by the amount of
+# pixels it covers, which average_reduced does for the partial blocks of the last column / row.
+# What's left is rounding and, for JPEGs, the partial DCT blocks of the last column / row
+# also being decoded from the padding the encoder added, which only shifts pixels that are
+# already weighted down. Measured worst case on noise, gradient, palette and edge strip test
+# images (e.g. a 3 px white edge of a 300x20000 image) is 1.
+FAST_MAX_ERROR = 2
 
-def get_average_color(image_path: str) -> Tuple[int, int, int]:
+
+def open_reduced(
+    image_path: str, max_pixels: int = None
+) -> Tuple["Image.Image", Tuple[float, float]]:
     """
-    Gets the average color of an image and returns it as an rgb value.
+    Opens an image, decoding it at a reduced scale so it has about max_pixels pixels.
 
-    Will auto-convert the file to RGB.
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale directly by libjpeg (draft mode), any remaining
+    reduction is done by averaging blocks of pixels. Returns the image and its extent, the size
+    of the original image in pixels of the reduced one. If it isn't the size of the image, the
+    last column / row only partly covers the original. (see average_reduced)
     """
+    # pylint: disable=import-outside-toplevel
+    # Pillow is only imported once an image has to be decoded, not for cached colors.
+    from PIL import Image
+
     img = Image.open(image_path)
-    img = img.convert("RGB")  # Ensure image is in RGB mode
-    pixels = np.array(img)
-    avg_color = np.mean(pixels, axis=(0, 1))
-    rounded_avg_color = tuple(map(round, avg_color))
+    extent = img.size
+    if not max_pixels or img.width * img.height <= max_pixels:
+        return img, extent
+
+    scale = sqrt(img.width * img.height / max_pixels)
+    if img.format == "JPEG":
+        # Picks the smallest DCT scale that still is at least the requested size.
+        drafted = img.draft("RGB", (ceil(img.width / scale), ceil(img.height / scale)))
+        if drafted is not None:
+            extent = drafted[1][2:]
+
+    factor = int(sqrt(img.width * img.height / max_pixels))
+    if factor > 1:
+        # Averaging palette indices / 1 bit pixels means nothing and Image.reduce refuses
+        # most of these modes, so they're reduced as RGB.
+        if img.mode in ("1", "P", "PA") or img.mode.startswith("I;16"):
+            img = img.convert("RGB")
+        img = img.reduce(factor)
+        extent = (extent[0] / factor, extent[1] / factor)
+
+    return img, extent
+
+
+def average_reduced(
+    img: "Image.Image", extent: Tuple[float, float]
+) -> Tuple[int, int, int]:
+    """
+    Gets the average color of an image returned by open_reduced, weighting its last column /
+    row by how much of the original they cover.
+    """
+    width, height = img.size
+    if extent == (width, height):
+        return image_stats(img).average
+
+    # Weights of the last column / row. (1 if they're whole)
+    last_x = extent[0] - (width - 1)
+    last_y = extent[1] - (height - 1)
+    regions = (
+        ((0, 0, width - 1, height - 1), 1),
+        ((width - 1, 0, width, height - 1), last_x),
+        ((0, height - 1, width - 1, height), last_y),
+        ((width - 1, height - 1, width, height), last_x * last_y),
+    )
+
+    total = 0.0
+    sums = [0.0, 0.0, 0.0]
+    for box, weight in regions:
+        if box[0] == box[2] or box[1] == box[3]:
+            continue
+        stats = image_stats(img.crop(box))
+        total += weight * stats.pixels
+        for channel, mean in enumerate(stats.mean):
+            sums[channel] += weight * stats.pixels * mean
+
+    return tuple(round(value / total) for value in sums)
+
+
+def average_of_image(img: "Image.Image") -> Tuple[int, int, int]:
+    """
+    Gets the average color of an already opened image as an rgb value.
+    """
+    return image_stats(img).average
+
+
+def _decode_average(
+    image_path: str, max_pixels: int = None, max_memory: int = None
+) -> Tuple[Tuple[int, int, int], bool]:
+    """
+    Decodes the image and returns its average color and whether the memory budget made it
+    decode at a reduced scale. (see shared.memory)
+    """
+    img, extent = open_reduced(image_path, max_pixels)
+    with img:
+        if extent != img.size:
+            return average_reduced(img, extent), False
+
+        drafted = bool(max_memory) and memory.fit_draft(img, max_memory)
+        return (
+            image_stats(img, strip_rows=memory.strip_rows(img, max_memory)).average,
+            drafted,
+        )
+
+
+def get_average_color(
+    image_path: str,
+    cache: ColorCache = None,
+    max_pixels: int = None,
+    stat_result=None,
+    max_memory: int = None,
+) -> Tuple[int, int, int]:
+    """
+    Gets the average color of an image and returns it as an rgb value.
+
+    Will auto-convert the file to RGB. If a cache is given it is checked first and updated
+    with the result. Setting max_pixels trades accuracy (see FAST_MAX_ERROR) for speed.
+    A known stat_result of the file saves the cache from calling os.stat.
+
+    max_memory (bytes) bounds the memory used for the image, see shared.memory. JPEGs too
+    large for it are decoded at a reduced scale, whose colors aren't cached.
+    """
+    variant = max_pixels or 0
+    if cache is not None:
+        cached = cache.get(image_path, stat_result, variant=variant)
+        if cached is not None:
+            METRICS.count("cache_hits")
+            return cached
+        METRICS.count("cache_misses")
+
+    with METRICS.timer("decode"):
+        rounded_avg_color, drafted = _decode_average(image_path, max_pixels, max_memory)
+
+    if METRICS.enabled:
+        METRICS.count("images_decoded")
+        METRICS.count(
+            "bytes_read",
+            getsize(image_path) if stat_result is None else stat_result.st_size,
+        )
+
+    if cache is not None and not drafted:
+        cache.put(image_path, rounded_avg_color, stat_result, variant=variant)
+
     return rounded_avg_color
 
 
+def _timed_average(
+    image_path: str, max_pixels: int, max_memory: int
+) -> Tuple[Tuple[int, int, int], bool, float]:
+    """
+    Worker of average_colors. Returns the color, whether it was decoded at a reduced scale to
+    fit max_memory and the time it took to compute it.
+    """
+    start = perf_counter()
+    color, drafted = _decode_average(image_path, max_pixels, max_memory)
+    return color, drafted, perf_counter() - start
+
+
+def _iter_pool(image_paths: list, jobs: int, **kwargs):
+    """
+    Yields the color of every image and whether it was drafted (see _timed_average) in order,
+    computed by a pool of jobs workers. Unless no_warnings is set, the time spent decoding vs.
+    the overhead of the pool is reported.
+    """
+    threads = kwargs.get("threads", False)
+
+    # pylint: disable=import-outside-toplevel
+    from concurrent import futures
+
+    start = perf_counter()
+    busy = 0.0
+    executor = futures.ThreadPoolExecutor if threads else futures.ProcessPoolExecutor
+
+    with executor(jobs) as pool:
+        for color, drafted, elapsed in pool.map(
+            _timed_average,
+            image_paths,
+            [kwargs.get("max_pixels", None)] * len(image_paths),
+            [kwargs.get("max_memory", None)] * len(image_paths),
+            # A few chunks per worker amortize the IPC while still balancing the load.
+            chunksize=max(1, min(64, len(image_paths) // (jobs * 4))),
+        ):
+            busy += elapsed
+            if not threads:
+                # The workers' own metrics stay in their processes.
+                METRICS.add_time("decode", elapsed)
+                METRICS.count("images_decoded")
+            yield color, drafted
+
+    wall = perf_counter() - start
+    if not kwargs.get("no_warnings", False):
+        overhead = max(0.0, wall * jobs - busy)
+        print(
+            f"Averaged {len(image_paths)} images with {jobs} "
+            + ("threads" if threads else "processes")
+            + f" in {wall:.2f}s: {busy / len(image_paths) * 1000:.2f}ms decoding and "
+            + f"{overhead / len(image_paths) * 1000:.2f}ms pool overhead per image "
+            + f"({overhead / (wall * jobs) * 100:.0f}% of worker time).",
+            # Looked up now, so redirections (e.g. by the daemon) apply.
+            file=sys.stderr,
+        )
+
+
+def iter_average_colors(filelist: list, jobs: int, **kwargs):
+    """
+    Yields the average colors of all files in order, computed by a pool of jobs workers.
+
+    Cached colors are looked up beforehand (using the stat results in stats if given), only
+    the misses are sent to the pool. Colors are yielded as soon as they (and all before them)
+    are done. Unless no_warnings is set, the
+    time spent decoding vs. the overhead of the pool is reported.
+    """
+    cache = kwargs.get("cache", None)
+    max_pixels = kwargs.get("max_pixels", None)
+    stats = kwargs.get("stats", None) or [None] * len(filelist)
+
+    colors = [None] * len(filelist)
+    misses = []
+    for idx, file in enumerate(filelist):
+        if cache is not None:
+            colors[idx] = cache.get(file, stats[idx], variant=max_pixels or 0)
+        if colors[idx] is None:
+            misses.append(idx)
+
+    if cache is not None:
+        METRICS.count("cache_hits", len(filelist) - len(misses))
+        METRICS.count("cache_misses", len(misses))
+
+    if not misses:
+        yield from colors
+        return
+
+    done = 0
+    # Driven by the pool rather than zipped with the misses, so it runs to its end, shutting
+    # the pool down and reporting its overhead.
+    pooled = _iter_pool([filelist[idx] for idx in misses], jobs, **kwargs)
+    for miss, (color, drafted) in enumerate(pooled):
+        idx = misses[miss]
+        if cache is not None and not drafted:
+            cache.put(filelist[idx], color, stats[idx], variant=max_pixels or 0)
+        # The cached colors before it, then the new one.
+        yield from colors[done:idx]
+        yield color
+        done = idx + 1
+    yield from colors[done:]
+
+
+def average_colors(filelist: list, jobs: int, **kwargs) -> list:
+    """
+    Gets the average colors of all files using a pool of jobs workers, keeping their order.
+    See iter_average_colors.
+    """
+    return list(iter_average_colors(filelist, jobs, **kwargs))
+
+
 def _modify_inner(value: int, mod: int, color: str, no_warnings: bool) -> int:
     """
     Internal logic of the modify function. For changing an RGB channel.
@@ -82,40 +345,158 @@ def modify(
     return tuple(return_colors)
 
 
-def main(
-    files, mod: int, recursive: bool = False, no_warnings: bool = False, **kwargs
-) -> list:
+def _average_results(
+    files, recursive: bool, no_warnings: bool, use_stat: bool, **kwargs
+):
     """
-    Main function for executing the appropriate functions given the parameters.
+    Returns an iterable of the path, average color and stat result (if use_stat is set) of
+    every image. See iter_colors for the options, others are ignored.
     """
-    returnoutput = []
-    if isdir(files) and recursive:
-        filelist = folders.list_all_contents(files)
-        for file in filelist:
-            # Check if the file ends with .jpg or .png
-            if splitext(file)[1] in [".jpg", ".png"]:
-                colors = get_average_color(file)
-                colors = modify(colors, mod, no_warnings, **kwargs)
-                returnoutput.append(colors)
-    elif not isdir(files):
-        colors = get_average_color(files)
-        colors = modify(colors, mod, no_warnings, **kwargs)
-        returnoutput.append(colors)
-    elif isdir(files) and not recursive:
+    average_options = {
+        "cache": kwargs.get("cache", None),
+        "max_pixels": kwargs.get("max_pixels", None),
+        "max_memory": kwargs.get("max_memory", None),
+    }
+    jobs = kwargs.get("jobs", 1)
+
+    if not isdir(files):
+        return [(files, get_average_color(files, **average_options), None)]
+    if not recursive:
         print(
             Fore.RED
             + "Error: "
             + Fore.RESET
             + "To iterate over a directory set the -r flag."
         )
-    else:
-        sysexit(1)
+        return []
 
-    return returnoutput
+    entries = folders.scan(
+        files,
+        exclude=kwargs.get("exclude", None),
+        follow_symlinks=kwargs.get("follow_symlinks", False),
+        sort=kwargs.get("sort", False),
+    )
 
+    if jobs > 1:
+        # The pool needs all paths up front.
+        entries = list(entries)
+        filelist = [entry.path for entry in entries]
+        stats = [entry.stat() if use_stat else None for entry in entries]
+        # Driven by the colors rather than zipped with the paths, so the generator runs to
+        # its end, shutting the pool down and reporting its overhead.
+        return (
+            (filelist[idx], color, stats[idx])
+            for idx, color in enumerate(
+                iter_average_colors(
+                    filelist,
+                    jobs,
+                    threads=kwargs.get("threads", False),
+                    no_warnings=no_warnings,
+                    stats=stats,
+                    **average_options,
+                )
+            )
+        )
 
-if __name__ == "__main__":
+    return (
+        (
+            entry.path,
+            get_average_color(
+                entry.path,
+                stat_result=entry.stat() if use_stat else None,
+                **average_options,
+            ),
+            entry.stat() if use_stat else None,
+        )
+        for entry in entries
+    )
+
+
+def iter_colors(
+    files, mod: int, recursive: bool = False, no_warnings: bool = False, **kwargs
+):
+    """
+    Yields the path and the (modified) average color of every image as soon as it's done.
 
+    Pass cache=ColorCache(...) to look colors up in / store them to the on-disk cache,
+    max_pixels to use the reduced decode of open_reduced, max_memory to bound the memory per
+    image (see shared.memory) and jobs to average directories in parallel. (Using threads
+    instead of processes if threads is set)
+
+    Pass manifest=<path> to add the (unmodified) colors to a color manifest for grouping. It's
+    written once all colors were yielded.
+
+    Directories are scanned as the images are processed (see folders.scan), skipping paths
+    matching the exclude patterns, following symlinks if follow_symlinks is set and in a
+    stable order if sort is set.
+    """
+    manifest_path = kwargs.pop("manifest", None)
+
+    # The stat results of the scan save the cache / manifest from calling os.stat.
+    results = _average_results(
+        files,
+        recursive,
+        no_warnings,
+        kwargs.get("cache", None) is not None or manifest_path is not None,
+        **kwargs,
+    )
+
+    manifest = None if manifest_path is None else load_manifest(manifest_path)
+
+    for file, colors, stat_result in results:
+        if manifest is not None:
+            manifest[abspath(file)] = make_record(file, colors, stat_result)
+        METRICS.count("images_processed")
+        yield file, modify(colors, mod, no_warnings, **kwargs)
+
+    if manifest is not None:
+        save_manifest(manifest_path, manifest)
+
+
+def main(
+    files, mod: int, recursive: bool = False, no_warnings: bool = False, **kwargs
+) -> list:
+    """
+    Main function for executing the appropriate functions given the parameters.
+    Returns the colors of all images. See iter_colors for the options.
+    """
+    return [
+        color for _, color in iter_colors(files, mod, recursive, no_warnings, **kwargs)
+    ]
+
+
+def format_record(image_path: str, color: Tuple[int, int, int], fmt: str) -> str:
+    """
+    Formats the result of an image as a line of ndjson, csv or tsv.
+
+    ndjson lines have the path, rgb and lab of a color manifest record (without size and
+    mtime) plus the hex value, so they can be used as a manifest.
+    """
+    # pylint: disable=import-outside-toplevel
+    from shared.deltae import rgb_to_lab
+
+    lab = [round(value, 4) for value in rgb_to_lab(color).tolist()]
+    if fmt == "ndjson":
+        return json.dumps(
+            {
+                "path": abspath(image_path),
+                "rgb": list(color),
+                "hex": rgb_to_hex(color),
+                "lab": lab,
+            }
+        )
+
+    buffer = StringIO()
+    csv.writer(
+        buffer, delimiter="," if fmt == "csv" else "\t", lineterminator=""
+    ).writerow([abspath(image_path), *color, rgb_to_hex(color), *lab])
+    return buffer.getvalue()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
     # region argparse
 
     parser = argparse.ArgumentParser(
@@ -160,6 +541,14 @@ if __name__ == "__main__":
         "--hex", action="store_true", help="Converts the output value from RGB to hex."
     )
 
+    parser.add_argument(
+        "--format",
+        choices=("plain", "ndjson", "csv", "tsv"),
+        default="plain",
+        help="Output format. ndjson, csv and tsv have a record of path, rgb, hex and Lab per \
+              image (ndjson can be used as color manifest). Default: plain",
+    )
+
     parser.add_argument(
         "-r",
         action="store_true",
@@ -171,7 +560,132 @@ if __name__ == "__main__":
         "--no-warnings", action="store_true", help="Omits any warnings."
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--exclude",
+        metavar="",
+        action="append",
+        help="Skips files / directories whose name or absolute path matches the glob pattern. \
+              Can be given multiple times.",
+    )
+
+    parser.add_argument(
+        "--follow-symlinks",
+        action="store_true",
+        help="Also scans symlinked directories (each directory only once).",
+    )
+
+    parser.add_argument(
+        "--sort",
+        action="store_true",
+        help="Processes the files of every directory sorted by name, for a stable output order.",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="",
+        type=int,
+        default=1,
+        help="Amount of images to average in parallel with -r. Default: 1",
+    )
+
+    parser.add_argument(
+        "--threads",
+        action="store_true",
+        help="Uses threads instead of processes for -j. (Pillow decodes without the GIL)",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        metavar="",
+        type=str,
+        help="Adds the colors to this color manifest. (NDJSON, see grouping --manifest)",
+    )
+
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help=f"Decodes images at a reduced scale. Results may be off by up to \
+              {FAST_MAX_ERROR} per channel. Same as --max-pixels {FAST_MAX_PIXELS}",
+    )
+
+    parser.add_argument(
+        "--max-pixels",
+        metavar="",
+        type=int,
+        help="Decodes images at a reduced scale having about this many pixels.",
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        metavar="",
+        type=memory.parse_size,
+        help="Memory budget per image (e.g. 512M). JPEGs exceeding it are decoded at a \
+              reduced scale, other formats are converted in strips of rows. (Pillow always \
+              decodes them whole)",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither reads from nor writes to the on-disk color cache.",
+    )
+
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Ignores cached colors, recomputes them and updates the cache.",
+    )
+
+    parser.add_argument(
+        "--cache-file",
+        metavar="",
+        type=str,
+        help="Path to the color cache. Default: $XDG_CACHE_HOME/walltune/colors.sqlite",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        metavar="",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help=f"Max amount of cached colors before the least recently used are evicted. \
+              Default: {DEFAULT_MAX_ENTRIES}",
+    )
+
+    parser.add_argument(
+        "--cache-hash",
+        action="store_true",
+        help="Also checks a hash of the file contents before using a cached color.",
+    )
+
+    metrics.add_arguments(parser)
+
+    # endregion
+
+    return parser
+
+
+def _format_output(image_path: str, color: Tuple[int, int, int], args) -> str:
+    """
+    Formats the result of an image as asked for by the arguments of the CLI.
+    """
+    if args.format != "plain":
+        return format_record(image_path, color, args.format)
+    if args.hex:
+        return rgb_to_hex(color)
+    return str(color)
+
+
+def cli(argv: list = None, cache: ColorCache = None, no_cache: bool = False):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+
+    If a cache is passed in (e.g. by the daemon) it's used instead of opening the on-disk cache,
+    unless the arguments ask for a specific cache. no_cache disables the cache like --no-cache.
+    """
+    args = build_parser().parse_args(argv)
+    args.no_cache = args.no_cache or no_cache
 
     if args.red is None:
         args.red = args.mod
@@ -182,20 +696,58 @@ if __name__ == "__main__":
     if args.blue is None:
         args.blue = args.mod
 
-    # endregion
+    if args.fast and args.max_pixels is None:
+        args.max_pixels = FAST_MAX_PIXELS
+
+    own_cache = not args.no_cache and (
+        cache is None or args.cache_file or args.rebuild_cache or args.cache_hash
+    )
+
+    color_cache = None
+    if own_cache:
+        color_cache = ColorCache(
+            args.cache_file,
+            args.cache_size,
+            use_hash=args.cache_hash,
+            refresh=args.rebuild_cache,
+        )
+    elif not args.no_cache:
+        color_cache = cache
+
+    with metrics.instrumented(args.metrics, args.profile):
+        if args.format in ("csv", "tsv"):
+            print(("," if args.format == "csv" else "\t").join(RECORD_FIELDS))
+
+        try:
+            # Every record is printed as soon as it's done.
+            for file, color in iter_colors(
+                args.path,
+                args.mod,
+                args.r,
+                args.no_warnings,
+                red=args.red,
+                green=args.green,
+                blue=args.blue,
+                cache=color_cache,
+                max_pixels=args.max_pixels,
+                max_memory=args.max_memory,
+                jobs=args.jobs,
+                threads=args.threads,
+                manifest=args.manifest,
+                exclude=args.exclude,
+                follow_symlinks=args.follow_symlinks,
+                sort=args.sort,
+            ):
+                print(_format_output(file, color, args), flush=True)
+        except BrokenPipeError:
+            # The reader stopped early (e.g. head). Keep Python from failing on the final
+            # flush of stdout.
+            dup2(open_fd(devnull, O_WRONLY), sys.stdout.fileno())
+            sysexit(1)
+        finally:
+            if own_cache:
+                color_cache.close()
 
-    output = main(
-        args.path,
-        args.mod,
-        args.r,
-        args.no_warnings,
-        red=args.red,
-        green=args.green,
-        blue=args.blue,
-    )
-
-    for o in output:
-        if args.hex:
-            print(rgb_to_hex(o))
-        else:
-            print(o)
+
+if __name__ == "__main__":
+    cli()
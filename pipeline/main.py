@@ -0,0 +1,458 @@
+"""
+A CLI fusing spotify_api, adjustbrightness and grouping into a single process.
+
+Every cover is downloaded into memory, decoded once, adjusted, averaged and classified, and
+written once into its group folder. Covers shared by several songs go through the pipeline
+once and are hard linked to the names of the other songs, or saved once with --dedupe. (Named
+like spotify_api does) The stages run in their own threads, connected by bounded
+queues, so downloading, image processing and writing overlap.
+"""
+
+import argparse
+from io import BytesIO
+from os import makedirs, remove, replace
+from os.path import join, abspath, dirname, exists, isdir
+from queue import Queue
+from sys import path
+from sys import exit as sysexit
+from threading import Thread, Lock
+
+from colorama import Fore
+
+path.append(abspath(join(dirname(__file__), "..")))
+
+# pylint: disable=wrong-import-position
+
+from adjustbrightness.main import adjustbrightness, meetcondition
+from grouping.main import load_palette, classify
+from spotify_api.main import DEFAULT_AMOUNT, get_client, fetch_tracks, _plan_downloads
+
+from shared.stats import image_stats
+from shared.download import fetch, make_session
+from shared.folders import link_or_copy, free_path
+from shared import metrics
+from shared.metrics import METRICS
+
+# pylint: enable=wrong-import-position
+
+# Marks the end of a queue.
+_DONE = object()
+
+
+def _stage(worker, in_queue: Queue, out_queue: Queue, threads: int) -> list:
+    """
+    Starts threads running worker on the items of in_queue and putting its results (if not
+    None) on out_queue. Once all threads are done, _DONE is put on out_queue.
+    """
+    remaining = [threads]
+    lock = Lock()
+
+    def run():
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                # Leave it for the other threads of this stage.
+                in_queue.put(_DONE)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last and out_queue is not None:
+                    out_queue.put(_DONE)
+                return
+
+            try:
+                result = worker(item)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(Fore.RED + "Error: " + Fore.RESET + str(e))
+                continue
+
+            if result is not None and out_queue is not None:
+                out_queue.put(result)
+
+    started = [Thread(target=run, daemon=True) for _ in range(threads)]
+    for thread in started:
+        thread.start()
+    return started
+
+
+def _download(job: tuple, session) -> tuple:
+    """
+    Downloads the (url, *names) job into memory.
+    """
+    url, *names = job
+    return url, names, fetch(session, url)
+
+
+def _process(item: tuple, **kwargs) -> tuple:
+    """
+    Decodes the cover once, adjusts its brightness and classifies it. Adjusted covers are
+    encoded again, with the save_options.
+    """
+    # pylint: disable=import-outside-toplevel
+    # Pillow is only imported once a cover has to be decoded, not for --help.
+    from PIL import Image
+
+    url, names, data = item
+
+    with METRICS.timer("decode"):
+        img = Image.open(BytesIO(data))
+        img.load()
+
+    with METRICS.timer("average"):
+        stats = image_stats(img)
+
+    modified = meetcondition(
+        stats.luma, kwargs["condition"], kwargs.get("is_max", False)
+    )
+    if modified:
+        with METRICS.timer("adjust"):
+            img = adjustbrightness(img, kwargs["mod"])
+        # The colors changed, so the average has to be taken from the adjusted image.
+        with METRICS.timer("average"):
+            stats = image_stats(img)
+        with METRICS.timer("encode"):
+            buffer = BytesIO()
+            img.save(buffer, "JPEG", **kwargs.get("save_options", {}))
+            data = buffer.getvalue()
+
+    color = stats.average
+
+    save_path = classify(
+        [color],
+        kwargs["palette"],
+        kwargs["threshold"],
+        kwargs["fallback_path"],
+    )[0]
+
+    # Unchanged covers are written as downloaded, without re-encoding them.
+    return url, names, save_path, data
+
+
+def _write(item: tuple, **kwargs) -> str:
+    """
+    Writes the cover into its group folder and links it to the names of the other songs
+    sharing it. (links: url -> names of every song)
+
+    Of the names, the first one not holding a different file is used, and nothing is written
+    if it already holds the cover. (see folders.free_path) The cover is written under a
+    temporary name and renamed once complete, so it's never left partially written.
+    Returns its path, None if it wasn't saved.
+    """
+    url, names, save_path, data = item
+
+    if save_path is None:
+        print(
+            Fore.YELLOW
+            + "Warning: "
+            + Fore.RESET
+            + f"{names[0]} is over the Delta-E threshold and no fallback is set."
+        )
+        return None
+
+    if not isdir(save_path):
+        if kwargs.get("create_no_dirs", False):
+            print(
+                Fore.RED
+                + "Error: "
+                + Fore.RESET
+                + f"Directory {save_path} doesn't exist and -n / --create-no-dirs is set."
+            )
+            return None
+        makedirs(save_path, exist_ok=True)
+
+    output, write = free_path(data, *(join(save_path, name) for name in names))
+    if write:
+        tmp_path = output + ".part"
+        with METRICS.timer("write"):
+            try:
+                with open(tmp_path, "wb") as file:
+                    file.write(data)
+                replace(tmp_path, output)
+            finally:
+                if exists(tmp_path):
+                    remove(tmp_path)
+    METRICS.count("images_processed")
+    print(f"Saved {output}")
+
+    with METRICS.timer("link"):
+        for others in kwargs.get("links", {}).get(url, ()):
+            other, write = free_path(data, *(join(save_path, name) for name in others))
+            if write:
+                link_or_copy(output, other)
+            print(f"Saved {other}")
+
+    return output
+
+
+def _run_stages(
+    jobs: list, process_options: dict, write_options: dict, **kwargs
+) -> int:
+    """
+    Runs the jobs through concurrency download, workers processing and one writing thread,
+    connected by queues of queue_size. Returns the amount of covers saved.
+    """
+    concurrency = kwargs.get("concurrency", 8)
+    queue_size = kwargs.get("queue_size", 16)
+
+    job_queue = Queue()
+    for job in jobs:
+        job_queue.put(job)
+    job_queue.put(_DONE)
+
+    image_queue = Queue(maxsize=queue_size)
+    write_queue = Queue(maxsize=queue_size)
+    saved_queue = Queue()
+
+    session = make_session(concurrency)
+
+    threads = (
+        _stage(
+            lambda job: _download(job, session),
+            job_queue,
+            image_queue,
+            concurrency,
+        )
+        + _stage(
+            lambda item: _process(item, **process_options),
+            image_queue,
+            write_queue,
+            kwargs.get("workers", 2),
+        )
+        + _stage(
+            lambda item: _write(item, **write_options), write_queue, saved_queue, 1
+        )
+    )
+
+    for thread in threads:
+        thread.join()
+
+    # Covers that failed to download, process or write never reach saved_queue, which holds
+    # the saved ones and _DONE.
+    return saved_queue.qsize() - 1
+
+
+def main(json_path: str, amount: int, offset: int, playlist: str, **kwargs):
+    """
+    Main function fetching the covers and running them through the pipeline.
+    """
+    process_options = {
+        "palette": load_palette(json_path, kwargs.get("legacy_delta_e", False)),
+        "condition": kwargs.get("condition", 255),
+        "mod": kwargs.get("mod", 1),
+        "is_max": kwargs.get("is_max", False),
+        "threshold": kwargs.get("threshold", 1000),
+        "fallback_path": kwargs.get("fallback_path", None),
+        "save_options": kwargs.get("save_options", {}),
+    }
+
+    with METRICS.timer("api"):
+        results = fetch_tracks(
+            get_client(),
+            amount,
+            offset,
+            playlist,
+            concurrency=kwargs.get("concurrency", 8),
+        )
+
+    # Only the file names are planned, the folders are known once the covers are classified.
+    jobs, links, _ = _plan_downloads(results, "", None, kwargs.get("dedupe", False))
+    names_of_url = {}
+    for url, _, names in links:
+        names_of_url.setdefault(url, []).append(names)
+
+    write_options = {
+        "create_no_dirs": kwargs.get("create_no_dirs", False),
+        "links": names_of_url,
+    }
+
+    print("Total fetched:", _run_stages(jobs, process_options, write_options, **kwargs))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
+    # region argparse
+
+    parser = argparse.ArgumentParser(
+        description="Fetches your most recent songs images, adjusts their brightness and "
+        + "groups them in one go.",
+        usage="<json path> [options]",
+    )
+
+    parser.add_argument(
+        "json_path",
+        metavar="json path",
+        help="Path to the json containing the paths : color value",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--playlist",
+        metavar="",
+        type=str,
+        default="",
+        help="Instead of getting songs from the liked songs get it from the specified playlist.",
+    )
+
+    parser.add_argument(
+        "-a",
+        "--amount",
+        metavar="",
+        type=int,
+        help=f"The amount of images to get. Default: {DEFAULT_AMOUNT} liked songs / the \
+              whole playlist",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--offset",
+        metavar="",
+        type=int,
+        default=0,
+        help="The offset of your most recent liked songs / the playlist to start from.",
+    )
+
+    parser.add_argument(
+        "-m",
+        "--mod",
+        metavar="",
+        type=float,
+        default=1,
+        help="Value for modifying the brightness. Default: 1",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--condition",
+        type=float,
+        metavar="",
+        default=255,
+        help="Mean brightness of image needed to convert it using the modifier. \
+        Should be a value between 0-255. Default: None",
+    )
+
+    parser.add_argument(
+        "-x",
+        "--max",
+        action="store_true",
+        default=False,
+        help="Changes the condition from being the minimum to be being the maximum value.",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        metavar="",
+        default=1000,
+        type=float,
+        help="The Delta-E threshold. Should be a value between 1-100. Default: None",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--fallback",
+        type=str,
+        metavar="",
+        help="Where to store files that are over the Delta-E threshold ",
+    )
+
+    parser.add_argument(
+        "--legacy-delta-e",
+        action="store_true",
+        help="Computes the Delta-E like older versions did, from rgb values scaled to 0-1 \
+              instead of CIELAB, to reproduce old groupings and -t values (about 0-2).",
+    )
+
+    parser.add_argument(
+        "-q",
+        "--quality",
+        metavar="",
+        type=int,
+        help="JPEG quality (1-95) of modified images. Default: 75",
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        metavar="",
+        type=int,
+        default=8,
+        help="Amount of parallel downloads. Default: 8",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="",
+        type=int,
+        default=2,
+        help="Amount of threads processing images. Default: 2",
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        metavar="",
+        type=int,
+        default=16,
+        help="Max amount of images waiting between two stages. Default: 16",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--create-no-dirs",
+        action="store_true",
+        help="Disallows the creation of any directories.",
+    )
+
+    parser.add_argument(
+        "-d",
+        "--dedupe",
+        action="store_true",
+        help="Saves every cover only once, named after its album, instead of once per song.",
+    )
+
+    metrics.add_arguments(parser)
+
+    # endregion
+
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    args = build_parser().parse_args(argv)
+
+    if min(args.concurrency, args.workers, args.queue_size) < 1:
+        print(
+            Fore.RED
+            + "Error: "
+            + Fore.RESET
+            + "--concurrency, --workers and --queue-size must be at least 1."
+        )
+        sysexit(1)
+
+    with metrics.instrumented(args.metrics, args.profile):
+        main(
+            args.json_path,
+            args.amount,
+            args.offset,
+            args.playlist,
+            mod=args.mod,
+            condition=args.condition,
+            is_max=args.max,
+            threshold=args.threshold,
+            fallback_path=args.fallback,
+            concurrency=args.concurrency,
+            workers=args.workers,
+            queue_size=args.queue_size,
+            create_no_dirs=args.create_no_dirs,
+            dedupe=args.dedupe,
+            legacy_delta_e=args.legacy_delta_e,
+            save_options={} if args.quality is None else {"quality": args.quality},
+        )
+
+
+if __name__ == "__main__":
+    cli()
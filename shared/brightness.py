@@ -1,12 +1,49 @@
 """
-Shared function for getting the mean brightness of an image.
+Shared functions for getting and adjusting the brightness of an image.
 """
 
-from PIL import Image, ImageStat
+from struct import pack, unpack
+from typing import TYPE_CHECKING, Optional
 
+from shared.stats import image_stats
 
-def getbrightness(img: Image.Image) -> float:
-    """Gets the mean brightness of an image by converting it to grayscale."""
-    im = img.convert("L")
-    stat = ImageStat.Stat(im)
-    return stat.mean[0]
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Modes with 8 bits per band which Image.point can map band by band.
+LUT_MODES = ("L", "LA", "RGB", "RGBA", "CMYK")
+
+
+def getbrightness(img: "Image.Image", strip_rows: Optional[int] = None) -> float:
+    """
+    Gets the mean brightness (luma) of an image from the histogram of its bands.
+    (Converting strip_rows rows at a time if given, see shared.memory)
+    """
+    return image_stats(img, strip_rows=strip_rows).luma
+
+
+def _float32(value: float) -> float:
+    """Rounds the value to single precision."""
+    return unpack("f", pack("f", value))[0]
+
+
+def brightness_lut(mod: float, mode: str) -> Optional[list]:
+    """
+    Builds the lookup table for Image.point, giving the same result as
+    ImageEnhance.Brightness(img).enhance(mod) without allocating a black image to blend with.
+
+    Pillow blends in single precision and truncates, so the table does the same. Alpha bands
+    are kept as is. Returns None for modes that can't be mapped this way.
+    """
+    if mode not in LUT_MODES:
+        return None
+
+    factor = _float32(mod)
+    # factor * value is exact in double precision, so rounding it once matches the float math.
+    table = [min(255, max(0, int(_float32(factor * value)))) for value in range(256)]
+
+    lut = []
+    # The bands of all LUT_MODES are named by single letters.
+    for band in mode:
+        lut += list(range(256)) if band == "A" else table
+    return lut
@@ -0,0 +1,176 @@
+"""
+Module for the persistent on-disk cache of image colors shared across the project.
+"""
+
+import sqlite3
+from os import environ, makedirs, stat
+from os.path import join, abspath, dirname, expanduser
+from hashlib import blake2b
+from time import time
+from typing import Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 100_000
+
+# Bump whenever the table layout changes. Outdated caches are simply dropped.
+SCHEMA_VERSION = 1
+
+
+def cache_dir() -> str:
+    """
+    Returns the directory WallTune keeps its caches in. ($XDG_CACHE_HOME/walltune)
+    """
+    base = environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache")
+    return join(base, "walltune")
+
+
+def file_hash(path: str) -> str:
+    """
+    Hashes the contents of the file at path.
+    """
+    digest = blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ColorCache:
+    """
+    SQLite backed cache mapping image files to their average color.
+
+    Entries are keyed on the absolute path, size and mtime of the file and optionally a hash of
+    its contents. The variant separates colors computed from reduced decodes (their max_pixels)
+    from exact ones (0). Once more than max_entries are stored the least recently used ones are
+    evicted.
+
+    Changes are only committed on commit() / close(), so use it as a context manager.
+    It may be handed between threads, but must not be used by several at once.
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        **kwargs,
+    ):
+        self.use_hash = kwargs.get("use_hash", False)
+        # Skip lookups but still store the results. (--rebuild-cache)
+        self.refresh = kwargs.get("refresh", False)
+        self.max_entries = max_entries
+
+        if db_path is None:
+            db_path = join(cache_dir(), "colors.sqlite")
+
+        makedirs(dirname(abspath(db_path)), exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS colors")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS colors (
+                path TEXT NOT NULL,
+                variant INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                hash TEXT,
+                red INTEGER NOT NULL,
+                green INTEGER NOT NULL,
+                blue INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (path, variant)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS colors_last_used ON colors (last_used)"
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM colors").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _key(self, image_path: str, stat_result=None) -> tuple:
+        """
+        Builds the (path, size, mtime, hash) key of the file.
+        """
+        image_path = abspath(image_path)
+        if stat_result is None:
+            stat_result = stat(image_path)
+        content_hash = file_hash(image_path) if self.use_hash else None
+        return image_path, stat_result.st_size, stat_result.st_mtime_ns, content_hash
+
+    def get(
+        self, image_path: str, stat_result=None, variant: int = 0
+    ) -> Optional[Tuple[int, int, int]]:
+        """
+        Returns the cached color of the file or None if it isn't cached / is outdated.
+        """
+        if self.refresh:
+            return None
+
+        image_path, size, mtime, content_hash = self._key(image_path, stat_result)
+        row = self._conn.execute(
+            "SELECT size, mtime, hash, red, green, blue FROM colors "
+            "WHERE path = ? AND variant = ?",
+            (image_path, variant),
+        ).fetchone()
+
+        if row is None or row[0] != size or row[1] != mtime:
+            return None
+
+        if self.use_hash and row[2] != content_hash:
+            return None
+
+        self._conn.execute(
+            "UPDATE colors SET last_used = ? WHERE path = ? AND variant = ?",
+            (time(), image_path, variant),
+        )
+        return tuple(row[3:])
+
+    def put(
+        self,
+        image_path: str,
+        color: Tuple[int, int, int],
+        stat_result=None,
+        variant: int = 0,
+    ):
+        """
+        Stores the color of the file, evicting the least recently used entries if needed.
+        """
+        image_path, size, mtime, content_hash = self._key(image_path, stat_result)
+        exists = self._conn.execute(
+            "SELECT 1 FROM colors WHERE path = ? AND variant = ?", (image_path, variant)
+        ).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO colors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (image_path, variant, size, mtime, content_hash, *color, time()),
+        )
+        if exists is None:
+            self._count += 1
+
+        if self._count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM colors WHERE rowid IN "
+                "(SELECT rowid FROM colors ORDER BY last_used LIMIT ?)",
+                (self._count - self.max_entries,),
+            )
+            self._count = self.max_entries
+
+    def commit(self):
+        """
+        Commits all pending changes.
+        """
+        self._conn.commit()
+
+    def close(self):
+        """
+        Commits all pending changes and closes the database.
+        """
+        self._conn.commit()
+        self._conn.close()
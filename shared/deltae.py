@@ -0,0 +1,235 @@
+"""
+Shared, NumPy vectorized color difference functions. (sRGB -> CIELAB and CIEDE2000)
+
+PaletteIndex finds the palette color with the lowest CIEDE2000 Delta-E without computing it
+against every palette color, using the Euclidean Delta-E (CIE76) as a cheap lower bound.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+# sRGB (linear) -> XYZ for the D65 white point
+_SRGB_TO_XYZ = np.array(
+    [
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ]
+)
+
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+# Lower bound of CIEDE2000 (see delta_e_lower_bound): the rotation term can shrink the
+# chroma / hue terms to no less than 1 - sin(60 deg) = 0.13397 of their sum, as
+# |R_T| <= 2 * sin(60 deg). Rounded down to stay on the safe side.
+_MIN_ROTATION = 0.1339
+
+
+def rgb_to_lab(rgb) -> np.ndarray:
+    """
+    Converts (an array of) 0-255 sRGB values to CIELAB (D65).
+    """
+    srgb = np.asarray(rgb, dtype=np.float64) / 255
+    linear = np.where(
+        srgb <= 0.04045, srgb / 12.92, np.power((srgb + 0.055) / 1.055, 2.4)
+    )
+    xyz = linear @ _SRGB_TO_XYZ.T / _D65_WHITE
+
+    epsilon = (6 / 29) ** 3
+    f = np.where(xyz > epsilon, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+
+    lab = np.empty_like(f)
+    # Clip away float error, L* is defined as 0-100.
+    lab[..., 0] = np.clip(116 * f[..., 1] - 16, 0, 100)
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+    return lab
+
+
+def lab_to_rgb(lab) -> np.ndarray:
+    """
+    Converts (an array of) CIELAB (D65) values back to 0-255 sRGB, clipping colors outside
+    of sRGB.
+    """
+    lab = np.asarray(lab, dtype=np.float64)
+    f_y = (lab[..., 0] + 16) / 116
+    f = np.stack([f_y + lab[..., 1] / 500, f_y, f_y - lab[..., 2] / 200], axis=-1)
+
+    xyz = np.where(f > 6 / 29, f**3, 3 * (6 / 29) ** 2 * (f - 4 / 29)) * _D65_WHITE
+    linear = np.clip(xyz @ np.linalg.inv(_SRGB_TO_XYZ).T, 0, 1)
+    srgb = np.where(
+        linear <= 0.0031308, 12.92 * linear, 1.055 * np.power(linear, 1 / 2.4) - 0.055
+    )
+    return np.rint(np.clip(srgb, 0, 1) * 255).astype(np.int64)
+
+
+def ciede2000(lab1, lab2) -> np.ndarray:
+    """
+    Calculates the CIEDE2000 Delta-E between every color of lab1 (N x 3) and lab2 (K x 3).
+
+    Returns an N x K matrix. Follows pyciede2000 (k_L = k_C = k_H = 1) step by step.
+    """
+    lab1 = np.asarray(lab1, dtype=np.float64).reshape(-1, 1, 3)
+    lab2 = np.asarray(lab2, dtype=np.float64).reshape(1, -1, 3)
+    return _ciede2000(lab1, lab2)
+
+
+def _ciede2000(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    """
+    CIEDE2000 Delta-E of the broadcast (... x 3) arrays lab1 and lab2.
+    """
+    # One name per term of the formula, so it can be checked against it line by line.
+    # pylint: disable=too-many-locals
+    l_1, a_1, b_1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l_2, a_2, b_2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    c_bar = (np.hypot(a_1, b_1) + np.hypot(a_2, b_2)) / 2
+    g = 0.5 * (1 - np.sqrt(c_bar**7 / (c_bar**7 + 25.0**7)))
+
+    a_1_dash = (1 + g) * a_1
+    a_2_dash = (1 + g) * a_2
+    c_1_dash = np.hypot(a_1_dash, b_1)
+    c_2_dash = np.hypot(a_2_dash, b_2)
+    h_1_dash = np.degrees(np.arctan2(b_1, a_1_dash)) % 360
+    h_2_dash = np.degrees(np.arctan2(b_2, a_2_dash)) % 360
+
+    delta_l_dash = l_2 - l_1
+    delta_c_dash = c_2_dash - c_1_dash
+
+    chroma = c_1_dash * c_2_dash != 0
+    h_diff = h_2_dash - h_1_dash
+    delta_h_dash = np.where(
+        np.abs(h_diff) <= 180,
+        h_diff,
+        np.where(h_diff > 180, h_diff - 360, h_diff + 360),
+    )
+    delta_h_dash = np.where(chroma, delta_h_dash, 0.0)
+    delta_big_h_dash = (
+        2 * np.sqrt(c_1_dash * c_2_dash) * np.sin(np.radians(delta_h_dash) / 2)
+    )
+
+    l_bar_dash = (l_1 + l_2) / 2
+    c_bar_dash = (c_1_dash + c_2_dash) / 2
+    h_sum = h_1_dash + h_2_dash
+    h_bar_dash = np.where(
+        np.abs(h_diff) <= 180,
+        h_sum / 2,
+        np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2),
+    )
+    h_bar_dash = np.where(chroma, h_bar_dash, h_sum)
+
+    t = (
+        1
+        - 0.17 * np.cos(np.radians(h_bar_dash - 30))
+        + 0.24 * np.cos(np.radians(2 * h_bar_dash))
+        + 0.32 * np.cos(np.radians(3 * h_bar_dash + 6))
+        - 0.20 * np.cos(np.radians(4 * h_bar_dash - 63))
+    )
+
+    delta_theta = 30 * np.exp(-(((h_bar_dash - 275) / 25) ** 2))
+    r_c = 2 * np.sqrt(c_bar_dash**7 / (c_bar_dash**7 + 25.0**7))
+
+    s_l = 1 + (0.015 * (l_bar_dash - 50) ** 2) / np.sqrt(20 + (l_bar_dash - 50) ** 2)
+    s_c = 1 + 0.045 * c_bar_dash
+    s_h = 1 + 0.015 * c_bar_dash * t
+    r_t = -r_c * np.sin(2 * np.radians(delta_theta))
+
+    term_l = delta_l_dash / s_l
+    term_c = delta_c_dash / s_c
+    term_h = delta_big_h_dash / s_h
+
+    return np.sqrt(term_l**2 + term_c**2 + term_h**2 + r_t * term_c * term_h)
+
+
+def delta_e_lower_bound(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    """
+    Returns a lower bound of the CIEDE2000 Delta-E of the broadcast (... x 3) arrays, skipping
+    the hue angles and all trigonometry:
+
+        dE00^2 >= (dL / S_L)^2 + 0.1339 * (da^2 + db^2) / S_C^2
+
+    - dL' = dL and S_L only depends on the mean L*, so the lightness term is exact.
+    - dC'^2 + dH'^2 is the squared distance in the a'b' plane, which is at least da^2 + db^2
+      as a' = (1 + G) * a.
+    - S_H <= S_C (T < 3) and C' <= (1 + G) * C bounds S_C from above.
+    """
+    delta_l = lab1[..., 0] - lab2[..., 0]
+    l_bar = (lab1[..., 0] + lab2[..., 0]) / 2 - 50
+    s_l = 1 + (0.015 * l_bar**2) / np.sqrt(20 + l_bar**2)
+
+    c_bar = (
+        np.hypot(lab1[..., 1], lab1[..., 2]) + np.hypot(lab2[..., 1], lab2[..., 2])
+    ) / 2
+    g = 0.5 * (1 - np.sqrt(c_bar**7 / (c_bar**7 + 25.0**7)))
+    s_c = 1 + 0.045 * (1 + g) * c_bar
+
+    delta_ab = (lab1[..., 1] - lab2[..., 1]) ** 2 + (lab1[..., 2] - lab2[..., 2]) ** 2
+    # Shaved by a relative 1e-9, so rounding can't push it over the exact value.
+    return np.sqrt((delta_l / s_l) ** 2 + _MIN_ROTATION * delta_ab / s_c**2) * (
+        1 - 1e-9
+    )
+
+
+class PaletteIndex:
+    """
+    Index of the Lab colors of a palette for finding the closest (lowest CIEDE2000) color.
+
+    For every query the candidates palette colors nearest by CIE76 get the exact CIEDE2000,
+    whose lowest value is an upper bound of the result. Only the palette colors whose
+    delta_e_lower_bound doesn't exceed it get the exact CIEDE2000 as well, so the result always
+    matches the brute-force search. (Ties go to the first palette color, like argmin)
+    """
+
+    # Small palettes are faster to search completely.
+    brute_force_size = 32
+
+    def __init__(self, lab, candidates: int = 4, chunk_size: int = 1024):
+        self.lab = np.asarray(lab, dtype=np.float64).reshape(-1, 3)
+        self.candidates = candidates
+        self.chunk_size = chunk_size
+
+    def __len__(self) -> int:
+        return len(self.lab)
+
+    def nearest(self, lab) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the index of the closest palette color for every color of lab (N x 3) and the
+        Delta-E to it.
+        """
+        lab = np.asarray(lab, dtype=np.float64).reshape(-1, 3)
+        indices = np.empty(len(lab), dtype=np.intp)
+        deltas = np.empty(len(lab))
+
+        # Limits the N x K intermediates for large batches.
+        for start in range(0, len(lab), self.chunk_size):
+            stop = start + self.chunk_size
+            indices[start:stop], deltas[start:stop] = self._nearest(lab[start:stop])
+
+        return indices, deltas
+
+    def _nearest(self, lab: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.arange(len(lab))
+
+        if len(self.lab) <= self.brute_force_size:
+            exact = ciede2000(lab, self.lab)
+            lowest = exact.argmin(axis=1)
+            return lowest, exact[rows, lowest]
+
+        queries = lab[:, None, :]
+        distances = np.sum((queries - self.lab[None, :, :]) ** 2, axis=-1)
+        candidates = np.argpartition(distances, self.candidates - 1, axis=1)[
+            :, : self.candidates
+        ]
+        upper = _ciede2000(queries, self.lab[candidates]).min(axis=1)
+
+        # Every palette color that could still be closer, including the best candidate.
+        pair_rows, pair_keys = np.nonzero(
+            delta_e_lower_bound(queries, self.lab[None, :, :]) <= upper[:, None]
+        )
+        exact = _ciede2000(lab[pair_rows], self.lab[pair_keys])
+
+        # Lowest Delta-E per query, ties going to the lowest palette index.
+        order = np.lexsort((pair_keys, exact, pair_rows))
+        first = order[np.searchsorted(pair_rows[order], rows)]
+        return pair_keys[first], exact[first]
@@ -0,0 +1,149 @@
+"""
+Module for downloading files concurrently over a pool of keep-alive connections.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from os import replace, remove
+from os.path import exists
+from time import sleep
+from typing import TYPE_CHECKING
+
+from shared.folders import free_path
+from shared.metrics import METRICS
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 3
+
+# Status codes worth trying again.
+_RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class IncompleteDownloadError(IOError):
+    """
+    Raised if fewer bytes were received than announced by Content-Length.
+    """
+
+
+def make_session(concurrency: int = DEFAULT_CONCURRENCY) -> "requests.Session":
+    """
+    Creates a session keeping up to concurrency connections per host alive.
+    """
+    # pylint: disable=import-outside-toplevel
+    # requests is only imported once something is downloaded, not for the --help of the CLIs.
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _retryable(error: Exception) -> bool:
+    import requests  # pylint: disable=import-outside-toplevel
+
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and (
+            error.response.status_code in _RETRY_STATUSES
+        )
+    return isinstance(
+        error,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            # The connection was closed before Content-Length bytes were received.
+            requests.exceptions.ChunkedEncodingError,
+            IncompleteDownloadError,
+        ),
+    )
+
+
+def fetch(session: "requests.Session", url: str, **kwargs) -> bytes:
+    """
+    Downloads the url into memory, retrying failed attempts with exponential backoff.
+
+    The size is checked against Content-Length (unless the body was compressed in transit).
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+
+    retries = kwargs.get("retries", DEFAULT_RETRIES)
+    backoff = kwargs.get("backoff", 0.5)
+    timeout = kwargs.get("timeout", 30)
+
+    attempt = 0
+    while True:
+        try:
+            with METRICS.timer("download"):
+                response = session.get(url, timeout=timeout)
+            response.raise_for_status()
+            data = response.content
+
+            expected = response.headers.get("Content-Length")
+            if (
+                expected is not None
+                and "Content-Encoding" not in response.headers
+                and int(expected) != len(data)
+            ):
+                raise IncompleteDownloadError(
+                    f"Got {len(data)} of {expected} bytes from {url}"
+                )
+
+            METRICS.count("downloads")
+            METRICS.count("bytes_downloaded", len(data))
+            return data
+        except (requests.RequestException, IncompleteDownloadError) as e:
+            if attempt >= retries or not _retryable(e):
+                raise
+            METRICS.count("download_retries")
+            sleep(backoff * 2**attempt)
+            attempt += 1
+
+
+def download(session: "requests.Session", url: str, *dests: str, **kwargs) -> str:
+    """
+    Downloads the url to the first of dests not holding a different file (see
+    folders.free_path) and returns its path. Nothing is written if it already holds the data.
+
+    The file is written under a temporary name and renamed once complete, so it's never left
+    partially written.
+    """
+    data = fetch(session, url, **kwargs)
+
+    dest, write = free_path(data, *dests)
+    if not write:
+        return dest
+
+    tmp_path = dest + ".part"
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        replace(tmp_path, dest)
+    finally:
+        if exists(tmp_path):
+            remove(tmp_path)
+    return dest
+
+
+def download_all(jobs: list, concurrency: int = DEFAULT_CONCURRENCY, **kwargs) -> list:
+    """
+    Downloads all (url, *dests) jobs using concurrency threads sharing one connection pool.
+
+    Returns the (path, exception) of every job in the order of the jobs: where its file was
+    saved (None if it failed) and why it failed. (None if it succeeded)
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+
+    session = kwargs.pop("session", None) or make_session(concurrency)
+
+    def run(job):
+        try:
+            return download(session, *job, **kwargs), None
+        except (OSError, requests.RequestException) as e:
+            return None, e
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(run, jobs))
@@ -2,9 +2,28 @@
 Module for handling work with files / folders across the project.
 """
 
-from os import walk
-from os.path import join, isfile, isdir, splitext
+import os
+import shutil
+from errno import EXDEV
+from fnmatch import fnmatch
+from os import scandir, stat, link, remove, rename, replace
+from os.path import (
+    getsize,
+    isfile,
+    isdir,
+    splitext,
+    lexists,
+    abspath,
+    basename,
+    dirname,
+    join,
+    samefile,
+)
 from enum import IntEnum, auto
+from typing import Tuple
+
+# Extensions of the images the CLIs work on. (Compared case-insensitively)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
 
 
 class PathType(IntEnum):
@@ -19,19 +38,100 @@ class PathType(IntEnum):
     ERROR = auto()
 
 
+def is_image(path: str) -> bool:
+    """
+    Checks whether the path has one of the IMAGE_EXTENSIONS.
+    """
+    return splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _excluded(entry, exclude: list) -> bool:
+    if not exclude:
+        return False
+    full_path = abspath(entry.path)
+    return any(
+        fnmatch(entry.name, pattern) or fnmatch(full_path, pattern)
+        for pattern in exclude
+    )
+
+
+def _first_visit(entry, visited: set) -> bool:
+    """
+    Checks whether the dir of the os.DirEntry wasn't visited before, adding it to visited.
+    """
+    try:
+        dir_stat = entry.stat()
+    except OSError:
+        return False
+    key = (dir_stat.st_dev, dir_stat.st_ino)
+    if key in visited:
+        return False
+    visited.add(key)
+    return True
+
+
+def scan(path: str, extensions=IMAGE_EXTENSIONS, **kwargs):
+    """
+    Yields the os.DirEntry of every file in the dir and all sub dirs, as it goes.
+
+    Only files with one of the extensions (case-insensitive, None for all files) are yielded.
+    Files and dirs whose name or absolute path matches one of the exclude glob patterns are
+    skipped. Symlinked dirs are only entered with follow_symlinks, and every dir at most once,
+    so symlink loops end.
+    With sort set, the entries of every dir are sorted by name, so the order is stable.
+
+    DirEntry.stat() caches its result, so callers can share it instead of calling os.stat.
+    """
+    exclude = kwargs.get("exclude", None)
+    follow_symlinks = kwargs.get("follow_symlinks", False)
+    sort = kwargs.get("sort", False)
+
+    if extensions is not None:
+        extensions = tuple(extension.lower() for extension in extensions)
+
+    # Dirs reachable by several symlinks (or looping back up) are only scanned once.
+    root_stat = stat(path)
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+
+    stack = [path]
+    while stack:
+        dirs = []
+        try:
+            with scandir(stack.pop()) as entries:
+                if sort:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            if not _excluded(entry, exclude):
+                                dirs.append(entry)
+                        elif (
+                            # Symlinked files are files either way, like in os.walk.
+                            entry.is_file()
+                            and (
+                                extensions is None
+                                or splitext(entry.name)[1].lower() in extensions
+                            )
+                            and not _excluded(entry, exclude)
+                        ):
+                            yield entry
+                    except OSError:
+                        # Vanished or broken entries are skipped like os.walk does.
+                        continue
+        except OSError:
+            continue
+
+        for entry in reversed(dirs):
+            if not follow_symlinks or _first_visit(entry, visited):
+                stack.append(entry.path)
+
+
 def list_all_contents(path: str) -> list:
     """
     Lists the content of the dir and all sub dirs.
     """
-    file_list = []
-    # Walk through the directory
-    for root, _, files in walk(path):
-        for file in files:
-            # Construct full file path
-            file_path = join(root, file)
-            # Add file path to the list
-            file_list.append(file_path)
-    return file_list
+    return [entry.path for entry in scan(path, None)]
 
 
 def check_path_type(path: str) -> str:
@@ -51,3 +151,154 @@ def check_path_type(path: str) -> str:
         return PathType.NEW_FILE
 
     return PathType.ERROR
+
+
+# Linux ioctl making a file share the extents of another one (reflink), e.g. on btrfs / XFS.
+_FICLONE = 0x40049409
+
+# How place_file copies: sharing the data (reflink), the inode (hardlink) or neither (copy).
+COPY_MODES = ("reflink", "hardlink", "copy")
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    try:
+        # pylint: disable=import-outside-toplevel
+        import fcntl
+
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+def _copy_range(src_fd: int, dst_fd: int) -> bool:
+    # The kernel copies (or shares, e.g. on NFS / XFS) the data without it passing through here.
+    if not hasattr(os, "copy_file_range"):
+        return False
+    try:
+        while os.copy_file_range(src_fd, dst_fd, 1 << 30):
+            pass
+    except OSError:
+        return False
+    return True
+
+
+def clone_file(src: str, dst: str) -> str:
+    """
+    Copies src to dst with its metadata, sharing the data where the filesystem allows it.
+    Tries a reflink, then copy_file_range, then falls back to shutil.copy2.
+
+    Returns the method used: reflink, copy_file_range or copy.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if _reflink(fsrc.fileno(), fdst.fileno()):
+            method = "reflink"
+        elif _copy_range(fsrc.fileno(), fdst.fileno()):
+            method = "copy_file_range"
+        else:
+            method = None
+
+    if method is None:
+        shutil.copy2(src, dst)
+        return "copy"
+
+    shutil.copystat(src, dst)
+    return method
+
+
+def place_file(src: str, dst: str, mode: str = "reflink") -> str:
+    """
+    Puts a copy of src at dst (replacing dst) according to the mode (see COPY_MODES). Hard
+    links fall back to clone_file, e.g. across filesystems.
+
+    The copy is made next to dst and renamed to it, so dst is never seen half-written.
+    Returns the method used, "existing" if dst already is src (e.g. hard linked by an
+    earlier run).
+    """
+    if lexists(dst) and samefile(src, dst):
+        return "existing"
+
+    tmp_path = join(dirname(dst), f".{basename(dst)}.tmp")
+    if lexists(tmp_path):
+        remove(tmp_path)
+
+    try:
+        method = None
+        if mode == "hardlink":
+            try:
+                link(src, tmp_path)
+                method = "hardlink"
+            except OSError:
+                pass
+
+        if method is None and mode == "copy":
+            shutil.copy2(src, tmp_path)
+            method = "copy"
+        elif method is None:
+            method = clone_file(src, tmp_path)
+
+        replace(tmp_path, dst)
+        # Renaming onto a link to the same file does nothing and leaves the source behind.
+        if lexists(tmp_path):
+            remove(tmp_path)
+    except BaseException:
+        if lexists(tmp_path):
+            remove(tmp_path)
+        raise
+
+    return method
+
+
+def move_file(src: str, dst: str, mode: str = "reflink") -> str:
+    """
+    Moves src to dst (replacing dst) with an atomic rename. Across filesystems src is copied
+    with place_file (using mode) and removed afterwards.
+
+    Returns the method used: rename or the one of place_file. If dst already is a hard link
+    to src, src is just removed.
+    """
+    if abspath(src) != abspath(dst) and lexists(dst) and samefile(src, dst):
+        # rename() does nothing in that case and would leave src behind.
+        remove(src)
+        return "rename"
+
+    try:
+        rename(src, dst)
+        return "rename"
+    except OSError as e:
+        if e.errno != EXDEV:
+            raise
+
+    method = place_file(src, dst, mode)
+    remove(src)
+    return method
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    Hard links src to dst (replacing dst), falling back to a copy across filesystems.
+    """
+    place_file(src, dst, "hardlink")
+
+
+def _holds(path: str, data: bytes) -> bool:
+    if getsize(path) != len(data):
+        return False
+    with open(path, "rb") as file:
+        return file.read() == data
+
+
+def free_path(data: bytes, *paths: str) -> Tuple[str, bool]:
+    """
+    Picks which of the paths data is saved to without overwriting a different file: the one
+    already holding data, else the first free one, else the last one.
+
+    Returns the path and whether data still has to be written there.
+    """
+    for path in paths:
+        if isfile(path) and _holds(path, data):
+            return path, False
+    for path in paths:
+        if not lexists(path):
+            return path, True
+    return paths[-1], True
@@ -0,0 +1,109 @@
+"""
+Module for clustering colors with a seeded, NumPy vectorized mini-batch k-means.
+
+Clusters by Euclidean distance, so colors should be given in a perceptual space like CIELAB.
+"""
+
+import numpy as np
+
+
+def _nearest(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, the |p|^2 term doesn't change the argmin.
+    return np.argmin(
+        np.sum(centers**2, axis=1) - 2 * points @ centers.T,
+        axis=1,
+    )
+
+
+def _init_centers(points: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Picks k starting centers by k-means++ seeding on a sample of the points.
+    """
+    sample = points[rng.choice(len(points), min(len(points), 20 * k + 1000), False)]
+
+    centers = [sample[rng.integers(len(sample))]]
+    distances = np.sum((sample - centers[0]) ** 2, axis=1)
+    for _ in range(1, k):
+        total = distances.sum()
+        if total == 0:
+            # Fewer distinct points than clusters.
+            centers.append(sample[rng.integers(len(sample))])
+            continue
+        centers.append(sample[rng.choice(len(sample), p=distances / total)])
+        distances = np.minimum(distances, np.sum((sample - centers[-1]) ** 2, axis=1))
+
+    return np.array(centers)
+
+
+def _minibatch(points: np.ndarray, centers: np.ndarray, rng, **kwargs) -> np.ndarray:
+    """
+    Moves the centers by iterations mini-batch steps of batch_size points with per-center
+    learning rates. (Sculley 2010)
+    """
+    batch_size = kwargs.get("batch_size", 4096)
+    counts = np.zeros(len(centers))
+
+    for _ in range(kwargs.get("iterations", 100)):
+        batch = points[rng.integers(len(points), size=batch_size)]
+        labels = _nearest(batch, centers)
+
+        batch_counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+
+        counts += batch_counts
+        moved = batch_counts > 0
+        # Moving towards the batch mean by batch_count / count is the same as moving towards
+        # every point by 1 / count in turn.
+        rate = batch_counts[moved] / counts[moved]
+        means = sums[moved] / batch_counts[moved, None]
+        centers[moved] += rate[:, None] * (means - centers[moved])
+
+    return centers
+
+
+def _lloyd(points: np.ndarray, centers: np.ndarray, steps: int) -> np.ndarray:
+    """
+    Runs up to steps full Lloyd steps, stopping early once the centers stay put.
+    """
+    for _ in range(steps):
+        labels = _nearest(points, centers)
+        cluster_counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+
+        # Empty clusters keep their center.
+        filled = cluster_counts > 0
+        updated = centers.copy()
+        updated[filled] = sums[filled] / cluster_counts[filled, None]
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+
+    return centers
+
+
+def kmeans(points, k: int, seed: int = 0, **kwargs) -> np.ndarray:
+    """
+    Clusters the points (N x D) into k clusters and returns their centers (k x D).
+
+    Runs iterations mini-batch steps of batch_size points with per-center learning rates
+    (Sculley 2010), followed by a few full Lloyd steps polishing the result. The same points,
+    k and seed always give the same centers.
+    """
+    batch_size = kwargs.get("batch_size", 4096)
+
+    points = np.asarray(points, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+
+    centers = _init_centers(points, k, rng)
+    if len(points) > batch_size:
+        centers = _minibatch(
+            points,
+            centers,
+            rng,
+            batch_size=batch_size,
+            iterations=kwargs.get("iterations", 100),
+        )
+
+    return _lloyd(points, centers, kwargs.get("lloyd_steps", 5))
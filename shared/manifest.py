@@ -0,0 +1,84 @@
+"""
+Module for reading / writing color manifests: NDJSON files with one record per image.
+
+    {"path": <absolute path>, "size": <bytes>, "mtime": <ns>, "rgb": [r, g, b], "lab": [L, a, b]}
+
+They are produced by a batch pass of imageaverage (--manifest) and let grouping re-classify a
+library without decoding any images.
+"""
+
+import json
+from os import replace, stat
+from os.path import abspath, isfile
+from typing import Optional, Tuple
+
+
+def load_manifest(manifest_path: str) -> dict:
+    """
+    Loads the manifest as a dict of absolute path : record. A missing file is an empty manifest.
+    """
+    manifest = {}
+    if not isfile(manifest_path):
+        return manifest
+
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                manifest[record["path"]] = record
+    return manifest
+
+
+def save_manifest(manifest_path: str, manifest: dict):
+    """
+    Writes the manifest, replacing the old one only once it's completely written.
+    """
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        for record in manifest.values():
+            file.write(json.dumps(record) + "\n")
+    replace(tmp_path, manifest_path)
+
+
+def make_record(image_path: str, rgb: Tuple[int, int, int], stat_result=None) -> dict:
+    """
+    Creates the manifest record of an image.
+    """
+    # pylint: disable=import-outside-toplevel
+    # NumPy is only needed once a record is made, not for reading manifests.
+    from shared.deltae import rgb_to_lab
+
+    if stat_result is None:
+        stat_result = stat(image_path)
+
+    return {
+        "path": abspath(image_path),
+        "size": stat_result.st_size,
+        "mtime": stat_result.st_mtime_ns,
+        "rgb": list(rgb),
+        "lab": [round(value, 4) for value in rgb_to_lab(rgb).tolist()],
+    }
+
+
+def lookup_color(
+    manifest: dict, image_path: str, stat_result=None
+) -> Optional[Tuple[int, int, int]]:
+    """
+    Returns the rgb value of the image if the manifest has an up-to-date record of it.
+
+    Records without size / mtime are trusted as is.
+    """
+    record = manifest.get(abspath(image_path))
+    if record is None:
+        return None
+
+    if "size" in record and "mtime" in record:
+        if stat_result is None:
+            stat_result = stat(image_path)
+        if (
+            record["size"] != stat_result.st_size
+            or record["mtime"] != stat_result.st_mtime_ns
+        ):
+            return None
+
+    return tuple(record["rgb"])
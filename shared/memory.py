@@ -0,0 +1,92 @@
+"""
+Module for keeping the memory used per image within a budget. (--max-memory)
+
+Pillow keeps a decoded image in a single buffer of 4 bytes per pixel (1 for L / P / 1). Only
+JPEGs can be decoded smaller than that (draft mode, scaling by 1/2 to 1/8), every other
+format, PNG included, is always decoded whole. Everything done after the decode (mode
+conversions, histograms, brightness adjustments) works on strips of rows, so it only adds a
+strip's worth of memory on top of the decoded image.
+
+The budget applies per image, so with -j it's per worker.
+"""
+
+import argparse
+import re
+from math import ceil
+from typing import TYPE_CHECKING, Iterator, Optional, Tuple
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Strips are never thinner than this, even if the decoded image alone exceeds the budget.
+MIN_STRIP_ROWS = 16
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(value: str) -> int:
+    """
+    Parses a size in bytes with an optional K, M or G suffix. (e.g. 512M) Used as argparse type.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?\s*", value, re.IGNORECASE)
+    if match is None or float(match[1]) <= 0:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r} (e.g. 512M or 2G)")
+    return int(float(match[1]) * _UNITS[match[2].upper()])
+
+
+def frame_bytes(size: Tuple[int, int], mode: str) -> int:
+    """
+    Returns the size of the buffer Pillow decodes an image of the size and mode into.
+    """
+    if mode in ("1", "L", "P"):
+        depth = 1
+    elif mode.startswith("I;16"):
+        depth = 2
+    else:
+        depth = 4
+    return size[0] * size[1] * depth
+
+
+def fit_draft(img: "Image.Image", max_memory: int) -> bool:
+    """
+    Makes JPEGs whose decoded RGB buffer exceeds max_memory decode at the largest DCT scale
+    (1/2, 1/4 or 1/8) within it. Must be called before the image is loaded.
+
+    Returns whether the image will be decoded at a reduced scale.
+    """
+    if img.format != "JPEG" or frame_bytes(img.size, "RGB") <= max_memory:
+        return False
+
+    width, height = img.size
+    for scale in (2, 4, 8):
+        if (
+            frame_bytes((ceil(width / scale), ceil(height / scale)), "RGB")
+            <= max_memory
+        ):
+            break
+
+    img.draft("RGB", (width // scale, height // scale))
+    return img.size != (width, height)
+
+
+def strip_rows(img: "Image.Image", max_memory: Optional[int]) -> Optional[int]:
+    """
+    Returns how many rows of the image to process at once so a strip and its converted /
+    adjusted copy fit in what's left of max_memory after the decoded image.
+
+    Returns None (the whole image at once) if there's no budget.
+    """
+    if not max_memory:
+        return None
+
+    left = max_memory - frame_bytes(img.size, img.mode)
+    # The strip cropped from the image and the new strip made of it, 4 bytes per pixel at most.
+    return max(MIN_STRIP_ROWS, left // (img.width * 4 * 2))
+
+
+def strips(img: "Image.Image", rows: int) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Yields the boxes of the strips of rows rows covering the image, top to bottom.
+    """
+    for top in range(0, img.height, rows):
+        yield (0, top, img.width, min(top + rows, img.height))
@@ -0,0 +1,200 @@
+"""
+Module for the per-stage timers and counters shared across the project.
+
+The instrumentation is disabled by default, in which case timers are a shared no-op context
+manager and counting returns right away. The CLIs enable it with --metrics <file>, writing
+JSON or, for files ending in .prom, the Prometheus text format. Timers of stages running in
+several threads add up the time of all threads.
+
+--profile runs the CLI under cProfile, printing the slowest functions to stderr or dumping
+the stats to the given file.
+"""
+
+import json
+import sys
+from contextlib import contextmanager, nullcontext
+from threading import Lock
+from time import perf_counter
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.metrics.add_time(self.name, perf_counter() - self.start)
+
+
+_NULL_TIMER = nullcontext()
+
+
+class Metrics:
+    """
+    Collects the time spent per stage and arbitrary counters.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        # name -> [calls, seconds]
+        self.timers = {}
+        self.counters = {}
+        self._lock = Lock()
+
+    def timer(self, name: str):
+        """
+        Returns a context manager adding the time spent in it to the stage.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def add_time(self, name: str, seconds: float):
+        """
+        Adds a call taking seconds to the stage.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+
+    def count(self, name: str, value: int = 1):
+        """
+        Adds value to the counter.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        """
+        Forgets everything recorded so far.
+        """
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+    def to_dict(self) -> dict:
+        """
+        Returns the recorded stages and counters.
+        """
+        with self._lock:
+            return {
+                "stages": {
+                    name: {"calls": calls, "seconds": seconds}
+                    for name, (calls, seconds) in sorted(self.timers.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def to_prometheus(self, prefix: str = "walltune") -> str:
+        """
+        Returns the recorded stages and counters in the Prometheus text format.
+        """
+        data = self.to_dict()
+        lines = [
+            f"# TYPE {prefix}_stage_seconds_total counter",
+            *(
+                f'{prefix}_stage_seconds_total{{stage="{name}"}} {stage["seconds"]}'
+                for name, stage in data["stages"].items()
+            ),
+            f"# TYPE {prefix}_stage_calls_total counter",
+            *(
+                f'{prefix}_stage_calls_total{{stage="{name}"}} {stage["calls"]}'
+                for name, stage in data["stages"].items()
+            ),
+        ]
+        for name, value in data["counters"].items():
+            lines += [
+                f"# TYPE {prefix}_{name}_total counter",
+                f"{prefix}_{name}_total {value}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """
+        Writes the metrics to path, as Prometheus text format if it ends in .prom, else JSON.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            if path.endswith(".prom"):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), file, indent=1)
+
+
+# The instance all modules record to.
+METRICS = Metrics()
+
+
+def add_arguments(parser):
+    """
+    Adds --metrics and --profile to the argument parser of a CLI.
+    """
+    parser.add_argument(
+        "--metrics",
+        metavar="",
+        type=str,
+        help="Writes the time per stage and counters to the file. (JSON, or Prometheus text \
+              format for .prom files)",
+    )
+
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        nargs="?",
+        const="-",
+        help="Runs under cProfile, printing the slowest functions or dumping the stats to \
+              the given file.",
+    )
+
+
+@contextmanager
+def instrumented(metrics_path: str = None, profile: str = None):
+    """
+    Enables the metrics and / or the profiler while in the context, writing them afterwards.
+    """
+    if metrics_path:
+        # Long-running processes like the daemon instrument every run on its own.
+        METRICS.reset()
+        METRICS.enabled = True
+
+    profiler = None
+    if profile:
+        # pylint: disable=import-outside-toplevel
+        # Only imported when asked for, as they add to the startup of every CLI.
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+    start = perf_counter()
+    try:
+        if profiler is None:
+            yield
+        else:
+            with profiler:
+                yield
+    finally:
+        if metrics_path:
+            METRICS.add_time("total", perf_counter() - start)
+            METRICS.enabled = False
+            METRICS.write(metrics_path)
+
+        if profiler is not None:
+            if profile == "-":
+                import pstats  # pylint: disable=import-outside-toplevel
+
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+                    "cumulative"
+                ).print_stats(25)
+            else:
+                profiler.dump_stats(profile)
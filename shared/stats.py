@@ -0,0 +1,126 @@
+"""
+Module computing the statistics of an image the tools work with from its histogram.
+
+Pillow counts the histogram in C in a single pass over the decoded pixels, everything else is
+computed from the 256 counts per band, so no copies of the pixels are made.
+"""
+
+from typing import TYPE_CHECKING, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+from shared.memory import strips
+
+# Modes whose first three (or only) bands are R, G and B (or gray) as is.
+_DIRECT_MODES = ("RGB", "RGBA", "RGBX", "L", "LA")
+
+# Weights of Pillow's RGB -> L conversion (ITU-R 601-2 luma).
+_LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+
+def _srgb_to_linear(value: float) -> float:
+    value /= 255
+    if value <= 0.04045:
+        return value / 12.92
+    return ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> float:
+    if value <= 0.0031308:
+        return value * 12.92 * 255
+    return (1.055 * value ** (1 / 2.4) - 0.055) * 255
+
+
+# Linear light of every 8 bit sRGB value.
+_LINEAR = [_srgb_to_linear(value) for value in range(256)]
+
+
+class ImageStats(NamedTuple):
+    """
+    Statistics of an image, with values on the 0-255 scale.
+
+    mean / minimum / maximum are per channel (R, G, B). luma is the mean brightness as
+    img.convert("L") would give it, up to its per-pixel rounding (less than 0.5).
+    linear_mean is the gamma-correct per channel mean (averaged in linear light, converted back
+    to sRGB) and only computed on request.
+    """
+
+    pixels: int
+    mean: Tuple[float, float, float]
+    minimum: Tuple[int, int, int]
+    maximum: Tuple[int, int, int]
+    luma: float
+    linear_mean: Optional[Tuple[float, float, float]] = None
+
+    @property
+    def average(self) -> Tuple[int, int, int]:
+        """
+        The mean color rounded to an rgb value.
+        """
+        return tuple(round(value) for value in self.mean)
+
+
+def _histogram(img: "Image.Image", strip_rows: Optional[int]) -> Tuple[str, list]:
+    """
+    Returns the mode the histogram was taken in and the histogram, converting images in
+    other modes than _DIRECT_MODES to RGB. (Strip by strip if strip_rows is set)
+    """
+    if img.mode in _DIRECT_MODES:
+        return img.mode, img.histogram()
+
+    if strip_rows is None:
+        return "RGB", img.convert("RGB").histogram()
+
+    histogram = [0] * 768
+    for box in strips(img, strip_rows):
+        part = img.crop(box).convert("RGB").histogram()
+        histogram = [total + count for total, count in zip(histogram, part)]
+    return "RGB", histogram
+
+
+def image_stats(
+    img: "Image.Image", linear: bool = False, strip_rows: Optional[int] = None
+) -> ImageStats:
+    """
+    Computes the statistics of the image from a single histogram of its RGB bands.
+
+    Images in modes other than RGB(A / X) and L(A) are converted to RGB first, strip_rows
+    rows at a time if given (see shared.memory) instead of all at once.
+    """
+    mode, histogram = _histogram(img, strip_rows)
+    bands = [histogram[start : start + 256] for start in range(0, len(histogram), 256)]
+    # Gray images are R = G = B, alpha / padding bands are ignored like by convert("RGB").
+    bands = bands[:1] * 3 if mode in ("L", "LA") else bands[:3]
+
+    pixels = sum(bands[0])
+    if pixels == 0:
+        raise ValueError("Can't compute the statistics of an empty image.")
+
+    mean = tuple(
+        sum(value * count for value, count in enumerate(band)) / pixels
+        for band in bands
+    )
+
+    linear_mean = None
+    if linear:
+        linear_mean = tuple(
+            _linear_to_srgb(
+                sum(level * count for level, count in zip(_LINEAR, band)) / pixels
+            )
+            for band in bands
+        )
+
+    return ImageStats(
+        pixels=pixels,
+        mean=mean,
+        minimum=tuple(
+            next(v for v, count in enumerate(band) if count) for band in bands
+        ),
+        maximum=tuple(
+            255 - next(v for v, count in enumerate(reversed(band)) if count)
+            for band in bands
+        ),
+        luma=sum(weight * value for weight, value in zip(_LUMA_WEIGHTS, mean)),
+        linear_mean=linear_mean,
+    )
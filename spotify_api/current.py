@@ -1,5 +1,5 @@
 """
-A simple CLI for getting the image of the currently playing song / episode via the Spotify API. 
+A simple CLI for getting the image of the currently playing song / episode via the Spotify API.
 """
 
 import argparse
@@ -8,32 +8,70 @@ from os.path import join, abspath, dirname, isdir
 from sys import path
 from sys import exit as sysexit
 from time import sleep
-from urllib.request import urlretrieve
+from typing import TYPE_CHECKING
 
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from dotenv import load_dotenv
 from colorama import Fore
 
+if TYPE_CHECKING:
+    import spotipy
+
 path.append(abspath(join(dirname(__file__), "..")))
 
 # pylint: disable=wrong-import-position
 
 from shared.sanitize import sanitize_filename
+from shared import metrics
+from shared.metrics import METRICS
 
 # pylint: enable=wrong-import-position
 
 SCOPE = "user-read-currently-playing"
 
-load_dotenv()
+_CLIENT = None
 
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=SCOPE))
 
+def get_client() -> "spotipy.Spotify":
+    """
+    Returns the Spotify client, creating it on first use so it (and its token) can be reused.
 
-def main(save_path: str, interval: int, create_no_dirs: bool):
+    spotipy, requests and the .env are only loaded here, so --help or bad arguments don't
+    wait for them.
     """
-    The main function for getting the image of the currently playing song / episode.
+    global _CLIENT  # pylint: disable=global-statement
+    if _CLIENT is None:
+        # pylint: disable=import-outside-toplevel
+        import spotipy
+        from spotipy.oauth2 import SpotifyOAuth
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _CLIENT = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=SCOPE))
+    return _CLIENT
+
+
+def get_playing(client: "spotipy.Spotify") -> tuple:
     """
+    Returns the kind (S for songs, P for episodes), id, name and image url of the currently
+    playing item, or None if nothing is playing.
+    """
+    METRICS.count("api_calls")
+    with METRICS.timer("api"):
+        data = client.currently_playing(additional_types="episode") or {}
+    item = data.get("item") or {}
+
+    if item.get("type", None) == "track":
+        return (
+            "S",
+            item["id"] or item["uri"],
+            item["name"],
+            item["album"]["images"][0]["url"],
+        )
+    if item.get("type", None) == "episode":
+        return "P", item["id"], item["name"], item["images"][0]["url"]
+    return None
+
+
+def _prepare(save_path: str, create_no_dirs: bool):
     if not create_no_dirs:
         makedirs(save_path, exist_ok=True)
     elif not isdir(save_path):
@@ -45,44 +83,101 @@ def main(save_path: str, interval: int, create_no_dirs: bool):
         )
         sysexit(1)
 
-    data = sp.currently_playing(additional_types="episode") or {}
 
-    if data.get("item", {}).get("type", None) == "track":
-        print("S ", data["item"]["name"])
+def _image_path(save_path: str, name: str) -> str:
+    return join(save_path, f"{sanitize_filename(name)}_albumCover_current.png")
 
-        img_path = join(
-            save_path,
-            f"{sanitize_filename(data["item"]["name"])}_albumCover_current.png",
-        )
 
-        urlretrieve(
-            data["item"]["album"]["images"][0]["url"],
-            img_path,
-        )
+def main(save_path: str, create_no_dirs: bool):
+    """
+    The main function for getting the image of the currently playing song / episode.
+    """
+    # pylint: disable=import-outside-toplevel
+    from shared.download import download, make_session
 
-        print(img_path)
+    _prepare(save_path, create_no_dirs)
 
-    elif data.get("item", {}).get("type", None) == "episode":
-        print("P ", data["item"]["name"])
+    playing = get_playing(get_client())
+    if playing is None:
+        print("None")
+        return
 
-        img_path = join(
-            save_path,
-            f"{sanitize_filename(data["item"]["name"])}_albumCover_current.png",
-        )
+    kind, _, name, image_url = playing
+    print(kind + " ", name)
 
-        urlretrieve(
-            data["item"]["images"][0]["url"],
-            img_path,
-        )
+    img_path = _image_path(save_path, name)
+    download(make_session(1), image_url, img_path)
 
-        print(img_path)
+    print(img_path)
 
-    else:
-        print("None")
 
+def _save_playing(session, playing: tuple, save_path: str) -> bool:
+    """
+    Downloads the image of the playing item and prints its line for watch. Returns whether
+    it worked.
+    """
+    # pylint: disable=import-outside-toplevel
+    import requests
+    from shared.download import download
 
-if __name__ == "__main__":
+    kind, _, name, image_url = playing
+    img_path = _image_path(save_path, name)
+    try:
+        download(session, image_url, img_path)
+    except (OSError, requests.RequestException) as e:
+        print(Fore.RED + "Error: " + Fore.RESET + str(e), flush=True)
+        return False
 
+    print(f"{kind}\t{img_path}\t{name}", flush=True)
+    return True
+
+
+def watch(save_path: str, interval: int, create_no_dirs: bool):
+    """
+    Polls the currently playing item every interval seconds until interrupted, reusing the
+    client (and its token) and the connection of the image downloads.
+
+    Prints a line for every change: "<S|P>\t<image path>\t<name>" or "None" once nothing is
+    playing anymore. The image is only downloaded if the item or its image url changed, so an
+    unchanged poll costs a single API call.
+    """
+    # pylint: disable=import-outside-toplevel
+    import requests
+    import spotipy
+    from shared.download import make_session
+
+    _prepare(save_path, create_no_dirs)
+
+    client = get_client()
+    session = make_session(1)
+    last = ()
+
+    try:
+        while True:
+            try:
+                playing = get_playing(client)
+            except (spotipy.SpotifyException, requests.RequestException) as e:
+                print(Fore.RED + "Error: " + Fore.RESET + str(e), flush=True)
+                sleep(interval)
+                continue
+
+            if playing is None:
+                if last is not None:
+                    print("None", flush=True)
+                last = None
+            elif last is None or playing[1:] != last[1:]:
+                if _save_playing(session, playing, save_path):
+                    last = playing
+
+            sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
     # region argsparse
 
     parser = argparse.ArgumentParser(
@@ -106,6 +201,13 @@ if __name__ == "__main__":
         help="How frequently the Spotify API should be called for the playback. Default: 10 (sec)",
     )
 
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Keeps running, printing a line for every change of the playing item.",
+    )
+
     parser.add_argument(
         "-n",
         "--create-no-dirs",
@@ -113,8 +215,29 @@ if __name__ == "__main__":
         help="Disallows the creation of any directories.",
     )
 
-    args = parser.parse_args()
+    metrics.add_arguments(parser)
 
     # endregion
 
-    main(args.path, args.interval, args.create_no_dirs)
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    args = build_parser().parse_args(argv)
+
+    if args.interval < 1:
+        print(Fore.RED + "Error: " + Fore.RESET + "--interval must be at least 1.")
+        sysexit(1)
+
+    with metrics.instrumented(args.metrics, args.profile):
+        if args.watch:
+            watch(args.path, args.interval, args.create_no_dirs)
+        else:
+            main(args.path, args.create_no_dirs)
+
+
+if __name__ == "__main__":
+    cli()
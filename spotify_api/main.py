@@ -3,48 +3,277 @@ A simple CLI for getting your most recent songs images from Spotify via the API.
 """
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
 from sys import path
 from sys import exit as sysexit
 from os import makedirs
-from os.path import join, dirname, abspath
-from urllib.request import urlretrieve
+from os.path import join, dirname, abspath, isdir, basename
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from dotenv import load_dotenv
 from colorama import Fore
 
+if TYPE_CHECKING:
+    import spotipy
+
 path.append(abspath(join(dirname(__file__), "..")))
 
 # pylint: disable=wrong-import-position
 
 from shared.sanitize import sanitize_filename
+from shared.folders import link_or_copy, free_path
+from shared import metrics
+from shared.metrics import METRICS
+from shared.download import download_all, DEFAULT_CONCURRENCY, DEFAULT_RETRIES
+
+from spotify_api.sync import (
+    SYNC_MANIFEST,
+    load_sync_manifest,
+    save_sync_manifest,
+    fetch_new_tracks,
+    needs_download,
+    known_covers,
+)
+from spotify_api.playlists import resolve
 
 # pylint: enable=wrong-import-position
 
-load_dotenv()
-
 SCOPE = "user-library-read"
 
+# Amount of liked songs fetched if no amount is given. Playlists are fetched completely.
+DEFAULT_AMOUNT = 20
+
+# Only the parts of the playlist items used for downloading the covers.
+PLAYLIST_FIELDS = (
+    "total,items(track(id,uri,name,type,artists(name),album(name,images(url))))"
+)
+
 
-def get_playlist_id(client: spotipy.Spotify, playlist_name: str):
+def get_client() -> "spotipy.Spotify":
     """
-    Searches the user's playlists and returns the playlist ID of the playlist
-    with the name matching playlist_name.
+    Creates the Spotify client. spotipy and the .env are only loaded here, so --help or bad
+    arguments don't wait for them.
+    """
+    # pylint: disable=import-outside-toplevel
+    import spotipy
+    from spotipy.oauth2 import SpotifyOAuth
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return spotipy.Spotify(auth_manager=SpotifyOAuth(scope=SCOPE))
+
+
+def get_playlist_id(client: "spotipy.Spotify", playlist_name: str, **kwargs):
+    """
+    Returns the playlist ID of the user's playlist with the name matching playlist_name,
+    looking it up in the cached playlist index (see playlists.py).
     If no matching playlist is found, exits.
     """
-    offset = 0
-    total = 9999  # run the loop least once
-    while offset + 50 <= total:
-        playlists = client.current_user_playlists(limit=50, offset=offset)
-        total = playlists["total"]
-        for playlist in playlists["items"]:
-            if playlist["name"] == playlist_name:
-                return playlist["id"]
+    playlist_id = resolve(client, playlist_name, **kwargs)
+    if playlist_id is None:
+        print(Fore.RED + "Error: " + Fore.RESET + "Couldn't find requested playlist.")
+        sysexit(1)
+    return playlist_id
+
+
+def fetch_playlist_tracks(
+    client: "spotipy.Spotify", playlist_id: str, amount: int, offset: int, **kwargs
+) -> list:
+    """
+    Gets amount (None for all) items of the playlist, starting at offset.
+
+    The first page tells the total, the remaining pages are fetched by concurrency threads.
+    Items without a cover (e.g. local files or removed songs) are skipped.
+    """
+    concurrency = kwargs.get("concurrency", DEFAULT_CONCURRENCY)
+
+    if amount is not None and amount < 1:
+        return []
+
+    def page(start: int, end: int) -> dict:
+        METRICS.count("api_calls")
+        return client.playlist_items(
+            playlist_id,
+            fields=PLAYLIST_FIELDS,
+            limit=min(100, end - start),
+            offset=start,
+            additional_types=("track",),
+        )
+
+    end = offset + (100 if amount is None else amount)
+    first = page(offset, end)
+    end = first["total"] if amount is None else min(end, first["total"])
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        pages = [first] + list(
+            pool.map(lambda start: page(start, end), range(offset + 100, end, 100))
+        )
+
+    return [
+        item
+        for result in pages
+        for item in result["items"]
+        if item["track"] and item["track"].get("album", {}).get("images")
+    ]
+
+
+def fetch_tracks(
+    client: "spotipy.Spotify", amount: int, offset: int, playlist: str, **kwargs
+) -> list:
+    """
+    Gets amount items of the playlist (Default: all) or, if it's empty, of the user's liked
+    songs (Default: DEFAULT_AMOUNT).
+    """
+    if not playlist == "":
+        playlist_id = get_playlist_id(client, playlist, **kwargs)
+        return fetch_playlist_tracks(client, playlist_id, amount, offset, **kwargs)
+
+    if amount is None:
+        amount = DEFAULT_AMOUNT
+
+    results = []
+
+    total_fetched = 0
+    while total_fetched < amount:
+        limit = min(50, amount - total_fetched)
+        METRICS.count("api_calls")
+        page = client.current_user_saved_tracks(limit=limit, offset=offset)["items"]
+        if not page:
+            break
+        results += page
+        total_fetched = len(results)
+        offset += limit
+
+    return results
+
+
+def cover_url(track: dict) -> str:
+    """
+    Returns the url of the largest album cover of the track.
+    """
+    return track["album"]["images"][0]["url"]
+
+
+def cover_key(url: str) -> str:
+    """
+    Returns a short key identifying the cover. Spotify's image urls end in the image id.
+    """
+    name = basename(urlparse(url).path)
+    if not name.isalnum():
+        name = blake2b(url.encode("utf-8"), digest_size=10).hexdigest()
+    return name[-12:]
+
+
+def cover_name(name: str, url: str = None) -> str:
+    """
+    Returns the file name of the cover of name (a song or album), made unique by the key of
+    the cover url if given.
+    """
+    if url is None:
+        return f"{name}_albumCover.jpg"
+    return f"{name}_{cover_key(url)}_albumCover.jpg"
+
+
+def _plan_downloads(results: list, save_path: str, manifest: dict, dedupe: bool):
+    """
+    Decides which covers have to be downloaded where, so each unique cover is downloaded once.
+
+    Every cover gets a tuple of paths, saving it to the first one not holding a different
+    file, so covers left by earlier runs are kept. (see folders.free_path)
+
+    Returns the (url, *paths) jobs, the (url, src, paths) links for tracks sharing a cover
+    with another track (src being the first path of its job) and the (track id, url, first
+    path) of every track that got a cover.
+    """
+    jobs = []
+    links = []
+    entries = []
+    dest_of_url = known_covers(manifest) if manifest is not None and dedupe else {}
+    downloaded = set(dest_of_url)
+    url_of_dest = {}
+
+    for idx, track in enumerate(item["track"] for item in results):
+        print(idx, track["artists"][0]["name"], " - ", track["name"])
+
+        # Local files don't have an id.
+        track_id = track["id"] or track["uri"]
+        url = cover_url(track)
+        if manifest is not None and not needs_download(manifest, track_id, url):
+            continue
+
+        if dedupe:
+            # One file per cover, named after the album.
+            dests = (
+                dest_of_url.get(url)
+                or join(
+                    save_path,
+                    cover_name(sanitize_filename(track["album"]["name"]), url),
+                ),
+            )
+        else:
+            dests = (
+                join(save_path, cover_name(sanitize_filename(track["name"]))),
+                join(save_path, cover_name(sanitize_filename(track["name"]), url)),
+            )
+            # Don't let songs with the same name overwrite each other.
+            if url_of_dest.get(dests[0], url) != url:
+                dests = dests[1:]
+            url_of_dest[dests[0]] = url
+
+        entries.append((track_id, url, dests[0]))
+
+        if url not in dest_of_url:
+            dest_of_url[url] = dests[0]
+            jobs.append((url, *dests))
+        elif url not in downloaded and dest_of_url[url] != dests[0]:
+            links.append((url, dest_of_url[url], dests))
+
+    return jobs, links, entries
+
+
+def _save_covers(jobs: list, links: list, **kwargs):
+    """
+    Downloads the jobs by concurrency threads, retrying failed downloads retries times, and
+    links the covers to the other songs sharing them. (see _plan_downloads)
+
+    Returns where the covers ended up, by the first of their paths, and the urls that failed.
+    """
+    saved = {}
+    failed = set()
+    outcomes = download_all(
+        jobs,
+        kwargs.get("concurrency", DEFAULT_CONCURRENCY),
+        retries=kwargs.get("retries", DEFAULT_RETRIES),
+    )
+    for (url, dest, *_), (saved_path, error) in zip(jobs, outcomes):
+        if error is not None:
+            failed.add(url)
+            print(
+                Fore.RED + "Error: " + Fore.RESET + f"Couldn't download {url} to {dest}"
+                f" ({error})"
+            )
+        saved[dest] = saved_path
+
+    with METRICS.timer("link"):
+        for url, src, dests in links:
+            if url not in failed:
+                src = saved[src]
+                with open(src, "rb") as file:
+                    saved[dests[0]], write = free_path(file.read(), *dests)
+                if write:
+                    link_or_copy(src, saved[dests[0]])
 
-        offset += 50
-    print(Fore.RED + "Error: " + Fore.RESET + "Couldn't find requested playlist.")
-    sysexit(1)
+    return saved, failed
+
+
+def _record_covers(manifest: dict, entries: list, saved: dict, failed: set):
+    """
+    Maps the tracks of the entries to their covers in the track manifest, unless they failed.
+    """
+    for track_id, url, dest in entries:
+        if url not in failed:
+            manifest["tracks"][track_id] = {"url": url, "file": saved.get(dest) or dest}
 
 
 def main(
@@ -53,53 +282,79 @@ def main(
     offset: int,
     create_no_dirs: bool,
     playlist: str,
+    **kwargs,
 ):
-    """Main function to get and save the images."""
+    """
+    Main function to get and save the images.
 
-    if not create_no_dirs:
-        makedirs(save_path, exist_ok=True)
+    The covers are downloaded by concurrency threads, retrying failed downloads retries times.
 
-    sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=SCOPE))
+    With sync set, only the covers of songs liked since the last sync are downloaded, keeping
+    track of them in the track manifest. (Default: <save_path>/.walltune-sync.json)
 
-    if not playlist == "":
-        playlist_id = get_playlist_id(sp, playlist)
-        results = sp.playlist(playlist_id)["tracks"]["items"]
-    else:
-        results = []
-
-        total_fetched = 0
-        while total_fetched < amount:
-            limit = min(50, amount - total_fetched)
-            results += sp.current_user_saved_tracks(limit=limit, offset=offset)["items"]
-            total_fetched = len(results)
-            offset += limit
-
-    for idx, item in enumerate(results):
-        track = item["track"]
-        safe_track_name = sanitize_filename(track["name"])
-        print(idx, track["artists"][0]["name"], " - ", track["name"])
-        try:
-            urlretrieve(
-                track["album"]["images"][0]["url"],
-                join(save_path, f"{safe_track_name}_albumCover.jpg"),
+    Covers shared by several songs are only downloaded once and hard linked to the names of
+    the other songs. With dedupe set they are instead saved once, named after the album.
+    A file of an earlier run is kept if it holds the same cover, and not overwritten if it
+    holds a different one, the cover's key being added to the name instead.
+    """
+    sync = kwargs.get("sync", False)
+    manifest_path = kwargs.get("manifest", None) or join(save_path, SYNC_MANIFEST)
+
+    if sync and playlist != "":
+        print(
+            Fore.RED
+            + "Error: "
+            + Fore.RESET
+            + "--sync only works with the liked songs, not with playlists."
+        )
+        sysexit(1)
+
+    if not create_no_dirs:
+        makedirs(save_path, exist_ok=True)
+    elif not isdir(save_path):
+        print(
+            Fore.RED
+            + "Error: "
+            + Fore.RESET
+            + f"Directory {save_path} doesn't exist and -n / --create-no-dirs is set."
+        )
+        sysexit(1)
+
+    manifest = load_sync_manifest(manifest_path) if sync else None
+    with METRICS.timer("api"):
+        if sync:
+            results = fetch_new_tracks(
+                get_client(), manifest["last_added_at"], amount or DEFAULT_AMOUNT
+            )
+        else:
+            results = fetch_tracks(
+                get_client(),
+                amount,
+                offset,
+                playlist,
+                concurrency=kwargs.get("concurrency", DEFAULT_CONCURRENCY),
             )
-        except FileNotFoundError as e:
-            if create_no_dirs:
-                print(
-                    Fore.RED
-                    + "Error: "
-                    + Fore.RESET
-                    + f"Directory {save_path} doesn't exist and -n / --create-no-dirs is set."
-                )
-                sysexit(1)
 
-            raise e
+    jobs, links, entries = _plan_downloads(
+        results, save_path, manifest, kwargs.get("dedupe", False)
+    )
 
-    print("Total fetched:", len(results))
+    saved, failed = _save_covers(jobs, links, **kwargs)
 
+    if manifest is not None:
+        _record_covers(manifest, entries, saved, failed)
+        # Failed songs have to be fetched again next time.
+        if results and not failed:
+            manifest["last_added_at"] = results[0]["added_at"]
+        save_sync_manifest(manifest_path, manifest)
+
+    print("Total fetched:", len(jobs) - len(failed))
 
-if __name__ == "__main__":
 
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI.
+    """
     # region argsparse
 
     parser = argparse.ArgumentParser(
@@ -128,8 +383,8 @@ if __name__ == "__main__":
         "--amount",
         metavar="",
         type=int,
-        default=20,
-        help="The amount of images to get. Doesn't work with playlists. Default: 20",
+        help=f"The amount of images to get. Default: {DEFAULT_AMOUNT} liked songs / the \
+              whole playlist",
     )
 
     parser.add_argument(
@@ -138,7 +393,7 @@ if __name__ == "__main__":
         metavar="",
         type=int,
         default=0,
-        help="The offset of your most recent liked songs to start from.",
+        help="The offset of your most recent liked songs / the playlist to start from.",
     )
 
     parser.add_argument(
@@ -148,14 +403,73 @@ if __name__ == "__main__":
         help="The opposite of -d. Disallows the creation of any directories.",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "-s",
+        "--sync",
+        action="store_true",
+        help="Only gets the images of songs liked since the last sync. The first sync gets \
+              --amount images.",
+    )
 
-    # endregion
+    parser.add_argument(
+        "-d",
+        "--dedupe",
+        action="store_true",
+        help="Saves every cover only once, named after its album, instead of once per song. \
+              With --sync the songs are mapped to their covers in the manifest.",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        metavar="",
+        type=str,
+        help=f"The track manifest used by --sync. Default: <path>/{SYNC_MANIFEST}",
+    )
 
-    main(
-        args.path,
-        args.amount,
-        args.offset,
-        args.create_no_dirs,
-        args.playlist,
+    parser.add_argument(
+        "--concurrency",
+        metavar="",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Amount of parallel downloads and playlist requests. \
+              Default: {DEFAULT_CONCURRENCY}",
+    )
+
+    parser.add_argument(
+        "--retries",
+        metavar="",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"How often a failed download is retried. Default: {DEFAULT_RETRIES}",
     )
+
+    metrics.add_arguments(parser)
+
+    # endregion
+
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    args = build_parser().parse_args(argv)
+
+    with metrics.instrumented(args.metrics, args.profile):
+        main(
+            args.path,
+            args.amount,
+            args.offset,
+            args.create_no_dirs,
+            args.playlist,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            sync=args.sync,
+            dedupe=args.dedupe,
+            manifest=args.manifest,
+        )
+
+
+if __name__ == "__main__":
+    cli()
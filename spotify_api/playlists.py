@@ -0,0 +1,105 @@
+"""
+Module for the persistent index resolving the names of the user's playlists to their ids.
+
+The index (JSON) is kept in the cache directory and rebuilt once it's older than its TTL or a
+name can't be found in it:
+
+    {"fetched_at": <unix time>, "playlists": {<name>: <id>}}
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs, replace
+from os.path import join, isfile, dirname
+from time import time
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import spotipy
+
+from shared.cache import cache_dir
+from shared.metrics import METRICS
+
+PLAYLIST_INDEX = "playlists.json"
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def default_index_path() -> str:
+    """
+    Returns the path of the playlist index. ($XDG_CACHE_HOME/walltune/playlists.json)
+    """
+    return join(cache_dir(), PLAYLIST_INDEX)
+
+
+def load_index(index_path: str) -> dict:
+    """
+    Loads the playlist index. A missing or broken file is an empty, outdated index.
+    """
+    if isfile(index_path):
+        try:
+            with open(index_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except ValueError:
+            pass
+    return {"fetched_at": 0, "playlists": {}}
+
+
+def save_index(index_path: str, index: dict):
+    """
+    Writes the playlist index, replacing the old one only once it's completely written.
+    """
+    makedirs(dirname(index_path), exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(index, file, indent=1)
+    replace(tmp_path, index_path)
+
+
+def fetch_index(client: "spotipy.Spotify", concurrency: int = 8) -> dict:
+    """
+    Fetches all playlists of the user. The first page tells the total, the remaining pages
+    are fetched by concurrency threads.
+
+    If several playlists share a name, the first one is kept, as Spotify lists them.
+    """
+
+    def page(offset: int) -> dict:
+        METRICS.count("api_calls")
+        return client.current_user_playlists(limit=50, offset=offset)
+
+    first = page(0)
+    with ThreadPoolExecutor(concurrency) as pool:
+        pages = [first] + list(pool.map(page, range(50, first["total"], 50)))
+
+    playlists = {}
+    for result in pages:
+        for playlist in result["items"]:
+            # Spotify returns None for playlists it can't show anymore.
+            if playlist:
+                playlists.setdefault(playlist["name"], playlist["id"])
+
+    return {"fetched_at": time(), "playlists": playlists}
+
+
+def resolve(client: "spotipy.Spotify", playlist_name: str, **kwargs) -> Optional[str]:
+    """
+    Returns the id of the user's playlist named playlist_name, or None if there's none.
+
+    Fresh indexes answer without any API call. Outdated indexes and misses (e.g. a new
+    playlist) refetch the index once.
+    """
+    index_path = kwargs.get("index_path", None) or default_index_path()
+    ttl = kwargs.get("ttl", DEFAULT_TTL)
+
+    index = load_index(index_path)
+    if time() - index["fetched_at"] < ttl and playlist_name in index["playlists"]:
+        return index["playlists"][playlist_name]
+
+    index = fetch_index(client, kwargs.get("concurrency", 8))
+    try:
+        save_index(index_path, index)
+    except OSError:
+        # The index only saves time, so a read-only cache doesn't matter.
+        pass
+
+    return index["playlists"].get(playlist_name)
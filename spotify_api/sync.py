@@ -0,0 +1,87 @@
+"""
+Module for incrementally syncing the covers of the liked songs.
+
+The track manifest (JSON) remembers every downloaded cover and the added_at timestamp of the
+newest synced song, so later syncs only page through the songs liked since then:
+
+    {"last_added_at": <timestamp>, "tracks": {<track id>: {"url": <url>, "file": <path>}}}
+"""
+
+import json
+from os import replace
+from os.path import isfile
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import spotipy
+
+from shared.metrics import METRICS
+
+SYNC_MANIFEST = ".walltune-sync.json"
+
+
+def load_sync_manifest(manifest_path: str) -> dict:
+    """
+    Loads the track manifest. A missing file is an empty manifest.
+    """
+    if not isfile(manifest_path):
+        return {"last_added_at": None, "tracks": {}}
+
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_sync_manifest(manifest_path: str, manifest: dict):
+    """
+    Writes the track manifest, replacing the old one only once it's completely written.
+    """
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1)
+    replace(tmp_path, manifest_path)
+
+
+def fetch_new_tracks(
+    client: "spotipy.Spotify", last_added_at: str, amount: int
+) -> list:
+    """
+    Gets the liked songs added after last_added_at, newest first.
+
+    Stops paging at the first older song. Without a last_added_at (first sync) only the amount
+    most recent songs are fetched.
+    """
+    results = []
+    offset = 0
+    while True:
+        limit = 50 if last_added_at else min(50, amount - len(results))
+        if limit <= 0:
+            return results
+
+        METRICS.count("api_calls")
+        page = client.current_user_saved_tracks(limit=limit, offset=offset)
+        for item in page["items"]:
+            # ISO 8601 timestamps in UTC compare correctly as strings.
+            if last_added_at and item["added_at"] <= last_added_at:
+                return results
+            results.append(item)
+
+        if page["next"] is None:
+            return results
+        offset += limit
+
+
+def known_covers(manifest: dict) -> dict:
+    """
+    Returns the file of every cover url in the manifest.
+    """
+    return {entry["url"]: entry["file"] for entry in manifest["tracks"].values()}
+
+
+def needs_download(manifest: dict, track_id: str, url: str) -> bool:
+    """
+    Checks whether the cover of the track is new or has changed since the last sync.
+
+    The local file isn't checked, as the other CLIs usually move it away.
+    """
+    known = manifest["tracks"].get(track_id)
+    return known is None or known["url"] != url
@@ -0,0 +1,53 @@
+"""
+Shared fixtures of the tests, which make their images on the fly.
+"""
+
+from os.path import join, abspath, dirname
+from sys import path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+path.append(abspath(join(dirname(__file__), "..")))
+
+
+def _pixels(width: int, height: int, seed: int) -> np.ndarray:
+    """
+    Gradients, noise and flat blocks, so averages are neither trivial nor all 127.
+    """
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height)[:, None]
+    x = np.linspace(0, 1, width)[None, :]
+    pixels = np.stack(
+        np.broadcast_arrays(200 * x * y, 255 * (1 - x), 60 + 150 * y**2), axis=-1
+    )
+    pixels += rng.normal(0, 25, (height, width, 3))
+    block = max(1, min(width, height) // 4)
+    pixels[:block, :block] = (250, 30, 10)
+    return pixels.clip(0, 255).astype(np.uint8)
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    """
+    Keeps the caches (colors, playlist index) of the tests out of the user's cache dir.
+    """
+    monkeypatch.setenv("XDG_CACHE_HOME", join(tmp_path, "cache-home"))
+
+
+@pytest.fixture
+def make_image(tmp_path):
+    """
+    Returns a function writing a test image of the size and mode to tmp_path.
+    """
+
+    def make(name: str, size=(640, 480), mode: str = "RGB", seed: int = 0) -> str:
+        img = Image.fromarray(_pixels(*size, seed))
+        if mode != "RGB":
+            img = img.convert(mode)
+        image_path = join(tmp_path, name)
+        img.save(image_path)
+        return image_path
+
+    return make
@@ -0,0 +1,38 @@
+"""
+Tests of adjustbrightness.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from os.path import dirname
+
+import pytest
+from PIL import Image, ImageEnhance
+
+from adjustbrightness.main import adjustbrightness, main
+
+
+@pytest.mark.parametrize("move", [False, True])
+@pytest.mark.parametrize("condition", [255, 0])
+def test_in_place(make_image, move, condition):
+    image_path = make_image("x.jpg")
+
+    # condition 255 leaves the image unchanged, 0 adjusts it.
+    main(image_path, dirname(image_path), condition, 0.5, move=move)
+
+    with open(image_path, "rb") as file:
+        assert file.read(2) == b"\xff\xd8"
+
+
+@pytest.mark.parametrize("mode", ["L", "LA", "RGB", "RGBA", "CMYK"])
+@pytest.mark.parametrize("mod", [0.0, 0.37, 0.5, 1.0, 1.8])
+@pytest.mark.parametrize("strip_rows", [None, 16, 1000])
+def test_matches_enhance(make_image, mode, mod, strip_rows):
+    with Image.open(make_image("x.png", (97, 61))) as img:
+        img = img.convert(mode)
+
+    expected = ImageEnhance.Brightness(img).enhance(mod)
+    adjusted = adjustbrightness(img.copy(), mod, strip_rows)
+
+    assert adjusted.mode == expected.mode
+    assert adjusted.tobytes() == expected.tobytes()
@@ -0,0 +1,134 @@
+"""
+Tests of the on-disk color cache.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from itertools import count
+from os import stat, utime
+from os.path import join
+
+import pytest
+
+from shared import cache as color_cache
+from shared.cache import ColorCache
+
+RED = (200, 10, 10)
+
+
+def _write(path: str, data: bytes) -> str:
+    with open(path, "wb") as file:
+        file.write(data)
+    return path
+
+
+@pytest.fixture(name="db_path")
+def fixture_db_path(tmp_path):
+    return join(tmp_path, "cache", "colors.sqlite")
+
+
+def test_hit_after_put(tmp_path, db_path):
+    image_path = _write(join(tmp_path, "a.jpg"), b"a")
+
+    with ColorCache(db_path) as cache:
+        assert cache.get(image_path) is None
+        cache.put(image_path, RED)
+        assert cache.get(image_path) == RED
+
+    # Kept across runs.
+    with ColorCache(db_path) as cache:
+        assert cache.get(image_path, stat(image_path)) == RED
+
+
+def test_miss_after_change(tmp_path, db_path):
+    image_path = _write(join(tmp_path, "a.jpg"), b"a")
+
+    with ColorCache(db_path) as cache:
+        cache.put(image_path, RED)
+
+        file_stat = stat(image_path)
+        utime(image_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10**9))
+        assert cache.get(image_path) is None
+
+        cache.put(image_path, RED)
+        _write(image_path, b"longer")
+        utime(image_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10**9))
+        assert cache.get(image_path) is None
+
+
+def test_variants(tmp_path, db_path):
+    image_path = _write(join(tmp_path, "a.jpg"), b"a")
+
+    with ColorCache(db_path) as cache:
+        cache.put(image_path, RED, variant=65_536)
+
+        assert cache.get(image_path) is None
+        assert cache.get(image_path, variant=65_536) == RED
+
+
+@pytest.mark.parametrize("use_hash", [False, True])
+def test_hash(tmp_path, db_path, use_hash):
+    image_path = _write(join(tmp_path, "a.jpg"), b"a")
+    file_stat = stat(image_path)
+
+    with ColorCache(db_path, use_hash=use_hash) as cache:
+        cache.put(image_path, RED)
+
+        # Same size and mtime, different contents.
+        _write(image_path, b"b")
+        utime(image_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+
+        assert cache.get(image_path) == (None if use_hash else RED)
+
+
+def test_refresh(tmp_path, db_path):
+    image_path = _write(join(tmp_path, "a.jpg"), b"a")
+    with ColorCache(db_path) as cache:
+        cache.put(image_path, RED)
+
+    with ColorCache(db_path, refresh=True) as cache:
+        assert cache.get(image_path) is None
+        cache.put(image_path, (1, 2, 3))
+
+    with ColorCache(db_path) as cache:
+        assert cache.get(image_path) == (1, 2, 3)
+
+
+def test_evicts_least_recently_used(tmp_path, db_path, monkeypatch):
+    # A clock that never ties.
+    clock = count()
+    monkeypatch.setattr(color_cache, "time", lambda: next(clock))
+    paths = [_write(join(tmp_path, f"{name}.jpg"), b"a") for name in "abc"]
+
+    with ColorCache(db_path, max_entries=2) as cache:
+        cache.put(paths[0], RED)
+        cache.put(paths[1], RED)
+        # Replacing an entry doesn't count as a new one.
+        cache.put(paths[1], RED)
+        # Used last, so b is the least recently used.
+        assert cache.get(paths[0]) == RED
+
+        cache.put(paths[2], RED)
+
+        assert cache.get(paths[1]) is None
+        assert cache.get(paths[0]) == RED
+        assert cache.get(paths[2]) == RED
+
+    # The limit holds for the entries of earlier runs too.
+    with ColorCache(db_path, max_entries=1) as cache:
+        cache.put(paths[1], RED)
+        assert [cache.get(path) for path in paths] == [None, RED, None]
+
+
+def test_drops_outdated_schema(tmp_path, db_path, monkeypatch):
+    image_path = _write(join(tmp_path, "a.jpg"), b"a")
+    with ColorCache(db_path) as cache:
+        cache.put(image_path, RED)
+
+    monkeypatch.setattr(color_cache, "SCHEMA_VERSION", color_cache.SCHEMA_VERSION + 1)
+    with ColorCache(db_path) as cache:
+        assert cache.get(image_path) is None
+        cache.put(image_path, RED)
+
+    with ColorCache(db_path) as cache:
+        assert cache.get(image_path) == RED
@@ -0,0 +1,154 @@
+"""
+Tests of the currently playing CLI, with the Spotify API replaced by a scripted player and the
+images served by a local HTTP server.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from os import listdir, makedirs
+from os.path import join
+from types import SimpleNamespace
+
+import pytest
+import spotipy
+
+from benchmarks.mock_spotify import serve_directory
+from shared import download as downloads
+from spotify_api import current
+
+
+@pytest.fixture(name="base_url")
+def fixture_base_url(tmp_path):
+    """
+    Serves the images a.jpg and b.jpg, yielding the base url.
+    """
+    directory = join(tmp_path, "images")
+    makedirs(directory)
+    for name in ("a", "b"):
+        with open(join(directory, f"{name}.jpg"), "wb") as file:
+            file.write(name.encode() * 100)
+
+    with serve_directory(directory) as base_url:
+        yield base_url
+
+
+def _track(name: str, url: str) -> dict:
+    return {
+        "item": {
+            "type": "track",
+            "id": name,
+            "uri": "",
+            "name": name,
+            "album": {"images": [{"url": url}]},
+        }
+    }
+
+
+def _episode(name: str, url: str) -> dict:
+    return {
+        "item": {"type": "episode", "id": name, "name": name, "images": [{"url": url}]}
+    }
+
+
+def _player(polls: list) -> SimpleNamespace:
+    """
+    Answers currently_playing with the polls in turn, raising the exceptions among them.
+    """
+    polls = list(polls)
+
+    def currently_playing(**_):
+        poll = polls.pop(0)
+        if isinstance(poll, Exception):
+            raise poll
+        return poll
+
+    return SimpleNamespace(polls=polls, currently_playing=currently_playing)
+
+
+@pytest.fixture(name="watch")
+def fixture_watch(tmp_path, monkeypatch):
+    """
+    Returns a function watching the polls until they run out, returning the downloaded urls.
+    """
+    downloaded = []
+    download = downloads.download
+
+    def counted(session, url, *dests, **kwargs):
+        downloaded.append(url)
+        return download(session, url, *dests, **kwargs)
+
+    def run(polls: list) -> list:
+        player = _player(polls)
+
+        def sleep(_):
+            if not player.polls:
+                raise KeyboardInterrupt
+
+        monkeypatch.setattr(current, "get_client", lambda: player)
+        monkeypatch.setattr(current, "sleep", sleep)
+        monkeypatch.setattr(downloads, "download", counted)
+        current.watch(str(tmp_path / "out"), 1, False)
+        return downloaded
+
+    return run
+
+
+def test_watch(base_url, tmp_path, watch, capsys):
+    downloaded = watch(
+        [
+            _track("Song", f"{base_url}/a.jpg"),
+            # Unchanged, so nothing is downloaded or printed.
+            _track("Song", f"{base_url}/a.jpg"),
+            None,
+            None,
+            _episode("Episode", f"{base_url}/b.jpg"),
+            _track("Song", f"{base_url}/a.jpg"),
+        ]
+    )
+
+    out_path = join(tmp_path, "out")
+    assert capsys.readouterr().out.splitlines() == [
+        f"S\t{join(out_path, 'Song_albumCover_current.png')}\tSong",
+        "None",
+        f"P\t{join(out_path, 'Episode_albumCover_current.png')}\tEpisode",
+        f"S\t{join(out_path, 'Song_albumCover_current.png')}\tSong",
+    ]
+    assert downloaded == [f"{base_url}/{name}.jpg" for name in "aba"]
+    assert sorted(listdir(out_path)) == [
+        "Episode_albumCover_current.png",
+        "Song_albumCover_current.png",
+    ]
+
+
+def test_watch_keeps_going_after_errors(base_url, watch, capsys):
+    downloaded = watch(
+        [
+            spotipy.SpotifyException(429, -1, "Too many requests"),
+            _track("Gone", f"{base_url}/missing.jpg"),
+            # Tried again, as it failed before.
+            _track("Gone", f"{base_url}/a.jpg"),
+        ]
+    )
+
+    lines = capsys.readouterr().out.splitlines()
+    assert "Too many requests" in lines[0] and "404" in lines[1]
+    assert lines[2].startswith("S\t") and len(lines) == 3
+    assert downloaded == [f"{base_url}/missing.jpg", f"{base_url}/a.jpg"]
+
+
+def test_once(base_url, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(
+        current, "get_client", lambda: _player([_track("Song", f"{base_url}/b.jpg")])
+    )
+
+    current.main(str(tmp_path), False)
+
+    image_path = join(tmp_path, "Song_albumCover_current.png")
+    assert capsys.readouterr().out.splitlines() == ["S  Song", image_path]
+    with open(image_path, "rb") as file:
+        assert file.read() == b"b" * 100
+
+
+def test_interval_too_short():
+    with pytest.raises(SystemExit):
+        current.cli(["out", "--interval", "0", "--watch"])
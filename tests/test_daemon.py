@@ -0,0 +1,99 @@
+"""
+Tests of the daemon and its client.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import threading
+from os import getcwd, listdir, makedirs
+from os.path import dirname, join
+
+import pytest
+
+from daemon import client
+from daemon.main import Daemon
+from shared.cache import ColorCache
+
+
+@pytest.fixture(name="serve")
+def fixture_serve(tmp_path, monkeypatch):
+    """
+    Returns a function starting a daemon with the cache on a socket in tmp_path.
+    """
+    monkeypatch.setenv("XDG_CACHE_HOME", join(tmp_path, "cache"))
+    servers = []
+
+    def start(cache: ColorCache = None) -> str:
+        socket_path = join(tmp_path, "walltune.sock")
+        server = Daemon(socket_path, cache)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return socket_path
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_relative_path(make_image, tmp_path, monkeypatch):
+    image_path = make_image("x.png")
+    server = Daemon(join(tmp_path, "walltune.sock"))
+    makedirs(join(tmp_path, "elsewhere"))
+    monkeypatch.chdir(join(tmp_path, "elsewhere"))
+
+    response = server.execute(
+        {
+            "command": "average",
+            "argv": ["x.png", "--no-cache"],
+            "cwd": dirname(image_path),
+        }
+    )
+    server.server_close()
+
+    assert response["status"] == 0, response["stderr"]
+    assert response["stdout"].startswith("(")
+    assert getcwd() == join(tmp_path, "elsewhere")
+
+
+def test_no_cache(make_image, serve, tmp_path):
+    image_path = make_image("x.png")
+    # Started with --no-cache.
+    socket_path = serve(None)
+
+    response = client.request("average", [image_path], socket_path)
+
+    assert response["status"] == 0, response["stderr"]
+    assert "cache" not in listdir(tmp_path)
+
+
+def test_shared_cache(make_image, serve, tmp_path):
+    image_path = make_image("x.png")
+    makedirs(join(tmp_path, "cache"))
+    cache = ColorCache(join(tmp_path, "cache", "daemon.sqlite"))
+    socket_path = serve(cache)
+
+    first = client.request("average", [image_path], socket_path)
+    second = client.request("average", [image_path], socket_path)
+
+    assert first["stdout"] == second["stdout"]
+    assert listdir(join(tmp_path, "cache")) == ["daemon.sqlite"]
+    cache.close()
+
+
+def test_report_reaches_client(make_image, tmp_path):
+    for idx in range(3):
+        make_image(f"{idx}.png", (32, 32), seed=idx)
+    server = Daemon(join(tmp_path, "walltune.sock"))
+
+    response = server.execute(
+        {
+            "command": "average",
+            "argv": [str(tmp_path), "-r", "-j", "2", "--threads", "--no-cache"],
+        }
+    )
+    server.server_close()
+
+    assert len(response["stdout"].splitlines()) == 3
+    assert "Averaged 3 images with 2 threads" in response["stderr"]
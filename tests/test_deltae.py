@@ -0,0 +1,81 @@
+"""
+Tests of the vectorized color differences and the palette index.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import numpy as np
+import pytest
+
+from shared.deltae import (
+    PaletteIndex,
+    ciede2000,
+    delta_e_lower_bound,
+    lab_to_rgb,
+    rgb_to_lab,
+)
+
+
+def _palette(kind: str) -> np.ndarray:
+    """
+    Returns an sRGB palette larger than PaletteIndex.brute_force_size.
+    """
+    rng = np.random.default_rng(1)
+    if kind == "random":
+        return rng.integers(0, 256, (200, 3))
+    if kind == "grid":
+        levels = np.linspace(0, 255, 5).round()
+        return np.stack(np.meshgrid(levels, levels, levels), axis=-1).reshape(-1, 3)
+    # duplicates, so ties have to go to the first one
+    colors = rng.integers(0, 256, (20, 3))
+    return np.concatenate([colors, colors[::-1], colors])
+
+
+@pytest.mark.parametrize("kind", ["random", "grid", "duplicates"])
+def test_palette_index_matches_brute_force(kind):
+    palette = rgb_to_lab(_palette(kind))
+    assert len(palette) > PaletteIndex.brute_force_size
+
+    rng = np.random.default_rng(2)
+    queries = rgb_to_lab(
+        np.concatenate(
+            [
+                rng.integers(0, 256, (3000, 3)),
+                # Grays and the palette colors themselves (Delta-E 0)
+                np.repeat(np.arange(0, 256, 5)[:, None], 3, axis=1),
+                _palette(kind),
+            ]
+        )
+    )
+
+    indices, deltas = PaletteIndex(palette, chunk_size=500).nearest(queries)
+
+    expected = ciede2000(queries, palette)
+    np.testing.assert_array_equal(indices, expected.argmin(axis=1))
+    np.testing.assert_allclose(deltas, expected.min(axis=1))
+
+
+def test_lower_bound():
+    rng = np.random.default_rng(3)
+    lab1 = rgb_to_lab(rng.integers(0, 256, (1000, 3)))
+    lab2 = rgb_to_lab(rng.integers(0, 256, (1000, 3)))
+
+    assert np.all(delta_e_lower_bound(lab1, lab2) <= ciede2000(lab1, lab2).diagonal())
+
+
+def test_matches_pyciede2000():
+    pyciede2000 = pytest.importorskip("pyciede2000")
+    rng = np.random.default_rng(4)
+    lab1 = rgb_to_lab(rng.integers(0, 256, (200, 3)))
+    lab2 = rgb_to_lab(rng.integers(0, 256, (200, 3)))
+
+    expected = [
+        pyciede2000.ciede2000(tuple(one), tuple(two))["delta_E_00"]
+        for one, two in zip(lab1, lab2)
+    ]
+    np.testing.assert_allclose(ciede2000(lab1, lab2).diagonal(), expected)
+
+
+def test_lab_round_trip():
+    rgb = np.random.default_rng(5).integers(0, 256, (1000, 3))
+    np.testing.assert_array_equal(lab_to_rgb(rgb_to_lab(rgb)), rgb)
@@ -0,0 +1,138 @@
+"""
+Tests of the downloads, against a local HTTP server misbehaving on purpose.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import listdir, stat
+from os.path import join
+from threading import Thread
+
+import pytest
+import requests
+
+from shared import download as downloads
+
+BODY = b"cover" * 100
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    /ok answers BODY, /truncated announces more than it sends, /flaky fails twice with a 503
+    before answering and /missing is a 404.
+    """
+
+    protocol_version = "HTTP/1.1"
+    hits = Counter()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.hits[self.path] += 1
+        if self.path == "/missing" or (
+            self.path == "/flaky" and self.hits[self.path] <= 2
+        ):
+            self.send_response(404 if self.path == "/missing" else 503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        if self.path == "/truncated":
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(BODY[:10])
+            self.close_connection = True
+            return
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture(name="base_url")
+def fixture_base_url():
+    """
+    Serves _Handler on a free local port, yielding its url.
+    """
+    _Handler.hits = Counter()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_download(base_url, tmp_path):
+    dest = join(tmp_path, "cover.jpg")
+
+    assert downloads.download_all([(f"{base_url}/ok", dest)]) == [(dest, None)]
+
+    with open(dest, "rb") as file:
+        assert file.read() == BODY
+    assert listdir(tmp_path) == ["cover.jpg"]
+
+
+def test_truncated(base_url, tmp_path):
+    dest = join(tmp_path, "cover.jpg")
+
+    ((saved, error),) = downloads.download_all(
+        [(f"{base_url}/truncated", dest)], backoff=0
+    )
+
+    assert saved is None and error is not None
+    # Retried, as the connection may just have dropped.
+    assert _Handler.hits["/truncated"] == downloads.DEFAULT_RETRIES + 1
+    assert listdir(tmp_path) == []
+
+
+def test_keeps_other_files(base_url, tmp_path):
+    dests = [join(tmp_path, "a.jpg"), join(tmp_path, "b.jpg")]
+    with open(dests[0], "wb") as file:
+        file.write(b"other")
+    session = downloads.make_session()
+
+    assert downloads.download(session, f"{base_url}/ok", *dests) == dests[1]
+    mtime = stat(dests[1]).st_mtime_ns
+    # Already there, so nothing is written.
+    assert downloads.download(session, f"{base_url}/ok", *dests) == dests[1]
+
+    assert stat(dests[1]).st_mtime_ns == mtime
+    with open(dests[0], "rb") as file:
+        assert file.read() == b"other"
+
+
+def test_retries_server_errors(base_url):
+    session = downloads.make_session()
+
+    assert downloads.fetch(session, f"{base_url}/flaky", backoff=0) == BODY
+    assert _Handler.hits["/flaky"] == 3
+
+
+def test_no_retry_on_client_errors(base_url):
+    session = downloads.make_session()
+
+    with pytest.raises(requests.HTTPError):
+        downloads.fetch(session, f"{base_url}/missing", backoff=0)
+    assert _Handler.hits["/missing"] == 1
+
+
+def test_interrupted(base_url, tmp_path, monkeypatch):
+    dest = join(tmp_path, "cover.jpg")
+    with open(dest, "wb") as file:
+        file.write(b"old")
+
+    def interrupt(*_):
+        raise KeyboardInterrupt
+
+    # Interrupted once the data is written, right before it would replace dest.
+    monkeypatch.setattr(downloads, "replace", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        downloads.download(downloads.make_session(), f"{base_url}/ok", dest)
+
+    assert listdir(tmp_path) == ["cover.jpg"]
+    with open(dest, "rb") as file:
+        assert file.read() == b"old"
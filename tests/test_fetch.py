@@ -0,0 +1,155 @@
+"""
+Tests of spotify_api, with the Spotify API replaced by local tracks and the covers served by
+a local HTTP server.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from os import listdir, makedirs
+from os.path import join
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.mock_spotify import FakeSpotify, serve_directory
+from spotify_api import main as fetch
+
+
+@pytest.fixture(name="covers")
+def fixture_covers(tmp_path):
+    """
+    Serves the covers a.jpg and b.jpg, yielding the base url.
+    """
+    directory = join(tmp_path, "covers")
+    makedirs(directory)
+    for name in ("a", "b"):
+        with open(join(directory, f"{name}.jpg"), "wb") as file:
+            file.write(name.encode() * 100)
+
+    with serve_directory(directory) as base_url:
+        yield base_url
+
+
+def _track(name: str, url: str) -> dict:
+    return {
+        "added_at": "2024-01-01T00:00:00Z",
+        "track": {
+            "id": f"{name}-{url}",
+            "uri": "",
+            "name": name,
+            "artists": [{"name": "Artist"}],
+            "album": {"name": "Album", "images": [{"url": url}]},
+        },
+    }
+
+
+def _run(monkeypatch, save_path: str, tracks: list, **kwargs):
+    monkeypatch.setattr(fetch, "get_client", FakeSpotify(tracks))
+    fetch.main(save_path, len(tracks), 0, False, "", **kwargs)
+
+
+def _contents(save_path: str) -> dict:
+    contents = {}
+    for name in listdir(save_path):
+        with open(join(save_path, name), "rb") as file:
+            contents[name] = file.read()[:1]
+    return contents
+
+
+def test_runs_keep_earlier_covers(covers, tmp_path, monkeypatch):
+    save_path = join(tmp_path, "out")
+
+    _run(monkeypatch, save_path, [_track("Song", f"{covers}/a.jpg")])
+    # Another song of the same name.
+    _run(monkeypatch, save_path, [_track("Song", f"{covers}/b.jpg")])
+    assert sorted(_contents(save_path).values()) == [b"a", b"b"]
+    assert _contents(save_path)["Song_albumCover.jpg"] == b"a"
+
+    # Both are there already.
+    _run(monkeypatch, save_path, [_track("Song", f"{covers}/a.jpg")])
+    _run(monkeypatch, save_path, [_track("Song", f"{covers}/b.jpg")])
+    assert len(listdir(save_path)) == 2
+
+
+def test_runs_keep_earlier_links(covers, tmp_path, monkeypatch):
+    save_path = join(tmp_path, "out")
+
+    _run(monkeypatch, save_path, [_track("Other", f"{covers}/b.jpg")])
+    _run(
+        monkeypatch,
+        save_path,
+        [_track("Song", f"{covers}/a.jpg"), _track("Other", f"{covers}/a.jpg")],
+    )
+
+    contents = _contents(save_path)
+    assert len(contents) == 3
+    assert contents["Other_albumCover.jpg"] == b"b"
+    assert contents["Song_albumCover.jpg"] == b"a"
+
+
+def _playlist(items: list, calls: list) -> SimpleNamespace:
+    """
+    A client answering playlist_items with pages of the items, recording every call.
+    """
+
+    def playlist_items(playlist_id, fields, limit, offset, additional_types):
+        calls.append((playlist_id, fields, limit, offset, additional_types))
+        assert 0 < limit <= 100
+        return {"total": len(items), "items": items[offset : offset + limit]}
+
+    return SimpleNamespace(playlist_items=playlist_items)
+
+
+def _items(count: int) -> list:
+    return [
+        {"track": {"id": f"track{idx}", "album": {"images": [{"url": str(idx)}]}}}
+        for idx in range(count)
+    ]
+
+
+@pytest.mark.parametrize(
+    "amount, offset, expected",
+    [
+        (None, 0, range(250)),
+        (None, 120, range(120, 250)),
+        (120, 30, range(30, 150)),
+        (500, 0, range(250)),
+        (100, 0, range(100)),
+        (5, 248, range(248, 250)),
+    ],
+)
+def test_playlist_pages(amount, offset, expected):
+    calls = []
+
+    tracks = fetch.fetch_playlist_tracks(
+        _playlist(_items(250), calls), "id", amount, offset, concurrency=4
+    )
+
+    assert [item["track"]["id"] for item in tracks] == [
+        f"track{idx}" for idx in expected
+    ]
+    # Only the fields used are asked for, and every page once.
+    assert {call[1] for call in calls} == {fetch.PLAYLIST_FIELDS}
+    assert {call[4] for call in calls} == {("track",)}
+    assert sorted(call[3] for call in calls) == list(
+        range(offset, offset + len(expected), 100)
+    )
+
+
+def test_playlist_nothing_asked_for():
+    calls = []
+
+    assert not fetch.fetch_playlist_tracks(_playlist(_items(10), calls), "id", 0, 0)
+    assert not calls
+
+
+def test_playlist_skips_items_without_cover():
+    items = _items(5)
+    # Removed songs, local files and songs without images.
+    items[1]["track"] = None
+    items[2]["track"] = {"id": None, "album": {}}
+    items[3]["track"]["album"]["images"] = []
+
+    tracks = fetch.fetch_playlist_tracks(_playlist(items, []), "id", None, 0)
+
+    assert [item["track"]["id"] for item in tracks] == ["track0", "track4"]
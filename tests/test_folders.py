@@ -0,0 +1,93 @@
+"""
+Tests of scanning directories. (shared.folders.scan)
+"""
+
+# pylint: disable=missing-function-docstring
+
+from os import makedirs, symlink
+from os.path import dirname, join, relpath
+
+import pytest
+
+from shared import folders
+
+
+def _tree(root: str, *files: str) -> str:
+    for name in files:
+        path = join(root, name)
+        makedirs(dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"")
+    return root
+
+
+def _scan(root: str, **kwargs) -> list:
+    return sorted(relpath(entry.path, root) for entry in folders.scan(root, **kwargs))
+
+
+def test_scan_images(tmp_path):
+    root = _tree(
+        str(tmp_path), "a.jpg", "B.PNG", "notes.txt", "sub/c.webp", "sub/deep/d.JPEG"
+    )
+
+    assert _scan(root) == ["B.PNG", "a.jpg", "sub/c.webp", "sub/deep/d.JPEG"]
+    assert len(_scan(root, extensions=None)) == 5
+    assert _scan(root, extensions=(".TXT",)) == ["notes.txt"]
+
+
+def test_exclude(tmp_path):
+    root = _tree(
+        str(tmp_path), "a.jpg", "skip.jpg", "thumbs/b.jpg", "keep/c.jpg", "keep/d.jpg"
+    )
+
+    assert _scan(root, exclude=["skip.*", "thumbs"]) == [
+        "a.jpg",
+        "keep/c.jpg",
+        "keep/d.jpg",
+    ]
+    # Absolute paths match too.
+    assert _scan(root, exclude=[join(root, "keep", "*")]) == [
+        "a.jpg",
+        "skip.jpg",
+        "thumbs/b.jpg",
+    ]
+
+
+def test_symlinks(tmp_path):
+    root = _tree(str(tmp_path / "root"), "a.jpg", "sub/b.jpg")
+    _tree(str(tmp_path / "other"), "c.jpg")
+    symlink(join(tmp_path, "other"), join(root, "linked"))
+    symlink(join(tmp_path, "other", "c.jpg"), join(root, "c_link.jpg"))
+    symlink(join(tmp_path, "missing.jpg"), join(root, "broken.jpg"))
+    # Loops back up, and reaches sub a second time.
+    symlink(root, join(root, "sub", "loop"))
+    symlink(join(root, "sub"), join(root, "sub_again"))
+
+    # Linked files are files either way, broken links are skipped.
+    assert _scan(root) == ["a.jpg", "c_link.jpg", "sub/b.jpg"]
+
+    scanned = _scan(root, follow_symlinks=True)
+    assert scanned[:3] == ["a.jpg", "c_link.jpg", "linked/c.jpg"]
+    # Every dir once, whichever way it was reached.
+    assert len(scanned) == 4
+    assert scanned[3] in ("sub/b.jpg", "sub_again/b.jpg")
+
+
+@pytest.mark.parametrize("follow_symlinks", [False, True])
+def test_sort(tmp_path, follow_symlinks):
+    root = _tree(
+        str(tmp_path), "b.jpg", "a.jpg", "z/y.jpg", "z/x.jpg", "m/n.jpg", "c.jpg"
+    )
+
+    paths = [
+        relpath(entry.path, root)
+        for entry in folders.scan(root, sort=True, follow_symlinks=follow_symlinks)
+    ]
+
+    # Files of a dir, then its dirs, all by name.
+    assert paths == ["a.jpg", "b.jpg", "c.jpg", "m/n.jpg", "z/x.jpg", "z/y.jpg"]
+
+
+def test_missing_root(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(folders.scan(join(tmp_path, "missing")))
@@ -0,0 +1,158 @@
+"""
+Tests of grouping: classifying colors, taking them from a color manifest and discovering the
+palette with --auto.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import json
+from os import listdir
+from os.path import join
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from grouping import main as grouping
+from shared.kmeans import kmeans
+
+# Dark red, green and light blue.
+CLUSTERS = [(120, 20, 20), (30, 160, 40), (170, 200, 250)]
+
+
+def _clustered(count: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    centers = np.array(CLUSTERS)[rng.integers(len(CLUSTERS), size=count)]
+    return [
+        tuple(color)
+        for color in (centers + rng.normal(0, 4, centers.shape)).round().astype(int)
+    ]
+
+
+def test_new_manifest_reuses_scan(make_image, tmp_path, monkeypatch):
+    for idx in range(3):
+        make_image(f"{idx}.png", (32, 32), seed=idx)
+    json_path = join(tmp_path, "options.json")
+    with open(json_path, "w", encoding="utf-8") as file:
+        json.dump({join(tmp_path, "out"): [0, 0, 0]}, file)
+
+    stat_results = []
+    make_record = grouping.make_record
+
+    def record(file, color, stat_result=None):
+        stat_results.append(stat_result)
+        return make_record(file, color, stat_result)
+
+    monkeypatch.setattr(grouping, "make_record", record)
+
+    # The manifest doesn't exist yet, so it starts out empty.
+    manifest_path = join(tmp_path, "colors.ndjson")
+    grouping.main(str(tmp_path), json_path, manifest=manifest_path, dry_run=True)
+
+    assert len(stat_results) == 3
+    assert None not in stat_results
+
+
+@pytest.mark.parametrize("legacy", [False, True])
+def test_classify_matches_pairwise(tmp_path, legacy):
+    rng = np.random.default_rng(6)
+    palette = {
+        f"group{idx}": color
+        for idx, color in enumerate(rng.integers(0, 256, (40, 3)).tolist())
+    }
+    json_path = join(tmp_path, "options.json")
+    with open(json_path, "w", encoding="utf-8") as file:
+        json.dump(palette, file)
+    colors = [tuple(color) for color in rng.integers(0, 256, (200, 3)).tolist()]
+    # Above every legacy Delta-E, so only CIELAB ones can fall back.
+    threshold = 5
+
+    save_paths = grouping.classify(
+        colors, grouping.load_palette(json_path, legacy), threshold, "fallback"
+    )
+
+    for color, save_path in zip(colors, save_paths):
+        deltas = {
+            key: grouping.calculate_delta_e(value, color, legacy)
+            for key, value in palette.items()
+        }
+        nearest = min(deltas, key=deltas.get)
+        assert save_path == (nearest if deltas[nearest] <= threshold else "fallback")
+
+
+def _nearest_cluster(color) -> tuple:
+    return min(CLUSTERS, key=lambda cluster: np.abs(np.subtract(cluster, color)).max())
+
+
+@pytest.mark.parametrize("batch_size", [64, 4096])
+def test_kmeans_finds_clusters(batch_size):
+    points = np.array(_clustered(1000), dtype=float)
+
+    centers = kmeans(points, 3, batch_size=batch_size)
+
+    for cluster in CLUSTERS:
+        assert np.min(np.abs(centers - cluster).max(axis=1)) < 3
+    assert np.array_equal(centers, kmeans(points, 3, batch_size=batch_size))
+
+
+def test_discover_palette():
+    options = grouping.discover_palette(_clustered(300), 3, "groups", seed=1)
+
+    # Named after their hex values, dark to bright.
+    assert list(options) == [
+        join("groups", "".join(f"{value:02x}" for value in color))
+        for color in options.values()
+    ]
+    assert [_nearest_cluster(color) for color in options.values()] == CLUSTERS
+
+
+def test_discover_palette_merges_equal_groups():
+    colors = [CLUSTERS[0]] * 20 + [CLUSTERS[1]] * 20
+
+    options = grouping.discover_palette(colors, 3)
+
+    assert sorted(options.values()) == sorted(list(color) for color in CLUSTERS[:2])
+
+
+def test_auto(tmp_path, capsys):
+    for idx, color in enumerate(CLUSTERS * 2):
+        Image.new("RGB", (16, 16), color).save(join(tmp_path, f"{idx}.png"))
+    json_path = join(tmp_path, "options.json")
+    auto_root = join(tmp_path, "groups")
+
+    grouping.main(str(tmp_path), json_path, auto=3, auto_root=auto_root, seed=2)
+
+    assert f"Saved 3 groups to {json_path}" in capsys.readouterr().out
+    with open(json_path, "r", encoding="utf-8") as file:
+        palette = json.load(file)
+    assert sorted(map(tuple, palette.values())) == sorted(CLUSTERS)
+    for folder in palette:
+        assert len(listdir(folder)) == 2
+
+
+def test_auto_dry_run(tmp_path):
+    for idx, color in enumerate(CLUSTERS):
+        Image.new("RGB", (16, 16), color).save(join(tmp_path, f"{idx}.png"))
+    json_path = join(tmp_path, "options.json")
+
+    grouping.main(
+        str(tmp_path),
+        json_path,
+        auto=2,
+        auto_root=join(tmp_path, "groups"),
+        dry_run=True,
+    )
+
+    # The json is still written, the files aren't placed.
+    with open(json_path, "r", encoding="utf-8") as file:
+        assert len(json.load(file)) == 2
+    assert "groups" not in listdir(tmp_path)
+
+
+def test_auto_needs_enough_images(tmp_path, capsys):
+    Image.new("RGB", (16, 16), CLUSTERS[0]).save(join(tmp_path, "0.png"))
+
+    with pytest.raises(SystemExit):
+        grouping.main(str(tmp_path), join(tmp_path, "options.json"), auto=2)
+
+    assert "Can't find 2 groups in 1 images." in capsys.readouterr().out
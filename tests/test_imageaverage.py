@@ -0,0 +1,110 @@
+"""
+Tests of imageaverage.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import pytest
+from PIL import Image
+
+from imageaverage.main import (
+    FAST_MAX_ERROR,
+    FAST_MAX_PIXELS,
+    average_colors,
+    cli,
+    get_average_color,
+)
+from shared.cache import ColorCache
+
+
+@pytest.mark.parametrize(
+    "name,mode",
+    [("cover.jpg", "RGB"), ("wallpaper.png", "RGB"), ("palette.png", "P")],
+)
+@pytest.mark.parametrize("size", [(640, 640), (1921, 1083), (3840, 2160)])
+def test_fast_within_max_error(make_image, name, mode, size):
+    image_path = make_image(name, size, mode)
+
+    exact = get_average_color(image_path)
+    fast = get_average_color(image_path, max_pixels=FAST_MAX_PIXELS)
+
+    assert max(abs(a - b) for a, b in zip(exact, fast)) <= FAST_MAX_ERROR
+
+
+@pytest.mark.parametrize("mode", ["1", "P", "LA", "RGBA"])
+def test_fast_handles_modes(make_image, mode):
+    image_path = make_image("image.png", (1200, 900), mode)
+
+    exact = get_average_color(image_path)
+    fast = get_average_color(image_path, max_pixels=FAST_MAX_PIXELS)
+
+    assert max(abs(a - b) for a, b in zip(exact, fast)) <= FAST_MAX_ERROR
+
+
+@pytest.mark.parametrize("extension", ["png", "jpg"])
+@pytest.mark.parametrize("size", [(300, 20000), (20000, 301), (1001, 9001)])
+@pytest.mark.parametrize("edge", [1, 3, 7])
+def test_fast_edge_strips(tmp_path, extension, size, edge):
+    # The partial blocks of the last column / row only hold the bright edge.
+    width, height = size
+    img = Image.new("RGB", size)
+    img.paste((255, 255, 255), (width - edge, 0, width, height))
+    img.paste((255, 255, 255), (0, height - edge, width, height))
+    image_path = str(tmp_path / f"edge.{extension}")
+    img.save(image_path)
+
+    exact = get_average_color(image_path)
+    fast = get_average_color(image_path, max_pixels=FAST_MAX_PIXELS)
+
+    assert max(abs(a - b) for a, b in zip(exact, fast)) <= FAST_MAX_ERROR
+
+
+def test_jobs_cli_reports_overhead(make_image, tmp_path, capsys):
+    for idx in range(4):
+        make_image(f"{idx}.png", (64, 48), seed=idx)
+
+    cli([str(tmp_path), "-r", "-j", "2", "--no-cache", "--sort"])
+
+    captured = capsys.readouterr()
+    assert len(captured.out.splitlines()) == 4
+    assert "Averaged 4 images with 2 processes" in captured.err
+
+
+@pytest.mark.parametrize("threads", [False, True])
+def test_jobs_keep_order(make_image, capsys, threads):
+    image_paths = [make_image(f"{idx}.png", (64, 48), seed=idx) for idx in range(9)]
+
+    colors = average_colors(image_paths, 2, threads=threads)
+
+    assert colors == [get_average_color(image_path) for image_path in image_paths]
+    assert (
+        f"Averaged 9 images with 2 {'threads' if threads else 'processes'}"
+        in capsys.readouterr().err
+    )
+
+
+def test_jobs_with_cached_colors(make_image, tmp_path, capsys):
+    image_paths = [make_image(f"{idx}.png", (64, 48), seed=idx) for idx in range(9)]
+    expected = [get_average_color(image_path) for image_path in image_paths]
+
+    with ColorCache(str(tmp_path / "colors.sqlite")) as cache:
+        # Hits first, in between and last.
+        for idx in (0, 4, 5, 8):
+            cache.put(image_paths[idx], expected[idx])
+
+        colors = average_colors(image_paths, 2, threads=True, cache=cache)
+
+        assert colors == expected
+        assert "Averaged 5 images" in capsys.readouterr().err
+
+        # All cached now, so there's no pool to report on.
+        assert average_colors(image_paths, 2, threads=True, cache=cache) == expected
+        assert capsys.readouterr().err == ""
+
+
+def test_jobs_no_warnings(make_image, capsys):
+    image_paths = [make_image(f"{idx}.png", (64, 48), seed=idx) for idx in range(3)]
+
+    average_colors(image_paths, 2, threads=True, no_warnings=True)
+
+    assert capsys.readouterr().err == ""
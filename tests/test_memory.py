@@ -0,0 +1,54 @@
+"""
+Tests of the memory budget helpers.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import argparse
+
+import pytest
+from PIL import Image
+
+from shared import memory
+
+
+@pytest.mark.parametrize("rows", [1, 7, 97, 500])
+def test_strips_cover_image(rows):
+    img = Image.new("RGB", (13, 97))
+    boxes = list(memory.strips(img, rows))
+
+    assert boxes[0][1] == 0 and boxes[-1][3] == 97
+    assert all(box[3] == following[1] for box, following in zip(boxes, boxes[1:]))
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("512", 512),
+        ("4K", 4096),
+        ("512M", 512 << 20),
+        ("1.5g", 3 << 29),
+        ("2GiB", 2 << 30),
+    ],
+)
+def test_parse_size(value, expected):
+    assert memory.parse_size(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "0", "-1M", "12T", "M"])
+def test_parse_size_invalid(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        memory.parse_size(value)
+
+
+@pytest.mark.parametrize(
+    "max_memory, size",
+    [(1 << 30, (4000, 3000)), (20 << 20, (2000, 1500)), (1, (500, 375))],
+)
+def test_fit_draft(make_image, max_memory, size):
+    with Image.open(make_image("x.jpg", (4000, 3000))) as img:
+        reduced = memory.fit_draft(img, max_memory)
+        img.load()
+
+        assert reduced == (size != (4000, 3000))
+        assert img.size == size
@@ -0,0 +1,125 @@
+"""
+Tests of the per-stage timers and counters. (shared.metrics, --metrics, --profile)
+"""
+
+# pylint: disable=missing-function-docstring
+
+import json
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+from imageaverage.main import cli as average_cli
+from shared import metrics
+from shared.metrics import METRICS, Metrics
+
+
+def test_disabled_records_nothing():
+    recorder = Metrics()
+
+    with recorder.timer("decode"):
+        recorder.count("images_processed")
+    recorder.add_time("decode", 1.0)
+
+    assert recorder.to_dict() == {"stages": {}, "counters": {}}
+
+
+def test_timers_and_counters():
+    recorder = Metrics(enabled=True)
+
+    for _ in range(3):
+        with recorder.timer("decode"):
+            pass
+    recorder.add_time("write", 0.5)
+    recorder.count("bytes_written", 100)
+    recorder.count("bytes_written", 20)
+
+    data = recorder.to_dict()
+    assert data["stages"]["decode"]["calls"] == 3
+    assert data["stages"]["write"] == {"calls": 1, "seconds": 0.5}
+    assert data["counters"] == {"bytes_written": 120}
+
+    recorder.reset()
+    assert recorder.to_dict() == {"stages": {}, "counters": {}}
+
+
+def test_threads_add_up():
+    recorder = Metrics(enabled=True)
+
+    def work(_):
+        for _ in range(1000):
+            recorder.count("images_processed")
+            recorder.add_time("decode", 0.001)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(work, range(8)))
+
+    data = recorder.to_dict()
+    assert data["counters"]["images_processed"] == 8000
+    assert data["stages"]["decode"]["calls"] == 8000
+
+
+def test_prometheus():
+    recorder = Metrics(enabled=True)
+    recorder.add_time("decode", 0.25)
+    recorder.count("downloads", 2)
+
+    lines = recorder.to_prometheus().splitlines()
+
+    assert 'walltune_stage_seconds_total{stage="decode"} 0.25' in lines
+    assert 'walltune_stage_calls_total{stage="decode"} 1' in lines
+    assert "# TYPE walltune_downloads_total counter" in lines
+    assert "walltune_downloads_total 2" in lines
+
+
+def test_instrumented_writes_json_and_prom(tmp_path):
+    for name in ("metrics.json", "metrics.prom"):
+        metrics_path = join(tmp_path, name)
+
+        with metrics.instrumented(metrics_path):
+            METRICS.count("images_processed")
+
+        assert not METRICS.enabled
+        with open(metrics_path, "r", encoding="utf-8") as file:
+            if name.endswith(".json"):
+                data = json.load(file)
+                # Every run starts from scratch.
+                assert data["counters"] == {"images_processed": 1}
+                assert data["stages"]["total"]["calls"] == 1
+            else:
+                assert "walltune_images_processed_total 1" in file.read()
+
+
+def test_instrumented_profile(tmp_path, capsys):
+    stats_path = join(tmp_path, "run.pstats")
+
+    with metrics.instrumented(profile=stats_path):
+        sorted(range(1000), key=lambda x: -x)
+    assert pstats.Stats(stats_path).total_calls > 0
+
+    with metrics.instrumented(profile="-"):
+        sorted(range(1000), key=lambda x: -x)
+    assert "function calls" in capsys.readouterr().err
+
+
+def test_cli_metrics(make_image, tmp_path):
+    for idx in range(3):
+        make_image(f"{idx}.png", (64, 48), seed=idx)
+    metrics_path = join(tmp_path, "metrics.json")
+
+    average_cli([str(tmp_path), "-r", "--no-cache", "--metrics", metrics_path])
+
+    with open(metrics_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    assert data["counters"]["images_processed"] == 3
+    assert data["stages"]["decode"]["calls"] == 3
+    assert data["stages"]["total"]["calls"] == 1
+
+
+def test_cli_without_metrics(make_image, tmp_path):
+    make_image("0.png", (64, 48))
+    METRICS.reset()
+
+    average_cli([str(tmp_path), "-r", "--no-cache"])
+
+    assert not METRICS.enabled and METRICS.to_dict()["counters"] == {}
@@ -0,0 +1,126 @@
+"""
+Tests of the pipeline, with the Spotify API and the downloads replaced by local covers.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import json
+from io import BytesIO
+from os import listdir, stat
+from os.path import join
+
+import pytest
+from PIL import Image
+
+from pipeline import main as pipeline
+
+
+def _track(name: str, album: str, url: str) -> dict:
+    return {
+        "track": {
+            "id": f"{name}-{url}",
+            "uri": "",
+            "name": name,
+            "artists": [{"name": "Artist"}],
+            "album": {"name": album, "images": [{"url": url}]},
+        }
+    }
+
+
+@pytest.fixture(name="run")
+def fixture_run(tmp_path, monkeypatch):
+    """
+    Returns a function running the pipeline on the tracks, every url being a cover of the
+    given color. Returns the downloaded urls.
+    """
+    downloaded = []
+
+    def cover(url: str) -> bytes:
+        if url.endswith("missing"):
+            raise OSError(f"404 {url}")
+        downloaded.append(url)
+        buffer = BytesIO()
+        Image.new("RGB", (64, 64), tuple(json.loads(url.split("/")[-1]))).save(
+            buffer, "JPEG"
+        )
+        return buffer.getvalue()
+
+    json_path = join(tmp_path, "palette.json")
+    with open(json_path, "w", encoding="utf-8") as file:
+        json.dump(
+            {join(tmp_path, "dark"): [0, 0, 0], join(tmp_path, "light"): [255] * 3},
+            file,
+        )
+
+    monkeypatch.setattr(pipeline, "get_client", lambda: None)
+    monkeypatch.setattr(pipeline, "fetch", lambda _, url: cover(url))
+
+    def start(tracks: list, **kwargs) -> list:
+        monkeypatch.setattr(pipeline, "fetch_tracks", lambda *_, **__: tracks)
+        pipeline.main(json_path, None, 0, "", **kwargs)
+        return downloaded
+
+    return start
+
+
+def test_shared_and_same_name_covers(run, tmp_path):
+    tracks = [
+        _track("Song", "Album A", "https://i.scdn.co/image/[10,10,10]"),
+        _track("Song", "Album B", "https://i.scdn.co/image/[250,250,250]"),
+        _track("Other", "Album A", "https://i.scdn.co/image/[10,10,10]"),
+    ]
+
+    downloaded = run(tracks)
+
+    assert sorted(downloaded) == sorted(
+        {track["track"]["album"]["images"][0]["url"] for track in tracks}
+    )
+    dark = sorted(listdir(join(tmp_path, "dark")))
+    light = listdir(join(tmp_path, "light"))
+    assert len(dark) == 2 and len(light) == 1
+    # Linked, not processed twice.
+    assert (
+        stat(join(tmp_path, "dark", dark[0])).st_ino
+        == stat(join(tmp_path, "dark", dark[1])).st_ino
+    )
+
+
+def test_dedupe(run, tmp_path):
+    tracks = [
+        _track("Song", "Album A", "https://i.scdn.co/image/[10,10,10]"),
+        _track("Other", "Album A", "https://i.scdn.co/image/[10,10,10]"),
+    ]
+
+    run(tracks, dedupe=True)
+
+    assert len(listdir(join(tmp_path, "dark"))) == 1
+
+
+def test_failed_covers(run, tmp_path, capsys):
+    tracks = [
+        _track("Song", "Album A", "https://i.scdn.co/image/[10,10,10]"),
+        _track("Gone", "Album B", "https://i.scdn.co/image/missing"),
+    ]
+
+    # Modified covers are re-encoded, unmodified ones written as downloaded.
+    run(tracks, condition=5, mod=2)
+
+    assert "Total fetched: 1" in capsys.readouterr().out
+    assert listdir(join(tmp_path, "dark")) == ["Song_albumCover.jpg"]
+    with Image.open(join(tmp_path, "dark", "Song_albumCover.jpg")) as img:
+        assert img.format == "JPEG" and img.getpixel((0, 0))[0] > 15
+
+
+def test_runs_keep_earlier_covers(run, tmp_path):
+    first = [_track("Song", "Album A", "https://i.scdn.co/image/[10,10,10]")]
+    second = [_track("Song", "Album B", "https://i.scdn.co/image/[20,20,20]")]
+
+    run(first)
+    run(second)
+    assert len(listdir(join(tmp_path, "dark"))) == 2
+
+    # Both are there already, also if adjusted the same way again.
+    run(first, condition=5, mod=2)
+    run(first, condition=5, mod=2)
+    run(second)
+    assert len(listdir(join(tmp_path, "dark"))) == 3
@@ -0,0 +1,108 @@
+"""
+Tests of placing grouped files. (shared.folders, grouping.plan)
+"""
+
+# pylint: disable=missing-function-docstring
+
+from os import listdir, makedirs, stat
+from os.path import exists, join
+
+import pytest
+
+from grouping import plan as grouping_plan
+from shared import folders
+
+
+def _write(path: str, data: bytes = b"cover") -> str:
+    with open(path, "wb") as file:
+        file.write(data)
+    return path
+
+
+@pytest.mark.parametrize("mode", folders.COPY_MODES)
+def test_place_file(tmp_path, mode):
+    src = _write(join(tmp_path, "a.jpg"))
+    dst = _write(join(tmp_path, "b.jpg"), b"old")
+
+    folders.place_file(src, dst, mode)
+
+    with open(dst, "rb") as file:
+        assert file.read() == b"cover"
+    assert sorted(listdir(tmp_path)) == ["a.jpg", "b.jpg"]
+
+
+@pytest.mark.parametrize("mode", folders.COPY_MODES)
+def test_place_file_again(tmp_path, mode):
+    src = _write(join(tmp_path, "a.jpg"))
+    makedirs(join(tmp_path, "out"))
+    dst = join(tmp_path, "out", "a.jpg")
+
+    folders.place_file(src, dst, mode)
+    folders.place_file(src, dst, mode)
+
+    assert listdir(join(tmp_path, "out")) == ["a.jpg"]
+    if mode == "hardlink":
+        assert stat(src).st_ino == stat(dst).st_ino
+
+
+def test_move_onto_hardlink(tmp_path):
+    src = _write(join(tmp_path, "a.jpg"))
+    dst = join(tmp_path, "b.jpg")
+    folders.link_or_copy(src, dst)
+
+    folders.move_file(src, dst)
+
+    assert listdir(tmp_path) == ["b.jpg"]
+
+
+def _plan(tmp_path, count: int = 3) -> list:
+    makedirs(join(tmp_path, "in"))
+    return [
+        grouping_plan.Placement(
+            _write(join(tmp_path, "in", f"{idx}.jpg"), bytes([idx])),
+            join(tmp_path, "out", str(idx % 2), f"{idx}.jpg"),
+            (idx, idx, idx),
+        )
+        for idx in range(count)
+    ]
+
+
+def test_dry_run(tmp_path, capsys):
+    plan = _plan(tmp_path)
+
+    grouping_plan.print_plan(plan, "move")
+
+    assert "Would move 3 files into 2 directories (2 new)." in capsys.readouterr().out
+    assert not exists(join(tmp_path, "out"))
+
+
+@pytest.mark.parametrize("move", [False, True])
+def test_execute(tmp_path, move):
+    plan = _plan(tmp_path)
+    grouping_plan.create_directories(plan)
+
+    done = list(grouping_plan.execute(plan, move, "copy"))
+
+    assert done == plan
+    for placement in plan:
+        assert exists(placement.dst)
+        assert exists(placement.src) != move
+
+
+def test_resume_journal(tmp_path):
+    plan = _plan(tmp_path)
+    grouping_plan.create_directories(plan)
+    journal_path = join(tmp_path, "plan.journal")
+
+    # Interrupted after the first move.
+    placements = grouping_plan.execute(plan, True, journal_path=journal_path)
+    next(placements)
+    placements.close()
+    assert exists(journal_path)
+
+    left = grouping_plan.load_journal(journal_path)
+    assert left == plan[1:]
+
+    assert list(grouping_plan.execute(left, True, journal_path=journal_path)) == left
+    assert not exists(journal_path)
+    assert listdir(join(tmp_path, "in")) == []
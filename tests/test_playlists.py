@@ -0,0 +1,122 @@
+"""
+Tests of the playlist index resolving playlist names to ids.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import json
+from os.path import join
+from types import SimpleNamespace
+
+import pytest
+
+from spotify_api import main as fetch
+from spotify_api import playlists
+
+
+def _library(names: list, calls: list) -> SimpleNamespace:
+    """
+    A client answering current_user_playlists with pages of playlists of the names (None for
+    playlists Spotify can't show), recording the offset of every call.
+    """
+    items = [
+        None if name is None else {"name": name, "id": f"id{idx}"}
+        for idx, name in enumerate(names)
+    ]
+
+    def current_user_playlists(limit, offset):
+        calls.append(offset)
+        return {"total": len(items), "items": items[offset : offset + limit]}
+
+    return SimpleNamespace(current_user_playlists=current_user_playlists)
+
+
+@pytest.fixture(name="index_path")
+def fixture_index_path(tmp_path):
+    return join(tmp_path, "cache", "playlists.json")
+
+
+def test_fetch_index():
+    calls = []
+    names = [f"Playlist {idx}" for idx in range(120)]
+    names[7] = None
+    names[80] = "Playlist 3"
+
+    index = playlists.fetch_index(_library(names, calls), concurrency=2)
+
+    assert sorted(calls) == [0, 50, 100]
+    assert len(index["playlists"]) == 118
+    # The first one of a name is kept.
+    assert index["playlists"]["Playlist 3"] == "id3"
+
+
+def test_resolve_uses_fresh_index(index_path):
+    calls = []
+    client = _library(["Chill", "Workout"], calls)
+
+    assert playlists.resolve(client, "Workout", index_path=index_path) == "id1"
+    assert playlists.resolve(client, "Chill", index_path=index_path) == "id0"
+
+    assert calls == [0]
+
+
+def test_resolve_refetches_outdated_index(index_path):
+    calls = []
+    client = _library(["Chill"], calls)
+
+    playlists.resolve(client, "Chill", index_path=index_path)
+    playlists.resolve(client, "Chill", index_path=index_path, ttl=0)
+
+    assert calls == [0, 0]
+
+
+def test_resolve_refetches_on_miss(index_path):
+    calls = []
+    playlists.resolve(_library(["Chill"], calls), "Chill", index_path=index_path)
+
+    # A playlist made since.
+    assert (
+        playlists.resolve(
+            _library(["Chill", "New"], calls), "New", index_path=index_path
+        )
+        == "id1"
+    )
+    assert (
+        playlists.resolve(
+            _library(["Chill", "New"], calls), "Gone", index_path=index_path
+        )
+        is None
+    )
+    assert calls == [0, 0, 0]
+
+
+def test_resolve_read_only_cache(tmp_path):
+    # A file where the cache dir would be.
+    with open(join(tmp_path, "cache"), "w", encoding="utf-8") as file:
+        file.write("")
+    index_path = join(tmp_path, "cache", "playlists.json")
+
+    assert playlists.resolve(_library(["Chill"], []), "Chill", index_path=index_path)
+
+
+def test_load_broken_index(index_path, tmp_path):
+    broken_path = join(tmp_path, "broken.json")
+    with open(broken_path, "w", encoding="utf-8") as file:
+        file.write("{")
+
+    for path in (index_path, broken_path):
+        assert playlists.load_index(path) == {"fetched_at": 0, "playlists": {}}
+
+
+def test_saved_index(index_path):
+    playlists.resolve(_library(["Chill"], []), "Chill", index_path=index_path)
+
+    with open(index_path, "r", encoding="utf-8") as file:
+        assert json.load(file)["playlists"] == {"Chill": "id0"}
+
+
+def test_unknown_playlist_exits(index_path, capsys):
+    with pytest.raises(SystemExit):
+        fetch.get_playlist_id(_library(["Chill"], []), "Gone", index_path=index_path)
+
+    assert "Couldn't find requested playlist." in capsys.readouterr().out
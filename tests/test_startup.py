@@ -0,0 +1,90 @@
+"""
+Tests that the entry points only import their heavy dependencies when they need them.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import subprocess
+import sys
+from os.path import abspath, dirname, join
+
+import pytest
+
+ROOT = abspath(join(dirname(__file__), ".."))
+
+HEAVY = (
+    "numpy",
+    "PIL",
+    "spotipy",
+    "requests",
+    "dotenv",
+    "pyciede2000",
+    "cProfile",
+    "pstats",
+)
+
+
+def _imported(code: str) -> set:
+    """
+    Returns the heavy modules imported after running code in a fresh interpreter.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys\n{code}\nprint(' '.join(sys.modules))",
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split()) & set(HEAVY)
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "walltune",
+        "imageaverage.main",
+        "adjustbrightness.main",
+        "grouping.main",
+        "spotify_api.main",
+        "spotify_api.current",
+        "pipeline.main",
+        "daemon.client",
+        "shared.metrics",
+    ],
+)
+def test_import_is_light(module):
+    assert _imported(f"import {module}") == set()
+
+
+def test_instrumented_without_profile():
+    code = "\n".join(
+        [
+            "from shared import metrics",
+            "with metrics.instrumented():",
+            "    pass",
+        ]
+    )
+    assert _imported(code) == set()
+
+
+@pytest.mark.parametrize(
+    "command", ["average", "brightness", "group", "fetch", "pipeline"]
+)
+def test_help_is_light(command):
+    code = "\n".join(
+        [
+            "from contextlib import redirect_stdout",
+            "from io import StringIO",
+            "import walltune",
+            "with redirect_stdout(StringIO()):",
+            "    try:",
+            f"        walltune.cli([{command!r}, '--help'])",
+            "    except SystemExit:",
+            "        pass",
+        ]
+    )
+    assert _imported(code) == set()
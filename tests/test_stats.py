@@ -0,0 +1,28 @@
+"""
+Tests of the histogram statistics.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from shared.stats import image_stats
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "LA", "P", "CMYK", "YCbCr"])
+@pytest.mark.parametrize("strip_rows", [None, 16])
+def test_stats_match_numpy(make_image, mode, strip_rows):
+    with Image.open(make_image("x.png", (211, 97))) as img:
+        img = img.convert(mode)
+    pixels = np.asarray(img.convert("RGB"), dtype=np.float64).reshape(-1, 3)
+
+    stats = image_stats(img, linear=True, strip_rows=strip_rows)
+
+    assert stats.pixels == len(pixels)
+    np.testing.assert_allclose(stats.mean, pixels.mean(axis=0))
+    assert stats.minimum == tuple(pixels.min(axis=0))
+    assert stats.maximum == tuple(pixels.max(axis=0))
+    assert abs(stats.luma - np.asarray(img.convert("L")).mean()) < 0.5
+    assert stats.average == tuple(round(value) for value in pixels.mean(axis=0))
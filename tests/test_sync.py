@@ -0,0 +1,147 @@
+"""
+Tests of the incremental sync of the liked songs, with the Spotify API replaced by local
+tracks and the covers served by a local HTTP server.
+"""
+
+# pylint: disable=missing-function-docstring
+
+import json
+from os import makedirs
+from os.path import exists, join
+
+import pytest
+
+from benchmarks.mock_spotify import FakeSpotify, serve_directory
+from spotify_api import main as fetch
+from spotify_api.sync import SYNC_MANIFEST, fetch_new_tracks, needs_download
+
+
+@pytest.fixture(name="base_url")
+def fixture_base_url(tmp_path):
+    """
+    Serves the covers 0.jpg to 9.jpg, yielding the base url.
+    """
+    directory = join(tmp_path, "covers")
+    makedirs(directory)
+    for idx in range(10):
+        with open(join(directory, f"{idx}.jpg"), "wb") as file:
+            file.write(bytes([idx]) * 100)
+
+    with serve_directory(directory) as base_url:
+        yield base_url
+
+
+def _added_at(idx: int) -> str:
+    return f"2024-01-01T00:{idx // 60:02}:{idx % 60:02}Z"
+
+
+def _liked(base_url: str, *indices: int) -> list:
+    """
+    Liked songs, newest first. Song i was liked at second i and has the cover i.jpg.
+    """
+    return [
+        {
+            "added_at": _added_at(idx),
+            "track": {
+                "id": f"track{idx}",
+                "uri": f"spotify:track:track{idx}",
+                "name": f"Song {idx}",
+                "artists": [{"name": "Artist"}],
+                "album": {
+                    "name": f"Album {idx}",
+                    "images": [{"url": f"{base_url}/{idx}.jpg"}],
+                },
+            },
+        }
+        for idx in sorted(indices, reverse=True)
+    ]
+
+
+def _sync(monkeypatch, save_path: str, tracks: list, amount: int = None) -> dict:
+    monkeypatch.setattr(fetch, "get_client", FakeSpotify(tracks))
+    fetch.main(save_path, amount, 0, False, "", sync=True)
+    with open(join(save_path, SYNC_MANIFEST), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_fetch_new_tracks_stops_at_last_sync():
+    client = FakeSpotify(_liked("", *range(200)))
+
+    tracks = fetch_new_tracks(client, _added_at(150), 20)
+
+    assert [track["track"]["id"] for track in tracks] == [
+        f"track{idx}" for idx in range(199, 150, -1)
+    ]
+    # The first older song ends the paging.
+    assert client.calls == 1
+
+
+def test_fetch_new_tracks_first_sync():
+    client = FakeSpotify(_liked("", *range(200)))
+
+    assert len(fetch_new_tracks(client, None, 70)) == 70
+    assert client.calls == 2
+
+
+def test_needs_download():
+    manifest = {"tracks": {"track1": {"url": "a", "file": "Song_albumCover.jpg"}}}
+
+    assert not needs_download(manifest, "track1", "a")
+    assert needs_download(manifest, "track1", "b")
+    assert needs_download(manifest, "track2", "a")
+
+
+def test_sync_only_new_songs(base_url, tmp_path, monkeypatch, capsys):
+    save_path = join(tmp_path, "out")
+
+    manifest = _sync(monkeypatch, save_path, _liked(base_url, 1, 2, 3), 2)
+    assert "Total fetched: 2" in capsys.readouterr().out
+    assert manifest["last_added_at"] == _added_at(3)
+    assert sorted(manifest["tracks"]) == ["track2", "track3"]
+    assert exists(manifest["tracks"]["track3"]["file"])
+
+    manifest = _sync(monkeypatch, save_path, _liked(base_url, 1, 2, 3, 4, 5))
+    assert "Total fetched: 2" in capsys.readouterr().out
+    assert manifest["last_added_at"] == _added_at(5)
+    assert sorted(manifest["tracks"]) == ["track2", "track3", "track4", "track5"]
+
+    _sync(monkeypatch, save_path, _liked(base_url, 1, 2, 3, 4, 5))
+    assert "Total fetched: 0" in capsys.readouterr().out
+
+
+def test_sync_retries_failed_songs(base_url, tmp_path, monkeypatch, capsys):
+    save_path = join(tmp_path, "out")
+    _sync(monkeypatch, save_path, _liked(base_url, 1))
+    tracks = _liked(base_url, 1, 2, 3)
+    tracks[0]["track"]["album"]["images"][0]["url"] = f"{base_url}/missing.jpg"
+
+    manifest = _sync(monkeypatch, save_path, tracks)
+
+    # Song 2 is kept, but the sync doesn't move past the failed song 3.
+    assert "Couldn't download" in capsys.readouterr().out
+    assert manifest["last_added_at"] == _added_at(1)
+    assert sorted(manifest["tracks"]) == ["track1", "track2"]
+
+    manifest = _sync(monkeypatch, save_path, _liked(base_url, 1, 2, 3))
+    assert manifest["last_added_at"] == _added_at(3)
+    assert sorted(manifest["tracks"]) == ["track1", "track2", "track3"]
+
+
+def test_sync_dedupe_maps_songs_to_covers(base_url, tmp_path, monkeypatch):
+    save_path = join(tmp_path, "out")
+    tracks = _liked(base_url, 1, 2)
+    # Same album, same cover.
+    tracks[0]["track"]["album"] = tracks[1]["track"]["album"]
+
+    monkeypatch.setattr(fetch, "get_client", FakeSpotify(tracks))
+    fetch.main(save_path, None, 0, False, "", sync=True, dedupe=True)
+
+    with open(join(save_path, SYNC_MANIFEST), "r", encoding="utf-8") as file:
+        entries = json.load(file)["tracks"]
+    assert entries["track1"] == entries["track2"]
+    assert exists(entries["track1"]["file"])
+
+
+def test_sync_not_with_playlists(tmp_path):
+    with pytest.raises(SystemExit):
+        fetch.main(str(tmp_path), None, 0, False, "Playlist", sync=True)
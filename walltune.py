@@ -0,0 +1,69 @@
+"""
+The single entry point of WallTune, dispatching to the CLIs of the tools:
+
+    walltune.py <command> [options of the command]
+
+Only the module of the given command is imported, so every command starts without paying for
+the dependencies of the others. (e.g. average with a cached color never imports NumPy, Pillow
+or spotipy)
+"""
+
+import argparse
+from importlib import import_module
+from sys import argv as sysargv
+
+# command : (module with the cli, description)
+COMMANDS = {
+    "average": ("imageaverage.main", "Gets the average color of images."),
+    "brightness": ("adjustbrightness.main", "Adjusts the brightness of images."),
+    "group": ("grouping.main", "Sorts images into folders by color."),
+    "fetch": ("spotify_api.main", "Downloads the covers of liked songs / a playlist."),
+    "current": ("spotify_api.current", "Downloads the cover of the playing item."),
+    "pipeline": ("pipeline.main", "Fetches, adjusts and groups covers in one process."),
+    "daemon": ("daemon.main", "Runs the daemon keeping the tools loaded."),
+    "client": ("daemon.client", "Sends a command to the daemon."),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the CLI. The arguments after the command are left to it.
+    """
+    # region argparse
+
+    parser = argparse.ArgumentParser(
+        description="WallTune: Spotify covers, average colors and color groups.",
+        usage="<command> [options]",
+        epilog="Commands:\n"
+        + "\n".join(
+            f"  {name:<12}{description}" for name, (_, description) in COMMANDS.items()
+        )
+        + "\n\nRun <command> -h for the options of a command.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    parser.add_argument(
+        "command",
+        metavar="command",
+        choices=COMMANDS,
+        help="The tool to run.",
+    )
+
+    # endregion
+
+    return parser
+
+
+def cli(argv: list = None):
+    """
+    Runs the CLI with the given arguments. (Default: sys.argv)
+    """
+    argv = sysargv[1:] if argv is None else argv
+    # Only the command itself is parsed here, so -h after it reaches the command.
+    args = build_parser().parse_args(argv[:1])
+
+    import_module(COMMANDS[args.command][0]).cli(argv[1:])
+
+
+if __name__ == "__main__":
+    cli()